@@ -1,7 +1,16 @@
+import sys
+import json
 import math
 import time
 import random
-from game import get_current_player, get_drawn_cards, switch_player, apply_turn, set_drawn_cards, next_states, is_game_over, get_drawn_squirrels, set_drawn_squirrels, state_to_key
+import threading
+from game import BOARD_CURRENT_PLAYER_SHIFT, BOARD_HEALTH_MASK, BOARD_PLAYER_0_DRAWN_RANDOM_SHIFT, BOARD_PLAYER_1_DRAWN_RANDOM_SHIFT, BOARD_PLAYER_DRAWN_RANDOM_MASK, \
+    BOARD_PLAYER_0_DRAWN_SQUIRREL_SHIFT, BOARD_PLAYER_1_DRAWN_SQUIRREL_SHIFT, BOARD_PLAYER_DRAWN_SQUIRREL_MASK, MAX_HEALTH, MIN_HEALTH
+from game import get_current_player, get_drawn_cards, switch_player, apply_turn, set_drawn_cards, next_states, is_game_over, get_drawn_squirrels, set_drawn_squirrels, canonical_next_states, get_health, get_card, get_card_id, get_card_health, count_current_player_cards, CARD_COUNT, \
+    get_card_count, remove_card, place_card, HAND_CARD_COUNT_SHIFT, HAND_CARD_COUNT_MASK, \
+    get_occupancy_4bit, get_hand_card_ids, remove_cards_in_difference, play_card, draw_squirrel, set_card_count, CARD_BLOOD, PLACEMENT_TABLE
+from game import zobrist_hash, zobrist_update_state, zobrist_check, ZOBRIST_DEBUG, memo
+from data import cards
 
 # Constants.
 MAX_DRAWABLE_RANDOM = 10
@@ -11,6 +20,40 @@ CANNOT_DRAW = 0
 CAN_DRAW = 1
 MAX_ITERATIONS = 40
 
+# Reward counted against each node on a path while a thread simulates from its leaf (see ParallelMCTS).
+VIRTUAL_LOSS = 1
+
+# Fraction of the node or memory limit a pruned tree is cut back to (see MCTS.prune).
+PRUNE_TARGET = 0.75
+
+# Move prior weights.
+PRIOR_HEALTH_WEIGHT = 1.0
+PRIOR_CARD_WEIGHT = 0.5
+PRIOR_BOARD_WEIGHT = 0.1
+PRIOR_SCALE = 2.0
+
+# Linear value function features, in weight order (see value_features and value.py).
+VALUE_FEATURES = ("bias", "health_lead", "attack", "card_health", "cards", "hand", "random_draws", "squirrel_draws",
+                  "other_attack", "other_card_health", "other_cards", "other_hand", "other_random_draws", "other_squirrel_draws")
+HEALTH_MIDPOINT = (MAX_HEALTH + MIN_HEALTH) / 2
+
+# Move code layout (see encode_move).
+MOVE_NO_DRAW = 0
+MOVE_RANDOM_DRAW = 1
+MOVE_SQUIRREL_DRAW = 2
+MOVE_DRAW_MASK = 0b11
+MOVE_SACRIFICE_SHIFT = 2
+MOVE_PLACEMENT_SHIFT = 6
+MOVE_EXTRA_SHIFT = 22
+MAX_PACKED_MOVE = (1 << 64) - 1  # Move codes are stored as uint64 by record.py, remote.py and snapshot.py.
+
+# Turn decomposition phases (see turn_actions).
+PHASE_DRAW = 0
+PHASE_PLAY = 1
+PHASE_SACRIFICE = 2
+PHASE_LANE = 3
+END_TURN = 0
+
 
 def set_drawn_and_apply_state(state, current_player_state, current_hand, random_draw, squirrel_draw):
     """
@@ -73,85 +116,766 @@ def get_draw_id_and_squirrel_drawable(state):
     return draw_id, squirrel_drawable
 
 
-def run_mcts(state, search_time=13, exploration_constant=1.5):
+def health_swing(state, next_state):
+    """Returns how far the move from state to next_state tipped the health scale
+       in favour of the player who made it (positive is good for the mover)."""
+    swing = get_health(state["board_state"]) - get_health(next_state["board_state"])
+    return swing if get_current_player(state["board_state"]) == 0 else -swing
+
+
+def board_value(player_state):
+    """Returns the sum of attack and current health of every card on a player state."""
+    value = 0
+    for card_index in range(CARD_COUNT):
+        card_id = get_card_id(player_state, card_index)
+        if card_id:
+            value += cards[card_id][0] + get_card_health(player_state, card_index)
+    return value
+
+
+def move_prior(state, next_state):
+    """
+    Returns a cheap heuristic prior between 0 and 1 for the move from state to next_state,
+    relative to the player who made it.
+
+    The prior combines the health swing caused by apply_turn, the difference between cards lost
+    by the opponent and by the mover (sacrifices included), and the board value difference after
+    the move, then squashes the weighted sum with a logistic function.
+    """
+    own_lost = count_current_player_cards(state["current_player_state"]) - count_current_player_cards(next_state["other_player_state"])
+    other_lost = count_current_player_cards(state["other_player_state"]) - count_current_player_cards(next_state["current_player_state"])
+    value_difference = board_value(next_state["other_player_state"]) - board_value(next_state["current_player_state"])
+    score = (PRIOR_HEALTH_WEIGHT * health_swing(state, next_state)
+             + PRIOR_CARD_WEIGHT * (other_lost - own_lost)
+             + PRIOR_BOARD_WEIGHT * value_difference)
+    return 1 / (1 + math.exp(-score / PRIOR_SCALE))
+
+
+def row_features(player_state):
+    """Returns the total attack, total current health and number of the cards on a player state."""
+    attack = 0
+    health = 0
+    count = 0
+    for card_index in range(CARD_COUNT):
+        card_id = get_card_id(player_state, card_index)
+        if card_id:
+            attack += cards[card_id][0]
+            health += get_card_health(player_state, card_index)
+            count += 1
+    return attack, health, count
+
+
+def hand_size(hand):
+    """Returns the number of cards in a hand."""
+    return sum(get_card_count(hand, card_id) for card_id in get_hand_card_ids(hand))
+
+
+def value_features(board_state, player_state, hand, other_player_state, other_player_hand):
+    """
+    Returns the VALUE_FEATURES of a position for the player to move, scaled to roughly -1 to 1: the
+    health scale lead, the attack, health and number of cards on each board, each hand size, and the 
+    random cards and squirrels each player can still draw.
+    """
+    player = get_current_player(board_state)
+    other = 1 - player
+    # Player 0 pushes the scale down towards MIN_HEALTH, player 1 up towards MAX_HEALTH.
+    lead = (HEALTH_MIDPOINT - get_health(board_state)) / (HEALTH_MIDPOINT - MIN_HEALTH)
+    attack, health, count = row_features(player_state)
+    other_attack, other_health, other_count = row_features(other_player_state)
+    return (
+        1.0,
+        lead if player == 0 else -lead,
+        attack / 10, health / 10, count / CARD_COUNT, hand_size(hand) / 10,
+        (MAX_DRAWABLE_RANDOM - get_drawn_cards(board_state, player)) / MAX_DRAWABLE_RANDOM,
+        (MAX_DRAWABLE_SQUIRRELS - get_drawn_squirrels(board_state, player)) / MAX_DRAWABLE_SQUIRRELS,
+        other_attack / 10, other_health / 10, other_count / CARD_COUNT, hand_size(other_player_hand) / 10,
+        (MAX_DRAWABLE_RANDOM - get_drawn_cards(board_state, other)) / MAX_DRAWABLE_RANDOM,
+        (MAX_DRAWABLE_SQUIRRELS - get_drawn_squirrels(board_state, other)) / MAX_DRAWABLE_SQUIRRELS,
+    )
+
+
+def linear_value(weights, features):
+    """Returns the dot product of weights and a list of value features, clamped to -1 (loss) to 1 (win)."""
+    value = sum(weight * feature for weight, feature in zip(weights, features))
+    return max(-1.0, min(1.0, value))
+
+
+def evaluate_value(weights, board_state, player_state, hand, other_player_state, other_player_hand):
+    """Returns the linear value estimate of a position for the player to move, clamped to -1 (loss) to 1 (win)."""
+    return linear_value(weights, value_features(board_state, player_state, hand, other_player_state, other_player_hand))
+
+
+def load_value_weights(path):
+    """Loads the weights of the linear value function from a weights file written by value.py,
+       raising a ValueError if the file was trained on different features."""
+    with open(path) as file:
+        data = json.load(file)
+    if tuple(data["features"]) != VALUE_FEATURES:
+        raise ValueError(f"Value weights in {path} do not match the value features")
+    return list(data["weights"])
+
+
+def placement_keys(player, start_state, end_state):
+    """
+    Returns the AMAF action keys for the cards a player placed during a turn, where an action
+    is "card X placed in lane Y" by a given player.
+
+    Parameters:
+        player (int): The player who made the move.
+        start_state (int): The players bitboard state at the start of the turn.
+        end_state (int): The players bitboard state after placing cards (before apply_turn).
+
+    Returns:
+        keys (tuple): One key per placed card in the form player << 6 | card_id << 2 | lane.
+    """
+    keys = ()
+    for lane in range(CARD_COUNT):
+        card = get_card(end_state, lane)
+        if card and card != get_card(start_state, lane):
+            keys += ((player << 6) | (get_card_id(end_state, lane) << 2) | lane,)
+    return keys
+
+
+def encode_move(state, row, next_state):
+    """
+    Returns the compact move code of the move from state to next_state, where row is the current
+    players bitboard state after placing cards (before apply_turn).
+
+    A move code is a small int laid out as:
+        bits 0-1   - draw choice (MOVE_NO_DRAW, MOVE_RANDOM_DRAW or MOVE_SQUIRREL_DRAW)
+        bits 2-5   - sacrifice mask, one bit per lane whose starting card was removed
+        bits 6-21  - 4 bit id of the card placed in each lane (0 = none)
+        bits 22+   - 4 bit ids of any further cards played from the hand and then sacrificed 
+                     during the same turn, in ascending order
+    so most moves fit in 3 bytes. apply_move rebuilds next_state from state and the code. A turn
+    that plays more than 10 further cards needs more than 64 bits, which the packed formats reject
+    (see packed_move).
+    """
+    board_state = state["board_state"]
+    player = get_current_player(board_state)
+    if get_drawn_cards(next_state["board_state"], player) != get_drawn_cards(board_state, player):
+        move, hand = MOVE_RANDOM_DRAW, state["current_player_hand"] + (1 << (get_draw_id_and_squirrel_drawable(state)[0] * HAND_CARD_COUNT_SHIFT))
+    elif get_drawn_squirrels(next_state["board_state"], player) != get_drawn_squirrels(board_state, player):
+        move, hand = MOVE_SQUIRREL_DRAW, state["current_player_hand"] + (1 << HAND_CARD_COUNT_SHIFT)
+    else:
+        move, hand = MOVE_NO_DRAW, state["current_player_hand"]
+    start_row = state["current_player_state"]
+    for lane in range(CARD_COUNT):
+        if get_card(row, lane) != get_card(start_row, lane):
+            if get_card_id(start_row, lane):
+                move |= 1 << (MOVE_SACRIFICE_SHIFT + lane)
+            card_id = get_card_id(row, lane)
+            if card_id:
+                move |= card_id << (MOVE_PLACEMENT_SHIFT + lane * HAND_CARD_COUNT_SHIFT)
+                hand -= 1 << (card_id * HAND_CARD_COUNT_SHIFT)
+    shift = MOVE_EXTRA_SHIFT
+    end_hand = next_state["other_player_hand"]
+    for card_id in range(1, HAND_CARD_COUNT_MASK + 1):
+        for _ in range(get_card_count(hand, card_id) - get_card_count(end_hand, card_id)):
+            move |= card_id << shift
+            shift += HAND_CARD_COUNT_SHIFT
+    return move
+
+
+def packed_move(move):
+    """Returns move if the move code fits the uint64 of the packed formats, else raises a ValueError."""
+    if not 0 <= move <= MAX_PACKED_MOVE:
+        raise ValueError(f"Move code {move:#x} does not fit in 64 bits")
+    return move
+
+
+def apply_move(state, move):
+    """Rebuilds and returns the state reached by playing the move code move (see encode_move) from state."""
+    row = state["current_player_state"]
+    hand = state["current_player_hand"]
+    random_draw = squirrel_draw = CANNOT_DRAW
+    draw = move & MOVE_DRAW_MASK
+    if draw == MOVE_RANDOM_DRAW:
+        random_draw = HAS_BEEN_DRAWN
+        hand += 1 << (get_draw_id_and_squirrel_drawable(state)[0] * HAND_CARD_COUNT_SHIFT)
+    elif draw == MOVE_SQUIRREL_DRAW:
+        squirrel_draw = HAS_BEEN_DRAWN
+        hand += 1 << HAND_CARD_COUNT_SHIFT
+    for lane in range(CARD_COUNT):
+        if (move >> (MOVE_SACRIFICE_SHIFT + lane)) & 1:
+            row = remove_card(row, lane)
+        card_id = (move >> (MOVE_PLACEMENT_SHIFT + lane * HAND_CARD_COUNT_SHIFT)) & HAND_CARD_COUNT_MASK
+        if card_id:
+            row = place_card(row, card_id, lane)
+            hand -= 1 << (card_id * HAND_CARD_COUNT_SHIFT)
+    extra = move >> MOVE_EXTRA_SHIFT
+    while extra:
+        hand -= 1 << ((extra & HAND_CARD_COUNT_MASK) * HAND_CARD_COUNT_SHIFT)
+        extra >>= HAND_CARD_COUNT_SHIFT
+    return set_drawn_and_apply_state(state, row, hand, random_draw, squirrel_draw)
+
+
+class SearchMetrics:
+    """
+    Counters describing the health of one search (or, once merged, of several worker searches).
+
+    Attributes:
+        searches (int): The number of searches merged into these metrics.
+        iterations (int): Completed search iterations.
+        search_time (float): Seconds spent searching, summed over searches.
+        rollout_time (float): Seconds spent in rollouts.
+        expansion_time (float): Seconds spent in the tree (selection, expansion and backpropagation).
+        nodes (int): Tree nodes created, including the root.
+        max_depth (int): Depth of the deepest node reached by an iteration.
+        total_depth (int): Sum over iterations of the depth of the node simulated from.
+        rollouts (int): Rollouts run.
+        rollout_turns (int): Turns played in rollouts.
+        stalemates (int): Rollouts that ended in a stalemate.
+        cache_hits (int): Move generator calls answered from the next_states memo.
+        cache_misses (int): Move generator calls that had to generate moves.
+        tree_bytes (int): Estimated memory held by the final search tree (see tree_memory), 0 for
+                          turn decomposition searches.
+        pruned (int): Tree nodes removed by pruning to stay under a node or memory limit.
+    """
+
+    COUNTERS = ("searches", "iterations", "search_time", "rollout_time", "expansion_time", "nodes", "total_depth",
+                "rollouts", "rollout_turns", "stalemates", "cache_hits", "cache_misses", "tree_bytes", "pruned")
+
+    def __init__(self):
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        self.max_depth = 0
+
+    def record_depth(self, depth):
+        """Records the depth of the node an iteration simulated from."""
+        self.total_depth += depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def merge(self, other):
+        """Adds the counters of another SearchMetrics (e.g. from another worker) into these metrics and returns self."""
+        for name in self.COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.max_depth = max(self.max_depth, other.max_depth)
+        return self
+
+    def as_dict(self):
+        """Returns the counters and the rates derived from them as a JSON serialisable dictionary."""
+        metrics = {name: getattr(self, name) for name in self.COUNTERS}
+        metrics["max_depth"] = self.max_depth
+        metrics["iterations_per_second"] = self.iterations / self.search_time if self.search_time else 0
+        metrics["rollouts_per_second"] = self.rollouts / self.rollout_time if self.rollout_time else 0
+        metrics["average_depth"] = self.total_depth / self.iterations if self.iterations else 0
+        metrics["average_rollout_length"] = self.rollout_turns / self.rollouts if self.rollouts else 0
+        calls = self.cache_hits + self.cache_misses
+        metrics["cache_hit_rate"] = self.cache_hits / calls if calls else 0
+        return metrics
+
+    @classmethod
+    def from_dict(cls, metrics):
+        """Rebuilds a SearchMetrics from the output of as_dict (e.g. as returned by a worker)."""
+        result = cls()
+        for name in cls.COUNTERS:
+            setattr(result, name, metrics[name])
+        result.max_depth = metrics["max_depth"]
+        return result
+
+
+def counted_generator(generate, metrics):
+    """Wraps a move generator so that every call is recorded in metrics as a memo hit or miss. A call 
+       is a miss if it added entries to the memo shared by next_states and canonical_next_states."""
+    def counted(player_state, hand, canDraw, draw_id, squirrel_drawable):
+        size = len(memo)
+        results = generate(player_state, hand, canDraw, draw_id, squirrel_drawable)
+        if len(memo) == size:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+        return results
+    return counted
+
+
+def merge_metrics(worker_metrics):
+    """Merges a list of SearchMetrics.as_dict() results (one per worker) and returns the merged dictionary."""
+    merged = SearchMetrics()
+    for metrics in worker_metrics:
+        merged.merge(SearchMetrics.from_dict(metrics))
+    return merged.as_dict()
+
+
+def write_metrics(path, entry):
+    """Appends entry to the JSONL file at path."""
+    with open(path, "a") as file:
+        file.write(json.dumps(entry) + "\n")
+
+
+def rollout(board_state, current_player_state, current_player_hand, other_player_state, other_player_hand, p0_draws, p1_draws, root_player_id, playout_keys=None, generate=next_states, rng=random, metrics=None):
+    """
+    Plays random moves from the given state until a player wins or the stalemate limit is reached,
+    and returns the reward relative to the root player.
+
+    This is the rollout kernel behind MCTS.simulate. It keeps the whole game in local integers, 
+    applying draws to the board state directly and swapping the current and other player rows 
+    instead of building a new state dictionary per step. It consumes random numbers exactly like 
+    the dictionary based loop, so a given seed produces the same game.
+
+    Parameters:
+        board_state (int): The board bitboard representation.
+        current_player_state, other_player_state (int): The players bitboard state representations.
+        current_player_hand, other_player_hand (int): The players bitboard hand representations.
+        p0_draws, p1_draws (list): The random card draw sequences of each player.
+        root_player_id (int): The root player.
+        playout_keys (list or None): If given, the AMAF keys of every move played are appended to it.
+        generate (function): The move generator, next_states or canonical_next_states.
+        rng (random.Random): The random number generator (defaults to the global random module).
+        metrics (SearchMetrics or None): If given, the rollout, its length and any stalemate are recorded.
+
+    Returns:
+        reward (int): 1 if the root player won, -1 if it lost, 0 on stalemate.
+    """
+    choice = rng.choice
+    iterations = 0
+    turns = 0
+    health = board_state & BOARD_HEALTH_MASK
+    while MIN_HEALTH < health < MAX_HEALTH:
+        current_player = (board_state >> BOARD_CURRENT_PLAYER_SHIFT) & 1
+        if current_player == 0:
+            drawn_shift, squirrel_shift, draws = BOARD_PLAYER_0_DRAWN_RANDOM_SHIFT, BOARD_PLAYER_0_DRAWN_SQUIRREL_SHIFT, p0_draws
+        else:
+            drawn_shift, squirrel_shift, draws = BOARD_PLAYER_1_DRAWN_RANDOM_SHIFT, BOARD_PLAYER_1_DRAWN_SQUIRREL_SHIFT, p1_draws
+        drawn = (board_state >> drawn_shift) & BOARD_PLAYER_DRAWN_RANDOM_MASK
+        drawn_squirrels = (board_state >> squirrel_shift) & BOARD_PLAYER_DRAWN_SQUIRREL_MASK
+        if drawn >= MAX_DRAWABLE_RANDOM and drawn_squirrels >= MAX_DRAWABLE_SQUIRRELS:
+            if iterations == MAX_ITERATIONS:   # stalemate reached
+                if metrics is not None:
+                    metrics.rollouts += 1
+                    metrics.rollout_turns += turns
+                    metrics.stalemates += 1
+                return 0
+            iterations += 1
+
+        draw_id = CANNOT_DRAW if drawn == MAX_DRAWABLE_RANDOM else draws[drawn]
+        squirrel_drawable = CANNOT_DRAW if drawn_squirrels == MAX_DRAWABLE_SQUIRRELS else CAN_DRAW
+        new_state, new_hand, random_draw, squirrel_draw = choice(generate(current_player_state, current_player_hand, True, draw_id, squirrel_drawable))
+        if playout_keys is not None:
+            playout_keys.extend(placement_keys(current_player, current_player_state, new_state))
+
+        if random_draw == HAS_BEEN_DRAWN:
+            board_state += 1 << drawn_shift
+        elif squirrel_draw == HAS_BEEN_DRAWN:
+            board_state += 1 << squirrel_shift
+        new_state, other_player_state, board_state = apply_turn(new_state, other_player_state, board_state)
+        current_player_state, other_player_state = other_player_state, new_state
+        current_player_hand, other_player_hand = other_player_hand, new_hand
+        board_state ^= 1 << BOARD_CURRENT_PLAYER_SHIFT
+        health = board_state & BOARD_HEALTH_MASK
+        turns += 1
+    if metrics is not None:
+        metrics.rollouts += 1
+        metrics.rollout_turns += turns
+    return -1 if (board_state >> BOARD_CURRENT_PLAYER_SHIFT) & 1 == root_player_id else 1
+
+
+def turn_start(state):
+    """
+    Returns the partial turn at the start of the current players turn in state, as a tuple of
+    (board_state, current_player_state, current_player_hand, other_player_state, other_player_hand, 
+    phase, card_id, occupancy). The turn starts in PHASE_DRAW if a draw is possible, else in PHASE_PLAY.
+    """
+    draw_id, squirrel_drawable = get_draw_id_and_squirrel_drawable(state)
+    phase = PHASE_DRAW if draw_id != CANNOT_DRAW or squirrel_drawable == CAN_DRAW else PHASE_PLAY
+    return (state["board_state"], state["current_player_state"], state["current_player_hand"],
+            state["other_player_state"], state["other_player_hand"], phase, 0, 0)
+
+
+def turn_actions(partial, draws):
+    """
+    Returns the atomic decisions available in a partial turn (see turn_start):
+        PHASE_DRAW      - MOVE_RANDOM_DRAW and/or MOVE_SQUIRREL_DRAW
+        PHASE_PLAY      - END_TURN, or the id of a card in hand that can be paid for and placed
+        PHASE_SACRIFICE - the occupancy left after each distinct set of sacrifices for the chosen card
+        PHASE_LANE      - the lanes the chosen card can be placed in after the chosen sacrifices
+    Applying these in sequence reaches exactly the turns generated by next_states.
+    """
+    board_state, player_state, hand, _, _, phase, card_id, occupancy = partial
+    if phase == PHASE_DRAW:
+        state = {"board_state": board_state, "p0_draws": draws[0], "p1_draws": draws[1]}
+        draw_id, squirrel_drawable = get_draw_id_and_squirrel_drawable(state)
+        actions = []
+        if squirrel_drawable == CAN_DRAW:
+            actions.append(MOVE_SQUIRREL_DRAW)
+        if draw_id != CANNOT_DRAW:
+            actions.append(MOVE_RANDOM_DRAW)
+        return actions
+    if phase == PHASE_PLAY:
+        actions = [END_TURN]
+        max_blood = count_current_player_cards(player_state)
+        starting_occupancy = get_occupancy_4bit(player_state)
+        for card_id in get_hand_card_ids(hand):
+            blood = CARD_BLOOD[card_id]
+            if blood <= max_blood and PLACEMENT_TABLE[blood][starting_occupancy]:
+                actions.append(card_id)
+        return actions
+    placements = PLACEMENT_TABLE[CARD_BLOOD[card_id]][get_occupancy_4bit(player_state)]
+    if phase == PHASE_SACRIFICE:
+        return list(dict.fromkeys(new_occupancy for new_occupancy, _ in placements))
+    return [placement_index for new_occupancy, placement_index in placements if new_occupancy == occupancy]
+
+
+def turn_step(partial, action, draws):
+    """Returns the partial turn reached by taking an action (see turn_actions) in a partial turn. 
+       END_TURN applies the turn, switches player and returns the start of the next players turn."""
+    board_state, player_state, hand, other_player_state, other_player_hand, phase, card_id, occupancy = partial
+    if phase == PHASE_DRAW:
+        if action == MOVE_SQUIRREL_DRAW:
+            hand = draw_squirrel(hand)
+            board_state = set_drawn_squirrels(board_state)
+        else:
+            state = {"board_state": board_state, "p0_draws": draws[0], "p1_draws": draws[1]}
+            draw_id = get_draw_id_and_squirrel_drawable(state)[0]
+            hand = set_card_count(hand, draw_id, get_card_count(hand, draw_id) + 1)
+            board_state = set_drawn_cards(board_state)
+        return (board_state, player_state, hand, other_player_state, other_player_hand, PHASE_PLAY, 0, 0)
+    if phase == PHASE_PLAY:
+        if action == END_TURN:
+            player_state, other_player_state, board_state = apply_turn(player_state, other_player_state, board_state)
+            state = {"board_state": board_state ^ (1 << BOARD_CURRENT_PLAYER_SHIFT), "current_player_state": other_player_state,
+                     "current_player_hand": other_player_hand, "other_player_state": player_state, "other_player_hand": hand,
+                     "p0_draws": draws[0], "p1_draws": draws[1]}
+            return turn_start(state)
+        if CARD_BLOOD[action] == 0:
+            return (board_state, player_state, hand, other_player_state, other_player_hand, PHASE_LANE, action, get_occupancy_4bit(player_state))
+        return (board_state, player_state, hand, other_player_state, other_player_hand, PHASE_SACRIFICE, action, 0)
+    if phase == PHASE_SACRIFICE:
+        return (board_state, player_state, hand, other_player_state, other_player_hand, PHASE_LANE, card_id, action)
+    player_state = remove_cards_in_difference(player_state, get_occupancy_4bit(player_state), occupancy)
+    player_state, hand = play_card(player_state, hand, card_id, action)
+    return (board_state, player_state, hand, other_player_state, other_player_hand, PHASE_PLAY, 0, 0)
+
+
+def partial_to_state(partial, draws):
+    """Returns the state dictionary of a partial turn (without its phase, card or occupancy)."""
+    return {
+        "board_state": partial[0],
+        "current_player_state": partial[1],
+        "current_player_hand": partial[2],
+        "other_player_state": partial[3],
+        "other_player_hand": partial[4],
+        "p0_draws": draws[0],
+        "p1_draws": draws[1]
+    }
+
+
+def run_mcts(state, search_time=13, exploration_constant=1.5, widening_constant=None, widening_exponent=0.5, prior_weight=0.0, rave_equivalence=0, mirror_cache=False, transpositions=False, turn_decomposition=False, seed=None, iterations=None, metrics=False, node_limit=None, memory_limit=None, prune=False, threads=None, value_weights=None, value_mix=0.0):
     """
     Run a Monte Carlo Tree Search (MCTS) from the given state and 
-    return the visit counts from the roots children and their children.
+    return the visit counts from the roots children and their children,
+    keyed by move code (see encode_move) rather than by state.
 
     Parameters:
         state (int): The starting game state.  
         search_time (int): The Maximum length of time to run for.
         exploration_constant (float): Value to control exploration/exploitation balance.
+        widening_constant (float or None): Enables progressive widening when set (see MCTS).
+        widening_exponent (float): Growth rate of the progressive widening child limit.
+        prior_weight (float): Weight of the progressive bias term from move priors (0 disables it).
+        rave_equivalence (int): Visit count at which RAVE and node values are weighted equally (0 disables RAVE).
+        mirror_cache (bool): Generate moves through canonical_next_states, generating the moves of mirror images only once.
+        transpositions (bool): Share the statistics and untried actions of nodes with the same Zobrist key (see MCTS).
+        turn_decomposition (bool): Search with TurnMCTS, splitting each turn into atomic decisions. 
+                                   Only exploration_constant applies to this mode.
+        seed (int or None): Seeds a private random number generator for the search. If None, the 
+                            global random module is used.
+        iterations (int or None): Run exactly this many iterations instead of stopping after search_time. 
+                                  With a seed, the same state, seed and iterations always give the same visits.
+        metrics (bool): Collect SearchMetrics for the search and return them as a third value.
+        node_limit (int or None): The maximum number of tree nodes (see MCTS).
+        memory_limit (int or None): The maximum estimated tree memory in bytes (see MCTS). Only 
+                                    node_limit applies to TurnMCTS.
+        prune (bool): Prune the least visited subtrees at a limit instead of no longer expanding.
+        threads (int or None): Search one shared tree with this many threads (see ParallelMCTS). Ignored
+                               with turn_decomposition.
+        value_weights (list or None): Weights of the linear value function (see load_value_weights).
+        value_mix (float): How much of each simulation result comes from the value function rather than 
+                           a rollout, from 0 (rollouts only) to 1 (no rollouts). Ignored with turn_decomposition.
 
     Returns:
-        children_visits (dict): Dictionary holding total visits for root children nodes
-        submove_visits (dict): Dictionary holding total visits for children of root children nodes
-    """
-    mcts = MCTS(exploration_constant)
-    root = mcts.search(state, search_time)
-    children_visits = {}
-    submove_visits = {}
-    for child in root.children:
-        child_key = state_to_key(child.state)
-        children_visits[child_key] = child.visits
-        submove_visits[child_key] = {}
-        for submove in child.children:
-            submove_key = state_to_key(submove.state)
-            submove_visits[child_key][submove_key] = submove.visits
+        children_visits (dict): Dictionary holding total visits for each move from the root
+        submove_visits (dict): Dictionary holding total visits for each reply to each move from the root
+        metrics (dict): SearchMetrics.as_dict() of the search, only returned if metrics is set
+    """
+    rng = random if seed is None else random.Random(seed)
+    search_metrics = SearchMetrics() if metrics else None
+    if turn_decomposition:
+        mcts = TurnMCTS(exploration_constant, rng, search_metrics, node_limit)
+        root = mcts.search(state, search_time, iterations)
+        children_visits = {}
+        submove_visits = {}
+        for move, (visits, child) in mcts.turn_moves(root, state).items():
+            children_visits[move] = visits
+            child_state = partial_to_state(child.partial, mcts.draws)
+            submove_visits[move] = {submove: subvisits for submove, (subvisits, _) in mcts.turn_moves(child, child_state).items()}
+    else:
+        if threads:
+            mcts = ParallelMCTS(exploration_constant, threads, widening_constant, widening_exponent, prior_weight, rave_equivalence, mirror_cache, transpositions, rng, search_metrics, 
+                                node_limit, memory_limit, prune, value_weights, value_mix)
+        else:
+            mcts = MCTS(exploration_constant, widening_constant, widening_exponent, prior_weight, rave_equivalence, mirror_cache, transpositions, rng, search_metrics, 
+                        node_limit, memory_limit, prune, value_weights, value_mix)
+        root = mcts.search(state, search_time, iterations)
+        children_visits = {}
+        submove_visits = {}
+        for child in root.children:
+            children_visits[child.move] = child.visits
+            submove_visits[child.move] = {submove.move: submove.visits for submove in child.children}
 
+    if metrics:
+        return children_visits, submove_visits, search_metrics.as_dict()
     return children_visits, submove_visits
 
 
+def merge_visits(aggregated_visits, aggregated_submoves, children_visits, submove_visits):
+    """Adds the children_visits and submove_visits of one run_mcts search into the aggregated 
+       dictionaries, summing the visits of each move (as for root parallel workers)."""
+    for move, visits in children_visits.items():
+        aggregated_visits[move] = aggregated_visits.get(move, 0) + visits
+    for move, submoves in submove_visits.items():
+        aggregated = aggregated_submoves.setdefault(move, {})
+        for submove, visits in submoves.items():
+            aggregated[submove] = aggregated.get(submove, 0) + visits
+
+
+def most_visited_move(children_visits):
+    """Returns the (move, visits) of the most visited root child in children_visits."""
+    return max(children_visits.items(), key=lambda item: item[1])
+
+
+def node_depth(node):
+    """Returns the number of edges between a node and the root of its tree."""
+    depth = 0
+    while node.parent is not None:
+        node = node.parent
+        depth += 1
+    return depth
+
+
+def count_nodes(root):
+    """Returns the number of nodes in the tree below (and including) root."""
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children)
+    return count
+
+
+def state_bytes(state):
+    """Returns the estimated memory of a state dictionary. The draw lists are shared between states, so they are not counted."""
+    return sys.getsizeof(state) + sum(sys.getsizeof(value) for name, value in state.items() if name != "p0_draws" and name != "p1_draws")
+
+
+def node_bytes(node):
+    """Returns the estimated memory of an MCTSNode, including its state, its lists and its untried action states.
+       Every state holds the same fields, so the untried action states are counted at the size of the nodes state."""
+    size = sys.getsizeof(node) + sys.getsizeof(node.__dict__) + state_bytes(node.state) * (1 + len(node.untried_actions))
+    for values in (node.children, node.untried_actions, node.untried_rows, node.untried_priors, node.child_visits, 
+                   node.child_means, node.child_inv_sqrt, node.child_priors):
+        size += sys.getsizeof(values)
+    return size
+
+
+def transposition_table(root):
+    """Returns the transposition table of an existing tree, mapping each Zobrist key to the summed
+       [visits, total_reward] of the nodes with that key."""
+    table = {}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node.visits:
+            stats = table.setdefault(node.key, [0, 0])
+            stats[0] += node.visits
+            stats[1] += node.total_reward
+        stack.extend(node.children)
+    return table
+
+
+def tree_memory(root):
+    """Returns the estimated memory of the tree below (and including) root."""
+    size = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        size += node_bytes(node)
+        stack.extend(node.children)
+    return size
+
+
 class MCTSNode:
     """
     A node in the Monte Carlo Tree Search (MCTS) tree representing a specific game state.
 
     Attributes:
         state (dict): The game state associated with this node.
+        key (int): The 64 bit Zobrist hash of state, updated incrementally from the parents key.
         parent (MCTSNode or None): The parent node (None for the root).
+        move (int or None): The move code of the edge from the parent to this node (None for the root).
         children (list): A list of all child MCTSNode instance expanded from this node.
         visits (int): The number of times that this node has been visited during search.
         total_reward (int): The total reward from all simulations passing through this node.
         untried_actions (list): A list of game states not yet explored from this node.
+        untried_rows (list): The current players bitboard state after placing cards (before apply_turn) 
+                             for each untried action, aligned with untried_actions.
+        prior (float): The heuristic prior of the move leading to this node (0 if priors are not used).
+        amaf_keys (tuple): The AMAF action keys of the move leading to this node (empty if RAVE is not used).
+        ordered (bool): True once untried_actions has been sorted so that the most promising action is last.
+        untried_priors (list): Priors of the untried actions, aligned with untried_actions once ordered.
+        index (int): The position of this node in its parents children list.
+        child_visits (list): Visit counts of the children, aligned with children.
+        child_means (list): Mean rewards of the children, aligned with children.
+        child_inv_sqrt (list): 1 / sqrt(visits) of the children (0 if unvisited), aligned with children.
+        child_priors (list): Priors of the children, aligned with children.
     """
 
-    def __init__(self, state, parent=None):
-        """Initialise the MCTSNode object and compute the avaliable states direcly reachable from this node."""
+    def __init__(self, state, parent=None, prior=0.0, amaf_keys=(), generate=next_states, key=None, successors=None, move=None):
+        """Initialise the MCTSNode object and compute the avaliable states direcly reachable from this node.
+           If successors is given as (untried_actions, untried_rows) of a node with the same key, they are copied instead."""
         self.state = state
+        self.key = zobrist_hash(state) if key is None else key
         self.parent = parent
+        self.move = move
         self.children = []
         self.visits = 0
         self.total_reward = 0
         self.untried_actions = []
+        self.untried_rows = []
+        self.prior = prior
+        self.amaf_keys = amaf_keys
+        self.ordered = False
+        self.untried_priors = []
+        self.index = 0
+        self.child_visits = []
+        self.child_means = []
+        self.child_inv_sqrt = []
+        self.child_priors = []
+
+        if successors is not None:
+            self.untried_actions = list(successors[0])
+            self.untried_rows = list(successors[1])
+            return
+        self.generate_untried_actions(generate)
 
+    def generate_untried_actions(self, generate=next_states):
+        """Sets the untried actions (and rows) to every state directly reachable from this node."""
+        state = self.state
+        self.untried_actions = []
+        self.untried_rows = []
+        self.untried_priors = []
+        self.ordered = False
         draw_id, squirrel_drawable = get_draw_id_and_squirrel_drawable(state)
-        actions = next_states(state["current_player_state"], state["current_player_hand"], True, draw_id, squirrel_drawable)
+        actions = generate(state["current_player_state"], state["current_player_hand"], True, draw_id, squirrel_drawable)
         for current_state, current_hand, random_draw, squirrel_draw in actions:
             new_state = set_drawn_and_apply_state(state, current_state, current_hand, random_draw, squirrel_draw)
             self.untried_actions.append(new_state)
+            self.untried_rows.append(current_state)
 
     def is_fully_expanded(self):
         """Returns True if no untried actions remain (i.e. the node is fully expanded, otherwise False)."""
         return len(self.untried_actions) == 0
 
-    def add_child(self, child_state):
+    def can_expand(self, widening_constant=None, widening_exponent=0.5):
+        """Returns True if an untried action may be expanded now. With progressive widening the number of 
+           children is capped at widening_constant * visits ^ widening_exponent (and at least 1)."""
+        if not self.untried_actions:
+            return False
+        if widening_constant is None:
+            return True
+        return len(self.children) < max(1, int(widening_constant * self.visits ** widening_exponent))
+
+    def order_untried_actions(self, rng=random):
+        """Sorts the untried actions by move prior so that the most promising action is popped first.
+           Actions are shuffled beforehand so that equally ranked actions are tried in a random order."""
+        actions = list(zip(self.untried_actions, self.untried_rows))
+        rng.shuffle(actions)
+        ranked = sorted(((move_prior(self.state, next_state), next_state, row) for next_state, row in actions), key=lambda item: item[0])
+        self.untried_priors = [prior for prior, _, _ in ranked]
+        self.untried_actions = [next_state for _, next_state, _ in ranked]
+        self.untried_rows = [row for _, _, row in ranked]
+        self.ordered = True
+
+    def pop_untried_action(self, index=-1):
+        """Removes the untried action at index and returns its state, row (before apply_turn) and prior."""
+        prior = self.untried_priors.pop(index) if self.ordered else 0.0
+        return self.untried_actions.pop(index), self.untried_rows.pop(index), prior
+
+    def add_child(self, child_state, prior=0.0, amaf_keys=(), generate=next_states, key=None, successors=None, move=None):
         """Given a child state, constructs a new MCTSNode object, adds it to its list of children, then returns the child object."""
-        child_node = MCTSNode(state=child_state, parent=self)
+        if key is None:
+            key = zobrist_update_state(self.key, self.state, child_state)
+        child_node = MCTSNode(state=child_state, parent=self, prior=prior, amaf_keys=amaf_keys, generate=generate, key=key, successors=successors, move=move)
+        child_node.index = len(self.children)
         self.children.append(child_node)
+        self.child_visits.append(0)
+        self.child_means.append(0.0)
+        self.child_inv_sqrt.append(0.0)
+        self.child_priors.append(prior)
         return child_node
 
     def update(self, reward):
-        """Increment the visit count and add a reward value to the total reward."""
+        """Increment the visit count and add a reward value to the total reward, 
+           mirroring both into the parents child statistic arrays."""
         self.visits += 1
         self.total_reward += reward
+        if self.parent is not None:
+            self.parent.child_visits[self.index] = self.visits
+            self.parent.child_means[self.index] = self.total_reward / self.visits
+            self.parent.child_inv_sqrt[self.index] = 1 / math.sqrt(self.visits)
+
+    def value(self, amaf=None, rave_equivalence=0, table=None):
+        """Return the mean reward of this node, or of every node with its key if a transposition table is 
+           given. If rave_equivalence is set, it is blended with the AMAF value of its move from the amaf
+           table, weighted by beta = sqrt(k / (3 * visits + k))."""
+        if table is None:
+            exploitation = self.total_reward / self.visits
+        else:
+            visits, total_reward = table[self.key]
+            exploitation = total_reward / visits
+        if rave_equivalence and self.amaf_keys:
+            amaf_visits = 0
+            amaf_reward = 0
+            for key in self.amaf_keys:
+                if key in amaf:
+                    amaf_visits += amaf[key][0]
+                    amaf_reward += amaf[key][1]
+            if amaf_visits:
+                beta = math.sqrt(rave_equivalence / (3 * self.visits + rave_equivalence))
+                exploitation = (1 - beta) * exploitation + beta * amaf_reward / amaf_visits
+        return exploitation
 
-    def uct_value(self, exploration_constant):
-        """Return the UCT value for this node using the given exploration constant."""
+    def uct_value(self, exploration_constant, prior_weight=0.0, amaf=None, rave_equivalence=0, table=None):
+        """Return the UCT value for this node using the given exploration constant, plus a
+           progressive bias of prior_weight * prior / (visits + 1) that fades as visits grow."""
         if self.visits == 0:
             return float('inf')
-        exploitation = self.total_reward / self.visits
+        exploitation = self.value(amaf, rave_equivalence, table)
         exploration = exploration_constant * math.sqrt(math.log(self.parent.visits) / self.visits)
-        return exploitation + exploration
+        return exploitation + exploration + prior_weight * self.prior / (self.visits + 1)
+
+    def best_child(self, exploration_constant, prior_weight=0.0, amaf=None, rave_equivalence=0, table=None):
+        """Returns the child with the highest UCT value (the first one on ties, like max). All children
+           are scored in one pass over the child statistic arrays, with the parent log computed once
+           and folded into a single multiplier for each childs 1 / sqrt(visits). With a transposition
+           table, the mean reward of each child is taken from the table."""
+        visits = self.child_visits
+        if 0 in visits:
+            return self.children[visits.index(0)]
+        scale = exploration_constant * math.sqrt(math.log(self.visits))
+        if rave_equivalence:
+            exploitation = [child.value(amaf, rave_equivalence, table) for child in self.children]
+        elif table is not None:
+            exploitation = [total_reward / child_visits for child_visits, total_reward in (table[child.key] for child in self.children)]
+        else:
+            exploitation = self.child_means
+        if prior_weight:
+            scores = [q + scale * e + prior_weight * p / (v + 1) for q, e, p, v in zip(exploitation, self.child_inv_sqrt, self.child_priors, visits)]
+        else:
+            scores = [q + scale * e for q, e in zip(exploitation, self.child_inv_sqrt)]
+        return self.children[scores.index(max(scores))]
 
 
 class MCTS:
@@ -160,47 +884,210 @@ class MCTS:
 
     Attributes:
         exploration_constant (float): A parameter to balance exploration and exploitation in UCT calculations.
+        widening_constant (float or None): Enables progressive widening when set, so a node may only hold 
+                                           widening_constant * visits ^ widening_exponent children before 
+                                           the search descends through it. Untried actions are then expanded 
+                                           in order of move prior instead of at random.
+        widening_exponent (float): Growth rate of the progressive widening child limit.
+        prior_weight (float): Weight of the progressive bias term added to the UCT value. When non-zero, 
+                              untried actions are also expanded in order of move prior.
+        rave_equivalence (int): Enables RAVE when non-zero. AMAF statistics for each "card X placed in lane Y"
+                                action are shared across all simulations and blended into node values, with
+                                equal weighting when a node has rave_equivalence / 3 visits.
+        amaf (dict): Maps AMAF action keys to [visits, total_reward] for the current search.
+        generate (function): The move generator; canonical_next_states if mirror_cache is set, else next_states.
+        transpositions (bool): Enables the transposition table. Every node with the same Zobrist key (the 
+                               same state reached through different lines of play) shares its mean reward,
+                               which best_child reads from the table, while exploration still uses the 
+                               visits of each node. A node reached again also copies its untried actions 
+                               from the first node with its key instead of generating every move again.
+        table (dict): Maps Zobrist keys to the [visits, total_reward] of every node with that key.
+        successors (dict): Maps Zobrist keys to the (untried_actions, untried_rows) a node started with.
+        rng (random.Random): The random number generator used for expansion and simulation 
+                             (defaults to the global random module).
+        metrics (SearchMetrics or None): If given, the search records its metrics here. Move generation
+                                         is then counted through counted_generator.
+        node_limit (int or None): The maximum number of nodes in the tree. 
+        memory_limit (int or None): The maximum estimated memory of the tree in bytes (see tree_memory).
+        prune (bool): What to do once a limit is reached. If False, no more nodes are expanded and the
+                      search carries on from the existing tree, simulating from its leaves. If True, the
+                      least visited subtrees are pruned until the tree is back under PRUNE_TARGET of the limit
+                      (expansion still stops if the roots children alone exceed the limit).
+        value_weights (list or None): Weights of the linear value function used to evaluate leaves.
+        value_mix (float): The weight of the value function against the rollout result in each simulation.
+                           At 1 leaves are only evaluated, without a rollout. RAVE only learns from rollouts.
+        node_count (int): The number of nodes in the current tree.
+        tree_bytes (int): The estimated memory of the current tree, only tracked if memory_limit or metrics is set.
+        track_memory (bool): True if tree_bytes is tracked.
+        expanding (bool): False once a limit has been reached without pruning.
     """
 
-    def __init__(self, exploration_constant):
+    def __init__(self, exploration_constant, widening_constant=None, widening_exponent=0.5, prior_weight=0.0, rave_equivalence=0, mirror_cache=False, transpositions=False, rng=random, metrics=None,
+                 node_limit=None, memory_limit=None, prune=False, value_weights=None, value_mix=0.0):
         self.exploration_constant = exploration_constant
+        self.widening_constant = widening_constant
+        self.widening_exponent = widening_exponent
+        self.prior_weight = prior_weight
+        self.rave_equivalence = rave_equivalence
+        self.amaf = {}
+        self.generate = canonical_next_states if mirror_cache else next_states
+        self.transpositions = transpositions
+        self.table = None
+        self.successors = {}
+        self.rng = rng
+        self.metrics = metrics
+        if metrics is not None:
+            self.generate = counted_generator(self.generate, metrics)
+        self.node_limit = node_limit
+        self.memory_limit = memory_limit
+        self.prune = prune
+        self.value_weights = value_weights
+        self.value_mix = value_mix if value_weights is not None else 0.0
+        self.node_count = 0
+        self.tree_bytes = 0
+        self.track_memory = memory_limit is not None or metrics is not None
+        self.expanding = True
 
-    def search(self, root_state, time_limit):
+    def search(self, root_state, time_limit, iterations=None, root=None):
         """
         Executes the MCTS search starting from the root state for a given time limit and returns the root node.
 
         Parameters:
             root_state (dict): the root game state to begin search from.
             time_limit (int): The Maximum length of time to run for.
+            iterations (int or None): If given, run exactly this many iterations and ignore time_limit.
+            root (MCTSNode or None): If given, the search continues from this existing tree (e.g. one 
+                                     restored with snapshot.load_tree) and root_state is ignored.
 
         Returns:
             root (MCTSNode): the root node of the tree.
         """
-        root = MCTSNode(state=root_state)
+        if root is None:
+            root = MCTSNode(state=root_state, generate=self.generate)
+        if ZOBRIST_DEBUG:
+            zobrist_check(root.key, root.state)
+        self.amaf = {}
+        self.table = transposition_table(root) if self.transpositions else None
+        self.successors = {}
+        self.node_count = count_nodes(root)
+        self.tree_bytes = tree_memory(root) if self.track_memory else 0
+        self.expanding = True
+        metrics = self.metrics
+        rollout_time = metrics.rollout_time if metrics is not None else 0
         start_time = time.time()
-        while time.time() - start_time < time_limit:
+        completed = 0
+        while (completed < iterations) if iterations is not None else (time.time() - start_time < time_limit):
+            completed += 1
             node = self.select(root)
 
-            if not is_game_over(node.state["board_state"]) and node.untried_actions:
+            if self.expanding and not is_game_over(node.state["board_state"]) and node.untried_actions:
                 node = self.expand(node)
 
-            reward = self.simulate(node.state, get_current_player(root.state["board_state"]))
+            playout_keys = [] if self.rave_equivalence else None
+            if metrics is None:
+                reward = self.simulate(node.state, get_current_player(root.state["board_state"]), playout_keys)
+            else:
+                rollout_start = time.perf_counter()
+                reward = self.simulate(node.state, get_current_player(root.state["board_state"]), playout_keys)
+                metrics.rollout_time += time.perf_counter() - rollout_start
+                metrics.record_depth(node_depth(node))
 
-            self.backpropagate(node, reward)
+            self.backpropagate(node, reward, playout_keys)
+            if self.expanding and self.over_limit():
+                if self.prune:
+                    self.prune_tree(root)
+                self.expanding = not self.over_limit()
+        if metrics is not None:
+            search_time = time.time() - start_time
+            metrics.searches += 1
+            metrics.iterations += completed
+            metrics.search_time += search_time
+            metrics.expansion_time += search_time - (metrics.rollout_time - rollout_time)
+            metrics.nodes += self.node_count
+            metrics.tree_bytes += self.tree_bytes
         return root
 
     def select(self, node):
-        """Traverses the tree by selecting child nodes with the highest UCT value until a node with untried actions is found."""
-        while node.is_fully_expanded() and not is_game_over(node.state["board_state"]):
-            node = max(node.children, key=lambda child: child.uct_value(self.exploration_constant))
+        """Traverses the tree by selecting child nodes with the highest UCT value until a node that can be expanded is found
+           (or, once expansion has stopped at a limit, until a leaf is found)."""
+        expanding = self.expanding
+        while not (expanding and node.can_expand(self.widening_constant, self.widening_exponent)) and node.children and not is_game_over(node.state["board_state"]):
+            node = node.best_child(self.exploration_constant, self.prior_weight, self.amaf, self.rave_equivalence, self.table)
         return node
 
+    def over_limit(self):
+        """Returns True if the tree has reached its node limit or its memory limit."""
+        if self.node_limit is not None and self.node_count >= self.node_limit:
+            return True
+        return self.memory_limit is not None and self.tree_bytes >= self.memory_limit
+
+    def prune_tree(self, root):
+        """
+        Cuts the tree back under PRUNE_TARGET of its limits by collapsing the least visited subtrees. A
+        collapsed node keeps its statistics but loses its children, and its untried actions are
+        regenerated, so the subtree can grow back if the node becomes promising again. Only nodes with
+        children are collapsed, as collapsing a leaf frees nothing. Descendants never have more visits
+        than their ancestors, so the smallest subtrees are collapsed first. The root and its children 
+        are never removed.
+        """
+        candidates = []
+        stack = list(root.children)
+        while stack:
+            node = stack.pop()
+            if node.children:
+                candidates.append(node)
+            stack.extend(node.children)
+        candidates.sort(key=lambda node: node.visits)
+        node_target = self.node_limit * PRUNE_TARGET if self.node_limit is not None else None
+        memory_target = self.memory_limit * PRUNE_TARGET if self.memory_limit is not None else None
+        for node in candidates:
+            if (node_target is None or self.node_count <= node_target) and (memory_target is None or self.tree_bytes <= memory_target):
+                break
+            removed = count_nodes(node) - 1
+            if self.track_memory:
+                self.tree_bytes -= tree_memory(node)
+            node.children = []
+            node.generate_untried_actions(self.generate)
+            node.child_visits = []
+            node.child_means = []
+            node.child_inv_sqrt = []
+            node.child_priors = []
+            if self.track_memory:
+                self.tree_bytes += node_bytes(node)
+            self.node_count -= removed
+            if self.metrics is not None:
+                self.metrics.pruned += removed
+
     def expand(self, node):
-        """Expands a node by removing a random untried action and adding the corresponding child node."""
-        next_state = node.untried_actions.pop(random.randint(0, len(node.untried_actions) - 1))
-        return node.add_child(next_state)
+        """Expands a node by removing an untried action and adding the corresponding child node. The action is
+           random, unless progressive widening or priors are enabled, in which case the best ordered action is used."""
+        if self.widening_constant is None and not self.prior_weight:
+            next_state, row, prior = node.pop_untried_action(self.rng.randint(0, len(node.untried_actions) - 1))
+        else:
+            if not node.ordered:
+                node.order_untried_actions(self.rng)
+            next_state, row, prior = node.pop_untried_action()
+        amaf_keys = ()
+        if self.rave_equivalence:
+            amaf_keys = placement_keys(get_current_player(node.state["board_state"]), node.state["current_player_state"], row)
+        key = zobrist_update_state(node.key, node.state, next_state)
+        if ZOBRIST_DEBUG:
+            zobrist_check(key, next_state)
+        move = encode_move(node.state, row, next_state)
+        if not self.transpositions:
+            child = node.add_child(next_state, prior, amaf_keys, self.generate, key, move=move)
+        else:
+            successors = self.successors.get(key)
+            child = node.add_child(next_state, prior, amaf_keys, self.generate, key, successors, move)
+            if successors is None:
+                self.successors[key] = (tuple(child.untried_actions), tuple(child.untried_rows))
+        self.node_count += 1
+        if self.track_memory:
+            # The childs state moved out of its parents untried actions, where it was already counted.
+            self.tree_bytes += node_bytes(child) - state_bytes(next_state)
+        return child
     
-    def simulate(self, state, root_player_id):
+    def simulate(self, state, root_player_id, playout_keys=None):
         """
         Runs a simulation from a given state until a player wins or the maximum number of 
         iterations is reached, returning a reward based on the outcome.
@@ -208,26 +1095,28 @@ class MCTS:
         Parameters:
             state (dict): Rhe game state to run a simulation from.
             root_player_id: Rhe root player.
+            playout_keys (list or None): If given, the AMAF keys of every move played are appended to it.
 
         Returns:
-            reward (int): The reward for the simulation relative to the root player
+            reward (float): The reward for the simulation relative to the root player
         """
-        iterations = 0
-        while not is_game_over(state["board_state"]):
+        return self.mix_value(state, root_player_id, playout_keys, self.rng, self.metrics)
 
-            current_player = get_current_player(state["board_state"])
-            if get_drawn_cards(state["board_state"], current_player) >= MAX_DRAWABLE_RANDOM and get_drawn_squirrels(state["board_state"], current_player) >= MAX_DRAWABLE_SQUIRRELS:
-                if iterations == MAX_ITERATIONS:   # stalemate reached
-                    return 0
-                else:
-                    iterations += 1
-            
-            draw_id, squirrel_drawable = get_draw_id_and_squirrel_drawable(state)
-            possible_actions = next_states(state["current_player_state"], state["current_player_hand"], True, draw_id, squirrel_drawable)
-            current_state, current_hand, random_draw, squirrel_draw = random.choice(possible_actions)
-
-            state = set_drawn_and_apply_state(state, current_state, current_hand, random_draw, squirrel_draw)
-        reward = self.evaluate(state, root_player_id)
+    def mix_value(self, state, root_player_id, playout_keys, rng, metrics):
+        """Returns the rollout reward of state, mixed with (or, at value_mix 1, replaced by) the value 
+           function estimate relative to the root player."""
+        mix = self.value_mix
+        if mix and not is_game_over(state["board_state"]):
+            value = evaluate_value(self.value_weights, state["board_state"], state["current_player_state"], state["current_player_hand"],
+                                   state["other_player_state"], state["other_player_hand"])
+            if get_current_player(state["board_state"]) != root_player_id:
+                value = -value
+            if mix >= 1:
+                return value
+        reward = rollout(state["board_state"], state["current_player_state"], state["current_player_hand"], state["other_player_state"], 
+                         state["other_player_hand"], state["p0_draws"], state["p1_draws"], root_player_id, playout_keys, self.generate, rng, metrics)
+        if mix and not is_game_over(state["board_state"]):
+            return (1 - mix) * reward + mix * value
         return reward
 
     def evaluate(self, state, root_player_id):
@@ -237,9 +1126,313 @@ class MCTS:
             return -1
         return 1
 
-    def backpropagate(self, node, reward):
+    def backpropagate(self, node, reward, playout_keys=None):
         """Propagates the reward up the tree by updating visit counts and 
-           total reward until the root state is found"""
+           total reward until the root state is found. If playout_keys is given, 
+           the AMAF statistics of every action played in the simulation (in the tree 
+           or in the playout) are also updated once with the reward, and with transpositions
+           enabled so are the table entries of the keys on the path."""
+        seen = set(playout_keys) if playout_keys is not None else None
+        table = self.table
         while node is not None:
             node.update(reward)
-            node = node.parent
\ No newline at end of file
+            if table is not None:
+                stats = table.get(node.key)
+                if stats is None:
+                    table[node.key] = [1, reward]
+                else:
+                    stats[0] += 1
+                    stats[1] += reward
+            if seen is not None:
+                seen.update(node.amaf_keys)
+            node = node.parent
+        if seen:
+            for key in seen:
+                stats = self.amaf.get(key)
+                if stats is None:
+                    self.amaf[key] = [1, reward]
+                else:
+                    stats[0] += 1
+                    stats[1] += reward
+
+
+class ParallelMCTS(MCTS):
+    """
+    Tree parallel MCTS, where several threads search one shared tree (and share the next_states memo).
+    Selection, expansion and backpropagation hold a lock on the tree, while the rollouts, which take
+    most of the time, run concurrently. While a thread simulates from a leaf, every node on its path
+    (and its transposition table entry) carries a virtual loss (a visit with a reward of -VIRTUAL_LOSS), 
+    so that other threads are steered towards other lines. The virtual loss is replaced by the real 
+    reward when the rollout finishes.
+
+    Threads only run in parallel on free threaded (no GIL) CPython builds, see gil_disabled. With
+    threads the number of visits is still exact, but the search is not reproducible from a seed, the 
+    memo hit counts of metrics are approximate, and pruning is replaced by no longer expanding.
+
+    Attributes:
+        threads (int): The number of search threads.
+        lock (threading.Lock): Guards the tree, the AMAF table and the node counts.
+        local (threading.local): Holds the random number generator and metrics of each thread.
+    """
+
+    def __init__(self, exploration_constant, threads=4, *args, **kwargs):
+        super().__init__(exploration_constant, *args, **kwargs)
+        self.threads = threads
+        self.prune = False
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def search(self, root_state, time_limit, iterations=None, root=None):
+        """Executes the search from the root state with every thread for a given time limit (or exactly
+           iterations iterations in total if given) and returns the root node."""
+        if root is None:
+            root = MCTSNode(state=root_state, generate=self.generate)
+        self.amaf = {}
+        self.table = transposition_table(root) if self.transpositions else None
+        self.successors = {}
+        self.node_count = count_nodes(root)
+        self.tree_bytes = tree_memory(root) if self.track_memory else 0
+        self.expanding = True
+        self.completed = 0
+        self.root_player_id = get_current_player(root.state["board_state"])
+        seeds = [self.rng.getrandbits(64) for _ in range(self.threads)]
+        thread_metrics = [SearchMetrics() if self.metrics is not None else None for _ in range(self.threads)]
+        start_time = time.time()
+        workers = [threading.Thread(target=self.search_thread, args=(root, start_time, time_limit, iterations, seed, metrics)) 
+                   for seed, metrics in zip(seeds, thread_metrics)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        if self.metrics is not None:
+            search_time = time.time() - start_time
+            for metrics in thread_metrics:
+                self.metrics.merge(metrics)
+            self.metrics.searches += 1
+            self.metrics.iterations += self.completed
+            self.metrics.search_time += search_time
+            # Rollout time is summed over the threads, so the tree time is too.
+            self.metrics.expansion_time += max(0, search_time * self.threads - sum(metrics.rollout_time for metrics in thread_metrics))
+            self.metrics.nodes += self.node_count
+            self.metrics.tree_bytes += self.tree_bytes
+        return root
+
+    def search_thread(self, root, start_time, time_limit, iterations, seed, metrics):
+        """Runs search iterations on the shared tree until the shared budget is used up."""
+        self.local.rng = random.Random(seed)
+        self.local.metrics = metrics
+        while True:
+            with self.lock:
+                if (self.completed >= iterations) if iterations is not None else (time.time() - start_time >= time_limit):
+                    return
+                self.completed += 1
+                node = self.select(root)
+                if self.expanding and not is_game_over(node.state["board_state"]) and node.untried_actions:
+                    node = self.expand(node)
+                leaf = node
+                while node is not None:
+                    node.update(-VIRTUAL_LOSS)
+                    if self.table is not None:
+                        stats = self.table.setdefault(node.key, [0, 0])
+                        stats[0] += 1
+                        stats[1] -= VIRTUAL_LOSS
+                    node = node.parent
+
+            playout_keys = [] if self.rave_equivalence else None
+            if metrics is None:
+                reward = self.simulate(leaf.state, self.root_player_id, playout_keys)
+            else:
+                rollout_start = time.perf_counter()
+                reward = self.simulate(leaf.state, self.root_player_id, playout_keys)
+                metrics.rollout_time += time.perf_counter() - rollout_start
+                metrics.record_depth(node_depth(leaf))
+
+            with self.lock:
+                node = leaf
+                while node is not None:
+                    node.visits -= 1
+                    node.total_reward += VIRTUAL_LOSS
+                    if self.table is not None:
+                        stats = self.table[node.key]
+                        stats[0] -= 1
+                        stats[1] += VIRTUAL_LOSS
+                    node = node.parent
+                self.backpropagate(leaf, reward, playout_keys)
+                if self.expanding and self.over_limit():
+                    self.expanding = False
+
+    def simulate(self, state, root_player_id, playout_keys=None):
+        """Runs a rollout (mixed with the value function) from state with the random number generator and metrics of the calling thread."""
+        return self.mix_value(state, root_player_id, playout_keys, self.local.rng, self.local.metrics)
+
+
+def gil_disabled():
+    """Returns True on a free threaded CPython build running without the GIL, where ParallelMCTS threads run in parallel."""
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+class TurnNode:
+    """
+    A node in the turn decomposition tree, representing a partial turn (see turn_start). Nodes are
+    shared between every line of play that reaches the same partial turn, so the tree is a graph and
+    playing the same cards in a different order shares statistics.
+
+    Attributes:
+        partial (tuple): The partial turn associated with this node.
+        children (list): The TurnNode reached by each tried action, aligned with actions.
+        actions (list): The tried actions.
+        untried_actions (list): The actions from turn_actions not yet tried from this node.
+        visits (int): The number of times that this node has been visited during search.
+        total_reward (int): The total reward from all simulations passing through this node.
+    """
+
+    def __init__(self, partial, draws):
+        """Initialise the TurnNode object and compute the actions avaliable from its partial turn."""
+        self.partial = partial
+        self.children = []
+        self.actions = []
+        self.untried_actions = [] if is_game_over(partial[0]) else turn_actions(partial, draws)
+        self.visits = 0
+        self.total_reward = 0
+
+    def best_child(self, exploration_constant, sign=1):
+        """Returns the child with the highest UCT value, preferring unvisited children. Rewards are relative
+           to the root player, so sign is -1 when the other player is deciding at this node."""
+        best_score = -float('inf')
+        best = None
+        scale = exploration_constant * math.sqrt(math.log(max(self.visits, 1)))
+        for child in self.children:
+            if child.visits == 0:
+                return child
+            score = sign * child.total_reward / child.visits + scale / math.sqrt(child.visits)
+            if score > best_score:
+                best_score = score
+                best = child
+        return best
+
+
+class TurnMCTS:
+    """
+    Monte Carlo Tree Search over atomic decisions instead of whole turns. A turn is the sequence
+    draw type -> card to play -> sacrifice set -> lane -> ... -> end turn, so each node has a small
+    fan-out and the tree grows deeper rather than wider for the same number of nodes. As lines of
+    play run through many more nodes per turn, each node is selected from the perspective of the
+    player deciding at it (rewards are still stored relative to the root player).
+
+    Attributes:
+        exploration_constant (float): A parameter to balance exploration and exploitation in UCT calculations.
+        nodes (dict): Maps each partial turn to its TurnNode, shared between all paths that reach it.
+        draws (tuple): The (p0_draws, p1_draws) draw sequences of the searched game.
+        rng (random.Random): The random number generator (defaults to the global random module).
+        metrics (SearchMetrics or None): If given, the search records its metrics here.
+        node_limit (int or None): The maximum number of nodes. Once reached, no more actions are tried
+                                  and the search carries on from the existing graph.
+    """
+
+    def __init__(self, exploration_constant, rng=random, metrics=None, node_limit=None):
+        self.exploration_constant = exploration_constant
+        self.nodes = {}
+        self.draws = ([], [])
+        self.rng = rng
+        self.metrics = metrics
+        self.node_limit = node_limit
+
+    def get_node(self, partial):
+        """Returns the TurnNode for a partial turn, creating it on first use."""
+        node = self.nodes.get(partial)
+        if node is None:
+            node = TurnNode(partial, self.draws)
+            self.nodes[partial] = node
+        return node
+
+    def search(self, root_state, time_limit, iterations=None):
+        """Executes the search from the root state for a given time limit (or exactly iterations 
+           iterations if given) and returns the root TurnNode."""
+        self.draws = (root_state["p0_draws"], root_state["p1_draws"])
+        self.nodes = {}
+        root = self.get_node(turn_start(root_state))
+        root_player_id = get_current_player(root_state["board_state"])
+        rollout_time = self.metrics.rollout_time if self.metrics is not None else 0
+        start_time = time.time()
+        completed = 0
+        while (completed < iterations) if iterations is not None else (time.time() - start_time < time_limit):
+            completed += 1
+            path = [root]
+            on_path = {id(root)}
+            node = root
+            expanding = self.node_limit is None or len(self.nodes) < self.node_limit
+            # Nodes are shared by partial turn, so a turn that changes nothing (e.g. empty boards with no
+            # draws left) leads back to a node already on the path. Selection stops at such a cycle.
+            while not (expanding and node.untried_actions) and node.children:
+                sign = 1 if get_current_player(node.partial[0]) == root_player_id else -1
+                child = node.best_child(self.exploration_constant, sign)
+                if id(child) in on_path:
+                    break
+                on_path.add(id(child))
+                path.append(child)
+                node = child
+            if expanding and node.untried_actions:
+                action = node.untried_actions.pop(self.rng.randint(0, len(node.untried_actions) - 1))
+                child = self.get_node(turn_step(node.partial, action, self.draws))
+                node.actions.append(action)
+                node.children.append(child)
+                if id(child) not in on_path:
+                    path.append(child)
+                    node = child
+            if self.metrics is None:
+                reward = self.simulate(node.partial, root_player_id)
+            else:
+                rollout_start = time.perf_counter()
+                reward = self.simulate(node.partial, root_player_id)
+                self.metrics.rollout_time += time.perf_counter() - rollout_start
+                self.metrics.record_depth(len(path) - 1)
+            for visited in path:
+                visited.visits += 1
+                visited.total_reward += reward
+        if self.metrics is not None:
+            search_time = time.time() - start_time
+            self.metrics.searches += 1
+            self.metrics.iterations += completed
+            self.metrics.search_time += search_time
+            self.metrics.expansion_time += search_time - (self.metrics.rollout_time - rollout_time)
+            self.metrics.nodes += len(self.nodes)
+        return root
+
+    def simulate(self, partial, root_player_id):
+        """Completes the partial turn with random decisions, then runs a rollout from the next turn
+           and returns its reward relative to the root player."""
+        board_state, player_state, hand, other_player_state, other_player_hand, phase, card_id, occupancy = partial
+        if phase == PHASE_DRAW:
+            return rollout(board_state, player_state, hand, other_player_state, other_player_hand, self.draws[0], self.draws[1], root_player_id, rng=self.rng, metrics=self.metrics)
+        if phase != PHASE_PLAY:
+            if phase == PHASE_SACRIFICE:
+                partial = turn_step(partial, self.rng.choice(turn_actions(partial, self.draws)), self.draws)
+            partial = turn_step(partial, self.rng.choice(turn_actions(partial, self.draws)), self.draws)
+            player_state, hand = partial[1], partial[2]
+        if not is_game_over(board_state):
+            player_state, hand, _, _ = self.rng.choice(next_states(player_state, hand, False, CANNOT_DRAW, CANNOT_DRAW))
+            player_state, other_player_state, board_state = apply_turn(player_state, other_player_state, board_state)
+            player_state, other_player_state = other_player_state, player_state
+            hand, other_player_hand = other_player_hand, hand
+            board_state ^= 1 << BOARD_CURRENT_PLAYER_SHIFT
+        return rollout(board_state, player_state, hand, other_player_state, other_player_hand, self.draws[0], self.draws[1], root_player_id, rng=self.rng, metrics=self.metrics)
+
+    def turn_moves(self, node, state):
+        """Returns {move code: visits} for every whole turn explored from node, whose partial turn
+           is the start of the turn in state, by walking the tree down to each END_TURN."""
+        moves = {}
+        stack = [node]
+        seen = set()
+        while stack:
+            current = stack.pop()
+            if id(current) in seen:
+                continue
+            seen.add(id(current))
+            for action, child in zip(current.actions, current.children):
+                if current.partial[5] == PHASE_PLAY and action == END_TURN:
+                    next_state = partial_to_state(child.partial, self.draws)
+                    moves[encode_move(state, current.partial[1], next_state)] = (child.visits, child)
+                else:
+                    stack.append(child)
+        return moves
\ No newline at end of file
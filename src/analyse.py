@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import time
+import argparse
+import collections
+import concurrent.futures
+import multiprocessing
+from ai import run_mcts, load_value_weights
+from record import RecordReader, turn_to_state, TURN_FIELDS
+from bench import benchmark_positions
+
+# Constants.
+DEFAULT_SEARCH_TIME = 1.0
+IN_FLIGHT_PER_WORKER = 4
+
+
+def read_positions(path):
+    """Yields (info, state) for every turn record in a game record file (see record.py), where info
+       holds the game, turn and move played. Records are read lazily from the memory mapped file."""
+    with RecordReader(path) as reader:
+        games = reader.games()
+        for turn in reader.turns():
+            fields = dict(zip(TURN_FIELDS, turn))
+            info = {"game": fields["game"], "turn": fields["turn"], "played": fields["move"]}
+            yield info, turn_to_state(turn, games[fields["game"]][1])
+
+
+def corpus_positions(count):
+    """Yields (info, state) for the first count positions of the benchmark corpus."""
+    for index, state in enumerate(benchmark_positions(count)):
+        yield {"corpus": index}, state
+
+
+def analyse_position(info, state, search_options):
+    """
+    Searches one position with run_mcts and returns a JSON serialisable analysis: the given info,
+    the root moves ranked by visits (with their share of the visits), the total iterations and the
+    search time. If info names the move played, its rank is included.
+    """
+    start = time.perf_counter()
+    children_visits, _ = run_mcts(state, **search_options)
+    elapsed = time.perf_counter() - start
+    total = sum(children_visits.values())
+    ranked = sorted(children_visits.items(), key=lambda item: (-item[1], item[0]))
+    analysis = dict(info)
+    analysis["moves"] = [{"move": move, "visits": visits, "share": visits / total if total else 0} for move, visits in ranked]
+    analysis["best_move"] = ranked[0][0] if ranked else None
+    analysis["iterations"] = total
+    analysis["time"] = elapsed
+    if "played" in info:
+        moves = [move for move, _ in ranked]
+        analysis["played_rank"] = moves.index(info["played"]) + 1 if info["played"] in moves else None
+    return analysis
+
+
+def analyse_positions(positions, search_options, workers=None):
+    """Analyses positions across a process pool and yields the analyses in input order. At most a few
+       positions per worker are in flight at once, so very large position files are streamed."""
+    limit = IN_FLIGHT_PER_WORKER * (workers or os.cpu_count() or 1)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for info, state in positions:
+            pending.append(executor.submit(analyse_position, info, state, search_options))
+            if len(pending) >= limit:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def search_options_from_args(args):
+    """Returns the run_mcts keyword arguments selected on the command line."""
+    return {
+        "search_time": args.time,
+        "iterations": args.iterations,
+        "seed": args.seed,
+        "exploration_constant": args.exploration,
+        "widening_constant": args.widening,
+        "prior_weight": args.prior_weight,
+        "rave_equivalence": args.rave,
+        "mirror_cache": args.mirror_cache,
+        "turn_decomposition": args.turn_decomposition,
+        "node_limit": args.node_limit,
+        "memory_limit": int(args.memory_limit * 1024 * 1024) if args.memory_limit else None,
+        "prune": args.prune,
+        "value_weights": load_value_weights(args.value_weights) if args.value_mix else None,
+        "value_mix": args.value_mix,
+    }
+
+
+def parse_args(argv=None):
+    """Parses the analysis command line arguments."""
+    parser = argparse.ArgumentParser(prog="python -m analyse", description="Search a file of positions and stream the ranked moves as JSONL.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("positions", nargs="?", default=None, help="game record file to read positions from (see record.py)")
+    source.add_argument("--corpus", type=int, default=None, help="analyse this many benchmark corpus positions instead")
+    parser.add_argument("-o", "--output", default=None, help="write JSONL here instead of stdout")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--top", type=int, default=None, help="only output the top ranked moves")
+    parser.add_argument("--time", type=float, default=DEFAULT_SEARCH_TIME, help="search time per position in seconds")
+    parser.add_argument("--iterations", type=int, default=None, help="search iterations per position (overrides the time)")
+    parser.add_argument("--seed", type=int, default=None, help="search seed, with --iterations the output is reproducible")
+    parser.add_argument("--exploration", type=float, default=1.5, help="exploration constant")
+    parser.add_argument("--widening", type=float, default=None, help="progressive widening constant")
+    parser.add_argument("--prior-weight", type=float, default=0.0, help="progressive bias weight")
+    parser.add_argument("--rave", type=int, default=0, help="RAVE equivalence parameter")
+    parser.add_argument("--mirror-cache", action="store_true", help="generate moves with canonical_next_states")
+    parser.add_argument("--turn-decomposition", action="store_true", help="search with the turn decomposition tree")
+    parser.add_argument("--node-limit", type=int, default=None, help="maximum search tree nodes per worker")
+    parser.add_argument("--memory-limit", type=float, default=None, help="maximum estimated search tree memory per worker in MB")
+    parser.add_argument("--value-mix", type=float, default=0.0, help="share of each simulation result from the linear value function (0 to 1)")
+    parser.add_argument("--value-weights", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "value_weights.json"), help="value function weights file (see value.py)")
+    parser.add_argument("--prune", action="store_true", help="prune the least visited subtrees at a limit instead of no longer expanding")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Runs the analysis command line interface."""
+    args = parse_args(argv)
+    positions = read_positions(args.positions) if args.positions else corpus_positions(args.corpus)
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for analysis in analyse_positions(positions, search_options_from_args(args), args.workers):
+            if args.top is not None:
+                analysis["moves"] = analysis["moves"][:args.top]
+            output.write(json.dumps(analysis) + "\n")
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
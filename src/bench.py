@@ -0,0 +1,247 @@
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import concurrent.futures
+import multiprocessing
+import game
+from game import initialise_gamestate, is_game_over, next_states, apply_turn, sharp_quills, state_to_key, place_card, set_card_health
+from ai import run_mcts, rollout, get_draw_id_and_squirrel_drawable, set_drawn_and_apply_state
+
+# Constants.
+CORPUS_SIZE = 32
+CORPUS_SEED = 2024
+CORPUS_MAX_TURNS = 16
+DEFAULT_THRESHOLD = 0.10
+DEFAULT_SEARCH_TIME = 2.0
+QUICK_SEARCH_TIME = 0.5
+LATENCY_ITERATIONS = 300
+PORCUPINE = 12
+
+
+def benchmark_positions(count=CORPUS_SIZE, seed=CORPUS_SEED, max_turns=CORPUS_MAX_TURNS):
+    """
+    Returns a fixed corpus of count positions. Each position is a fresh game from initialise_gamestate
+    played forward a random number of turns (up to max_turns) with random moves, all drawn from a
+    random.Random(seed), so the same arguments always give the same positions.
+    """
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        state = initialise_gamestate(rng)
+        for _ in range(rng.randint(0, max_turns)):
+            draw_id, squirrel_drawable = get_draw_id_and_squirrel_drawable(state)
+            next_state = set_drawn_and_apply_state(state, *rng.choice(next_states(state["current_player_state"], state["current_player_hand"], True, draw_id, squirrel_drawable)))
+            if is_game_over(next_state["board_state"]):
+                break
+            state = next_state
+        positions.append(state)
+    return positions
+
+
+def sharp_quills_rows():
+    """Returns a pair of player states with a full health Porcupine in every lane, so that every
+       attack between them triggers the longest sharp quills chain."""
+    row = 0
+    for lane in range(game.CARD_COUNT):
+        row = set_card_health(place_card(row, PORCUPINE, lane), lane, game.MAX_CARD_HEALTH)
+    return row, row
+
+
+def time_calls(function, arguments, repeats=5, min_time=0.2):
+    """Calls function(*args) for every args in arguments, enough times to take at least min_time, and
+       returns the best calls per second over repeats runs (like timeit)."""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            for args in arguments:
+                function(*args)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops *= 2
+    best = elapsed
+    for _ in range(repeats - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            for args in arguments:
+                function(*args)
+        best = min(best, time.perf_counter() - start)
+    return loops * len(arguments) / best
+
+
+def cold_next_states(player_state, hand, canDraw, draw_id, squirrel_drawable):
+    """Calls next_states with an empty memo, so that the whole turn is generated."""
+    game.memo.clear()
+    return next_states(player_state, hand, canDraw, draw_id, squirrel_drawable)
+
+
+def micro_benchmarks(positions, quick=False):
+    """Runs the engine micro benchmarks over the corpus and returns {name: result}."""
+    min_time = 0.05 if quick else 0.2
+    repeats = 3 if quick else 5
+    generation_args = []
+    turn_args = []
+    for state in positions:
+        draw_id, squirrel_drawable = get_draw_id_and_squirrel_drawable(state)
+        generation_args.append((state["current_player_state"], state["current_player_hand"], True, draw_id, squirrel_drawable))
+        turn_args.append((state["current_player_state"], state["other_player_state"], state["board_state"]))
+    current_row, other_row = sharp_quills_rows()
+    quills_args = [(current_row, other_row, positions[0]["board_state"], card_index, 1) for card_index in range(game.CARD_COUNT)]
+    key_args = [(state,) for state in positions]
+    return {
+        "next_states": result(time_calls(cold_next_states, generation_args, repeats, min_time), "calls/s"),
+        "apply_turn": result(time_calls(apply_turn, turn_args, repeats, min_time), "calls/s"),
+        "sharp_quills_chain": result(time_calls(sharp_quills, quills_args, repeats, min_time), "calls/s"),
+        "state_to_key": result(time_calls(state_to_key, key_args, repeats, min_time), "calls/s"),
+    }
+
+
+def rollouts_per_second(positions, duration, seed=CORPUS_SEED):
+    """Runs seeded rollouts from the corpus positions in turn for duration seconds and returns rollouts per second."""
+    rng = random.Random(seed)
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        state = positions[count % len(positions)]
+        rollout(state["board_state"], state["current_player_state"], state["current_player_hand"], state["other_player_state"],
+                state["other_player_hand"], state["p0_draws"], state["p1_draws"], 0, rng=rng)
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def count_iterations(state, search_time, seed):
+    """Runs run_mcts for search_time seconds and returns the number of iterations (visits to the roots children)."""
+    children_visits, _ = run_mcts(state, search_time, seed=seed)
+    return sum(children_visits.values())
+
+
+def iterations_per_second(state, workers, search_time):
+    """Runs one search per worker process in parallel, like handle_ai_turn, and returns the total
+       iterations per second across all workers. Worker start up is excluded from the timing."""
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(count_iterations, [state] * workers, [0] * workers, range(workers)))
+        start = time.perf_counter()
+        total = sum(executor.map(count_iterations, [state] * workers, [search_time] * workers, range(workers)))
+        return total / (time.perf_counter() - start)
+
+
+def move_latency(positions, iterations=LATENCY_ITERATIONS):
+    """Returns the mean time in milliseconds of a seeded run_mcts with a fixed iteration budget over the positions."""
+    start = time.perf_counter()
+    for seed, state in enumerate(positions):
+        run_mcts(state, seed=seed, iterations=iterations)
+    return (time.perf_counter() - start) * 1000 / len(positions)
+
+
+def macro_benchmarks(positions, worker_counts, quick=False):
+    """Runs the search macro benchmarks and returns {name: result}."""
+    search_time = QUICK_SEARCH_TIME if quick else DEFAULT_SEARCH_TIME
+    results = {"rollouts": result(rollouts_per_second(positions, search_time), "rollouts/s")}
+    for workers in worker_counts:
+        results[f"mcts_iterations_{workers}_workers"] = result(iterations_per_second(positions[0], workers, search_time), "iterations/s")
+    latency_positions = positions[:4] if quick else positions[:8]
+    results["move_latency"] = result(move_latency(latency_positions), "ms", higher_is_better=False)
+    return results
+
+
+def result(value, unit, higher_is_better=True):
+    """Returns a benchmark result entry."""
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+
+def run_benchmarks(micro=True, macro=True, worker_counts=(1, 2, 4), quick=False):
+    """Runs the selected benchmarks over the fixed corpus and returns the JSON serialisable results."""
+    positions = benchmark_positions(CORPUS_SIZE // 4 if quick else CORPUS_SIZE)
+    results = {}
+    if micro:
+        results.update(micro_benchmarks(positions, quick))
+    if macro:
+        results.update(macro_benchmarks(positions, worker_counts, quick))
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "quick": quick,
+        "results": results,
+    }
+
+
+def compare_results(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compares the results of two runs and returns (rows, regressions). Each row is
+    (name, baseline value, current value, relative change), where a positive change is an improvement.
+    A benchmark regresses when its change is worse than -threshold. Benchmarks missing from either run are skipped.
+    """
+    rows = []
+    regressions = []
+    for name, entry in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None or not base["value"]:
+            continue
+        change = (entry["value"] - base["value"]) / base["value"]
+        if not entry.get("higher_is_better", True):
+            change = -change
+        rows.append((name, base["value"], entry["value"], change))
+        if change < -threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def parse_worker_counts(text):
+    """Parses a comma separated list of worker counts, where N means os.cpu_count()."""
+    counts = []
+    for part in text.split(","):
+        count = os.cpu_count() if part.strip().upper() == "N" else int(part)
+        if count not in counts:
+            counts.append(count)
+    return counts
+
+
+def parse_args(argv=None):
+    """Parses the benchmark command line arguments."""
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Run the engine and search benchmarks.")
+    parser.add_argument("--micro", action="store_true", help="only run the micro benchmarks")
+    parser.add_argument("--macro", action="store_true", help="only run the macro benchmarks")
+    parser.add_argument("--quick", action="store_true", help="smaller corpus and shorter searches")
+    parser.add_argument("--workers", default="1,2,4,N", help="worker counts for the MCTS benchmark, N = CPU count (default: 1,2,4,N)")
+    parser.add_argument("-o", "--output", default=None, help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="compare against the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="fail if any benchmark is this much worse than the baseline (default: 0.10)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Runs the benchmark command line interface. Returns 1 if the baseline comparison finds a regression."""
+    args = parse_args(argv)
+    run_micro = args.micro or not args.macro
+    run_macro = args.macro or not args.micro
+    current = run_benchmarks(run_micro, run_macro, parse_worker_counts(args.workers), args.quick)
+    for name, entry in current["results"].items():
+        print(f"{name:32} {entry['value']:14.1f} {entry['unit']}")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(current, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        rows, regressions = compare_results(current, baseline, args.threshold)
+        print()
+        for name, base, value, change in rows:
+            flag = "  REGRESSION" if name in regressions else ""
+            print(f"{name:32} {base:14.1f} -> {value:14.1f} {change:+8.1%}{flag}")
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -1,3 +1,4 @@
+import os
 import random
 from data import cards, lookup_table_0blood, lookup_table_1blood, lookup_table_2blood, lookup_table_3blood, lookup_table_4blood, sigil_lookup, card_names
 
@@ -29,6 +30,14 @@ cards stored as list of tuples -> ID=1 => (attack=0, health=1, cost=0)
 # Global Variables
 memo = {}
 
+# Compiled card tables, filled in by compile_card_tables() when this module is imported.
+CARD_ATTACK = []        # card id -> attack
+CARD_BLOOD = []         # card id -> blood cost
+CARD_FLAGS = []         # card id -> bitmask of FLAG_* sigil flags
+ATTACK_HANDLERS = []    # card id -> tuple of on attack sigil handlers, in sigil_lookup order
+PLACEMENT_TABLE = []    # blood cost -> 4bit occupancy -> [(occupancy after sacrifice, placement index)]
+SPRINTER_SIGIL_BITS = [] # 16 bit half of a player state -> mask of the sigil bits of its Sprinter cards
+
 #  Getters and Setters
 # General Constants
 CARD_COUNT = 4
@@ -49,6 +58,21 @@ FLEDGLING = 2
 SHARP_QUILLS = 3
 SPRINTER = 0
 
+# Compiled sigil flags.
+# Each card id maps to a bitmask of these flags in CARD_FLAGS (see compile_card_tables).
+FLAG_TOUCH_OF_DEATH = 1 << 0
+FLAG_AIRBORNE = 1 << 1
+FLAG_BIFURCATED_STRIKE = 1 << 2
+FLAG_MIGHTY_LEAP = 1 << 3
+FLAG_WATERBORNE = 1 << 4
+FLAG_FLEDGLING = 1 << 5
+FLAG_SHARP_QUILLS = 1 << 6
+FLAG_SPRINTER = 1 << 7
+ON_ATTACK_FLAGS = {TOUCH_OF_DEATH: FLAG_TOUCH_OF_DEATH, AIRBORNE: FLAG_AIRBORNE, BIFURCATED_STRIKE: FLAG_BIFURCATED_STRIKE}
+SPECIAL_FLAGS = {MIGHTY_LEAP: FLAG_MIGHTY_LEAP, WATERBORNE: FLAG_WATERBORNE, FLEDGLING: FLAG_FLEDGLING, SHARP_QUILLS: FLAG_SHARP_QUILLS}
+ON_TURN_END_FLAGS = {SPRINTER: FLAG_SPRINTER}
+MAX_BLOOD = 4
+
 # Card bitwise constants
 CARD_SHIFT = 8
 CARD_MASK = 0b11111111
@@ -75,6 +99,20 @@ BOARD_PLAYER_0_DRAWN_SQUIRREL_SHIFT = 14
 BOARD_PLAYER_1_DRAWN_SQUIRREL_SHIFT = 18
 BOARD_PLAYER_DRAWN_SQUIRREL_MASK = 0b1111
 
+# Draw sequence constants
+DRAWS_LENGTH = 12
+
+# Row lookup tables
+# A player state is split into two 16 bit halves (2 cards each). Each table maps a half to
+# the 2 bit occupancy pattern of its cards, or to the number of cards in it.
+ROW_HALF_SHIFT = 16
+ROW_HALF_MASK = 0xFFFF
+ROW_HALF_OCCUPANCY = [(1 if (half >> CARD_ID_SHIFT) & CARD_ID_MASK else 0) | (2 if (half >> (CARD_SHIFT + CARD_ID_SHIFT)) & CARD_ID_MASK else 0) 
+                      for half in range(1 << ROW_HALF_SHIFT)]
+ROW_HALF_CARD_COUNT = [(occupancy & 1) + (occupancy >> 1) for occupancy in ROW_HALF_OCCUPANCY]
+# Maps a 4bit occupancy pattern to the tuple of occupied card indexes, in ascending order.
+OCCUPIED_LANES = [tuple(card_index for card_index in range(CARD_COUNT) if occupancy & (1 << card_index)) for occupancy in range(1 << CARD_COUNT)]
+
 
 
 # Helper Functions
@@ -133,13 +171,19 @@ def get_drawn_squirrels(board_state, player):
 def get_occupancy_4bit(player_state):
     """Returns a 4bit occupancy pattern for a given player state where
        where 1 = card occupying position and 0 = no card occupying."""
-    occupancy = 0
-    for tile_index in range(CARD_COUNT):
-        occupant_id = get_card_id(player_state, tile_index)
-        if occupant_id != 0:
-            occupancy |= (1 << tile_index)
+    return ROW_HALF_OCCUPANCY[player_state & ROW_HALF_MASK] | (ROW_HALF_OCCUPANCY[player_state >> ROW_HALF_SHIFT] << 2)
+
 
-    return occupancy
+def get_hand_card_ids(hand):
+    """Returns the card ids (excluding the empty id 0) that a player has at least one of in their hand, in 
+       ascending order. Only the non-zero 4 bit counts are visited, by repeatedly isolating the lowest set bit."""
+    card_ids = []
+    remaining = hand & ~HAND_CARD_COUNT_MASK
+    while remaining:
+        card_id = ((remaining & -remaining).bit_length() - 1) // HAND_CARD_COUNT_SHIFT
+        card_ids.append(card_id)
+        remaining &= ~(HAND_CARD_COUNT_MASK << (card_id * HAND_CARD_COUNT_SHIFT))
+    return card_ids
 
 
 def set_card_sigil_info(cards, card_index, info):
@@ -215,12 +259,7 @@ def set_card(state, card_index, tile_value):
 
 def count_current_player_cards(player_state):
     """Returns the number of cards that a player has in a given player state."""
-    card_count = 0
-    for card_index in range(CARD_COUNT):
-        occupant_id = get_card_id(player_state, card_index)
-        if occupant_id != 0:
-            card_count += 1
-    return card_count
+    return ROW_HALF_CARD_COUNT[player_state & ROW_HALF_MASK] + ROW_HALF_CARD_COUNT[player_state >> ROW_HALF_SHIFT]
 
 
 def remove_card(player_state, card_index):
@@ -265,6 +304,245 @@ def key_to_state(key):
 
 
 
+# Mirror Symmetry
+# Lanes 0-3 are treated symmetrically by the rules, except that a Sprinter's direction is stored
+# in its sigil bit, which flips under reflection. Note that mirror images are only strategically
+# equivalent up to the left to right order in which apply_turn resolves attacks and the fixed
+# starting direction of newly placed Sprinters, so canonical states are an approximation when used
+# as keys for values. canonical_next_states is exact. For that reason the transposition table of MCTS,
+# tree snapshots and game records are keyed by exact states and offer no canonical option: sharing
+# statistics between mirror images would bias the search, and snapshots and records must replay exactly.
+
+def reverse_card_order(player_state):
+    """Returns the player state with its card positions reversed (0 <-> 3, 1 <-> 2), card data unchanged."""
+    return (((player_state & 0xFF) << 24) | ((player_state & 0xFF00) << 8) 
+            | ((player_state >> 8) & 0xFF00) | (player_state >> 24))
+
+
+def mirror_player_state(player_state):
+    """Returns the left-right mirror image of a player state, with positions reversed and the
+       direction bit of every Sprinter flipped so that it keeps running towards the same side."""
+    reversed_state = reverse_card_order(player_state)
+    return reversed_state ^ SPRINTER_SIGIL_BITS[reversed_state & ROW_HALF_MASK] ^ (SPRINTER_SIGIL_BITS[reversed_state >> ROW_HALF_SHIFT] << ROW_HALF_SHIFT)
+
+
+def canonical_player_state(player_state):
+    """Returns (canonical_state, mirrored) where canonical_state is the smaller of a player state
+       and its mirror image, and mirrored is True if the mirror image was chosen."""
+    mirrored_state = mirror_player_state(player_state)
+    if mirrored_state < player_state:
+        return mirrored_state, True
+    return player_state, False
+
+
+def mirror_state(state):
+    """Returns a copy of a state with both player states mirrored."""
+    mirrored = dict(state)
+    mirrored["current_player_state"] = mirror_player_state(state["current_player_state"])
+    mirrored["other_player_state"] = mirror_player_state(state["other_player_state"])
+    return mirrored
+
+
+def canonical_state(state):
+    """Returns the one of a state and its mirror image whose (current, other) player states
+       compare smaller, so that both map to the same state."""
+    mirrored = mirror_state(state)
+    if (mirrored["current_player_state"], mirrored["other_player_state"]) < (state["current_player_state"], state["other_player_state"]):
+        return mirrored
+    return state
+
+
+def canonical_state_key(state):
+    """Given a state, returns a key shared with its mirror image, for use in opt-in caches."""
+    return state_to_key(canonical_state(state))
+
+
+def canonical_next_states(player_state, hand, canDraw, draw_id, squirrel_drawable):
+    """
+    A drop in replacement for next_states that generates the moves of mirror images only once.
+
+    If the player state has no Sprinter on it, move generation is exactly mirror symmetric: newly 
+    placed Sprinters start with a direction bit of 0 either way, so reversing the card order of each
+    result maps the canonical results back. The first time a non-canonical state is seen, its results
+    are mapped from next_states of its canonical form rather than generated, and stored in memo under
+    its own key, so later calls are answered by memo like any other state. Canonical states and player
+    states with a Sprinter are passed straight to next_states.
+
+    The results are the same set as next_states returns, but may be in a different order.
+    """
+    reversed_state = reverse_card_order(player_state)
+    if reversed_state >= player_state or mirror_player_state(player_state) != reversed_state:
+        return next_states(player_state, hand, canDraw, draw_id, squirrel_drawable)
+    state_hash = (player_state, hand, canDraw, draw_id, squirrel_drawable)
+    results = memo.get(state_hash)
+    if results is None:
+        results = [(reverse_card_order(new_state), new_hand, id, sd) for new_state, new_hand, id, sd in next_states(reversed_state, hand, canDraw, draw_id, squirrel_drawable)]
+        memo[state_hash] = results
+    return results
+
+
+# Zobrist Hashing
+# Every feature of a state (each card byte in each lane of each player, each hand count, the health,
+# the turn bit, each draw counter and each entry of the draw sequences) is given a random 64 bit key,
+# and a state hashes to the XOR of the keys of its features. Player states and hands are keyed by
+# player id rather than by current/other, so switching players only toggles the turn key, and a move 
+# only has to XOR out the old and XOR in the new keys of the features that changed. The keys come from
+# a fixed seed so that every process agrees on them.
+ZOBRIST_SEED = 0x1A5C4
+ZOBRIST_DEBUG = os.environ.get("INSCRYPTION_ZOBRIST_DEBUG", "") not in ("", "0")
+zobrist_random = random.Random(ZOBRIST_SEED)
+# player -> card index -> card byte (0 for an empty tile)
+ZOBRIST_CARDS = [[[0] + [zobrist_random.getrandbits(64) for _ in range(CARD_MASK)] for _ in range(CARD_COUNT)] for _ in range(2)]
+# player -> card id -> count (0 for no cards)
+ZOBRIST_HAND = [[[0] + [zobrist_random.getrandbits(64) for _ in range(MAX_CARD_COUNT)] for _ in range(CARD_ID_MASK + 1)] for _ in range(2)]
+ZOBRIST_HEALTH = [zobrist_random.getrandbits(64) for _ in range(BOARD_HEALTH_MASK + 1)]
+ZOBRIST_TURN = zobrist_random.getrandbits(64)
+# board draw counter shift -> count
+ZOBRIST_DRAWN = {shift: [zobrist_random.getrandbits(64) for _ in range(BOARD_PLAYER_DRAWN_RANDOM_MASK + 1)]
+                 for shift in (BOARD_PLAYER_0_DRAWN_RANDOM_SHIFT, BOARD_PLAYER_1_DRAWN_RANDOM_SHIFT, 
+                               BOARD_PLAYER_0_DRAWN_SQUIRREL_SHIFT, BOARD_PLAYER_1_DRAWN_SQUIRREL_SHIFT)}
+# player -> draw index -> card id
+ZOBRIST_DRAWS = [[[zobrist_random.getrandbits(64) for _ in range(CARD_ID_MASK + 1)] for _ in range(DRAWS_LENGTH)] for _ in range(2)]
+del zobrist_random
+
+# Debug mode only: maps every hash checked by zobrist_check to the state_to_key of its state.
+zobrist_seen = {}
+
+
+def zobrist_row(player, player_state):
+    """Returns the hash of the cards on a player state, for the given player id."""
+    keys = ZOBRIST_CARDS[player]
+    return (keys[0][player_state & CARD_MASK] ^ keys[1][(player_state >> CARD_SHIFT) & CARD_MASK]
+            ^ keys[2][(player_state >> (2 * CARD_SHIFT)) & CARD_MASK] ^ keys[3][(player_state >> (3 * CARD_SHIFT)) & CARD_MASK])
+
+
+def zobrist_hand(player, hand):
+    """Returns the hash of the card counts in a hand, for the given player id."""
+    keys = ZOBRIST_HAND[player]
+    h = 0
+    for card_id in range(CARD_ID_MASK + 1):
+        count = (hand >> (card_id * HAND_CARD_COUNT_SHIFT)) & HAND_CARD_COUNT_MASK
+        if count:
+            h ^= keys[card_id][count]
+    return h
+
+
+def zobrist_board(board_state):
+    """Returns the hash of the health, turn and draw counters of a board state."""
+    h = ZOBRIST_HEALTH[board_state & BOARD_HEALTH_MASK]
+    if (board_state >> BOARD_CURRENT_PLAYER_SHIFT) & BOARD_CURRENT_PLAYER_MASK:
+        h ^= ZOBRIST_TURN
+    for shift, keys in ZOBRIST_DRAWN.items():
+        h ^= keys[(board_state >> shift) & BOARD_PLAYER_DRAWN_RANDOM_MASK]
+    return h
+
+
+def zobrist_draws(player, draws):
+    """Returns the hash of a players random draw sequence."""
+    keys = ZOBRIST_DRAWS[player]
+    h = 0
+    for draw_index, card_id in enumerate(draws[:DRAWS_LENGTH]):
+        h ^= keys[draw_index][card_id]
+    return h
+
+
+def zobrist_hash(state):
+    """Returns the full 64 bit Zobrist hash of a state, computed from scratch."""
+    board_state = state["board_state"]
+    current_player = get_current_player(board_state)
+    other_player = 1 - current_player
+    return (zobrist_board(board_state)
+            ^ zobrist_row(current_player, state["current_player_state"]) ^ zobrist_row(other_player, state["other_player_state"])
+            ^ zobrist_hand(current_player, state["current_player_hand"]) ^ zobrist_hand(other_player, state["other_player_hand"])
+            ^ zobrist_draws(0, state["p0_draws"]) ^ zobrist_draws(1, state["p1_draws"]))
+
+
+def zobrist_update_row(h, player, old_state, new_state):
+    """Updates a hash for a player state change, such as one made by play_card, place_card, 
+       remove_card, set_card_health or move_card. Only the changed tiles are rehashed."""
+    changed = old_state ^ new_state
+    keys = ZOBRIST_CARDS[player]
+    card_index = 0
+    while changed:
+        if changed & CARD_MASK:
+            shift = card_index * CARD_SHIFT
+            h ^= keys[card_index][(old_state >> shift) & CARD_MASK] ^ keys[card_index][(new_state >> shift) & CARD_MASK]
+        changed >>= CARD_SHIFT
+        card_index += 1
+    return h
+
+
+def zobrist_update_hand(h, player, old_hand, new_hand):
+    """Updates a hash for a hand change, such as one made by play_card or draw_squirrel.
+       Only the changed card counts are rehashed."""
+    changed = old_hand ^ new_hand
+    keys = ZOBRIST_HAND[player]
+    while changed:
+        card_id = ((changed & -changed).bit_length() - 1) // HAND_CARD_COUNT_SHIFT
+        shift = card_id * HAND_CARD_COUNT_SHIFT
+        h ^= keys[card_id][(old_hand >> shift) & HAND_CARD_COUNT_MASK] ^ keys[card_id][(new_hand >> shift) & HAND_CARD_COUNT_MASK]
+        changed &= ~(HAND_CARD_COUNT_MASK << shift)
+    return h
+
+
+def zobrist_update_board(h, old_board_state, new_board_state):
+    """Updates a hash for a board state change, such as one made by set_health, set_drawn_cards,
+       set_drawn_squirrels or the turn flip of switch_player. Only the changed fields are rehashed."""
+    changed = old_board_state ^ new_board_state
+    if changed & BOARD_HEALTH_MASK:
+        h ^= ZOBRIST_HEALTH[old_board_state & BOARD_HEALTH_MASK] ^ ZOBRIST_HEALTH[new_board_state & BOARD_HEALTH_MASK]
+    if (changed >> BOARD_CURRENT_PLAYER_SHIFT) & BOARD_CURRENT_PLAYER_MASK:
+        h ^= ZOBRIST_TURN
+    if changed >> BOARD_PLAYER_0_DRAWN_RANDOM_SHIFT:
+        for shift, keys in ZOBRIST_DRAWN.items():
+            if (changed >> shift) & BOARD_PLAYER_DRAWN_RANDOM_MASK:
+                h ^= keys[(old_board_state >> shift) & BOARD_PLAYER_DRAWN_RANDOM_MASK] ^ keys[(new_board_state >> shift) & BOARD_PLAYER_DRAWN_RANDOM_MASK]
+    return h
+
+
+def zobrist_update_state(h, old_state, new_state):
+    """
+    Given the hash of old_state, returns the hash of new_state by rehashing only what changed.
+
+    Both states are expected to share their draw sequences (as all states within a game do). 
+    The current player of each state is read from its own board state, so this also covers 
+    switch_player, which only flips the turn key.
+    """
+    old_board_state = old_state["board_state"]
+    new_board_state = new_state["board_state"]
+    old_player = get_current_player(old_board_state)
+    new_player = get_current_player(new_board_state)
+    if old_player == new_player:
+        old_rows = (old_state["current_player_state"], old_state["other_player_state"])
+        old_hands = (old_state["current_player_hand"], old_state["other_player_hand"])
+    else:
+        old_rows = (old_state["other_player_state"], old_state["current_player_state"])
+        old_hands = (old_state["other_player_hand"], old_state["current_player_hand"])
+    h = zobrist_update_board(h, old_board_state, new_board_state)
+    h = zobrist_update_row(h, new_player, old_rows[0], new_state["current_player_state"])
+    h = zobrist_update_row(h, 1 - new_player, old_rows[1], new_state["other_player_state"])
+    h = zobrist_update_hand(h, new_player, old_hands[0], new_state["current_player_hand"])
+    h = zobrist_update_hand(h, 1 - new_player, old_hands[1], new_state["other_player_hand"])
+    return h
+
+
+def zobrist_check(h, state):
+    """
+    Collision check for debug mode (INSCRYPTION_ZOBRIST_DEBUG=1). Raises a ValueError if h is 
+    not the full hash of state (an incremental update went wrong), or if h was previously checked 
+    against a different state (a hash collision). Every checked hash is remembered in zobrist_seen.
+    """
+    full_hash = zobrist_hash(state)
+    if h != full_hash:
+        raise ValueError(f"Incremental Zobrist hash {h:#018x} does not match full hash {full_hash:#018x}")
+    key = state_to_key(state)
+    seen_key = zobrist_seen.setdefault(h, key)
+    if seen_key != key:
+        raise ValueError(f"Zobrist hash collision on {h:#018x} between {seen_key} and {key}")
+    return h
+
+
+
 #   Game Functions
 
 def play_card(player_state, hand, card_id, card_index):
@@ -293,8 +571,9 @@ def move_card(player_state, from_index, to_index):
     return player_state
 
 
-def initialise_gamestate():
-    """Initialises the state dictionary for future use."""
+def initialise_gamestate(rng=random):
+    """Initialises the state dictionary for future use, drawing the random card sequences 
+       from rng (defaults to the global random module)."""
     health = 10
     turn = 0
     p0_drawn = 2
@@ -306,8 +585,8 @@ def initialise_gamestate():
     hand_p0_state = 0
     hand_p1_state = 0
     board_state = (health) | (turn << BOARD_CURRENT_PLAYER_SHIFT) | (p0_drawn << BOARD_PLAYER_0_DRAWN_RANDOM_SHIFT) | (p1_drawn << BOARD_PLAYER_1_DRAWN_RANDOM_SHIFT) | (p0_squirrels_drawn << BOARD_PLAYER_0_DRAWN_SQUIRREL_SHIFT) | (p1_squirrels_drawn << BOARD_PLAYER_1_DRAWN_SQUIRREL_SHIFT)
-    p0_draws = [random.randint(3, len(card_names)) for _ in range(12)]  # Only needs 10 random card id's : 12 added for good luck.
-    p1_draws = [random.randint(3, len(card_names)) for _ in range(12)]  # ^
+    p0_draws = [rng.randint(3, len(card_names)) for _ in range(DRAWS_LENGTH)]  # Only needs 10 random card id's : 12 added for good luck.
+    p1_draws = [rng.randint(3, len(card_names)) for _ in range(DRAWS_LENGTH)]  # ^
     hand_p0_state = set_card_count(hand_p0_state, 1, 1)
     hand_p1_state = set_card_count(hand_p1_state, 1, 1)
     for x in range(2):
@@ -415,20 +694,15 @@ def next_states(player_state, hand, canDraw, draw_id, squirrel_drawable):
 
     for (temp_player_state_option, temp_hand_option, id, sd) in ns:
         starting_occupancy = get_occupancy_4bit(temp_player_state_option)
-        for card_id in range(1, len(cards)):
-            card_count = get_card_count(temp_hand_option, card_id)
-            if card_count > 0:
-                blood = cards[card_id][2]
-                if blood <= max_blood:
-                    lookup_table = lookup_table_0blood if blood == 0 else lookup_table_1blood if blood == 1 else lookup_table_2blood if blood == 2 else lookup_table_3blood if blood == 3 else lookup_table_4blood
-
-                    lookup = lookup_table[starting_occupancy]
-                    for (new_occupancy, placement_index) in lookup:
-                        temp_player_state = remove_cards_in_difference(temp_player_state_option, starting_occupancy, new_occupancy)
-                        temp_player_state, temp_hand = play_card(temp_player_state, temp_hand_option, card_id, placement_index)
-
-                        states = next_states(temp_player_state, temp_hand, False, id, sd)
-                        child_states.extend(states)
+        for card_id in get_hand_card_ids(temp_hand_option):
+            blood = CARD_BLOOD[card_id]
+            if blood <= max_blood:
+                for (new_occupancy, placement_index) in PLACEMENT_TABLE[blood][starting_occupancy]:
+                    temp_player_state = remove_cards_in_difference(temp_player_state_option, starting_occupancy, new_occupancy)
+                    temp_player_state, temp_hand = play_card(temp_player_state, temp_hand_option, card_id, placement_index)
+
+                    states = next_states(temp_player_state, temp_hand, False, id, sd)
+                    child_states.extend(states)
     ns.extend(child_states)
     unique_children = list(set(ns))
     memo[state_hash] = unique_children  
@@ -439,7 +713,7 @@ def touch_of_death(current_player_state, other_player_state, board_state, card,
     """Overrides the base attack calculation in apply_turn so that if a card with this sigil
        attacks another card it kills it, else it changes the health by its base amount of damage."""
     other_card = get_card_id(other_player_state, card)
-    if other_card and WATERBORNE not in sigil_lookup[other_card][1]:
+    if other_card and not CARD_FLAGS[other_card] & FLAG_WATERBORNE:
         other_player_state = remove_card(other_player_state, card)
     else:
         health = get_health(board_state)
@@ -472,7 +746,7 @@ def airborne(current_player_state, other_player_state, board_state, card, attack
     """Overrides the base attack calculation in apply_turn so that this card only directly 
        attacks either the opponent or other cards with the mighty leap sigil."""
     other_card = get_card_id(other_player_state, card)
-    if other_card and MIGHTY_LEAP in sigil_lookup[other_card][1]:
+    if other_card and CARD_FLAGS[other_card] & FLAG_MIGHTY_LEAP:
         other_health = get_card_health(other_player_state, card)
         if other_health > attack:
             other_player_state = set_card_health(other_player_state, card, other_health-attack)
@@ -494,7 +768,7 @@ def bifurcated_strike(current_player_state, other_player_state, board_state, car
         positions.append(card+1)
     for position in positions:
         other_card = get_card_id(other_player_state, position)
-        if other_card and AIRBORNE not in sigil_lookup[other_card][1]:
+        if other_card and not CARD_FLAGS[other_card] & FLAG_WATERBORNE:
             other_health = get_card_health(other_player_state, position)
             if other_health > attack:
                 other_player_state = set_card_health(other_player_state, position, other_health-attack)
@@ -514,7 +788,7 @@ def sharp_quills(current_player_state, other_player_state, board_state, card, at
     other_health = get_card_health(other_player_state, card)
     if other_health > attack:
         other_player_state = set_card_health(other_player_state, card, other_health-attack)
-        if SHARP_QUILLS in sigil_lookup[get_card_id(current_player_state, card)][1]:
+        if CARD_FLAGS[get_card_id(current_player_state, card)] & FLAG_SHARP_QUILLS:
             while True:
                 if get_card_health(current_player_state, card) > 1:
                     current_player_state = set_card_health(current_player_state, card, get_card_health(current_player_state, card)-1)
@@ -542,27 +816,19 @@ def sharp_quills(current_player_state, other_player_state, board_state, card, at
 def apply_turn(current_player_state, other_player_state, board_state):
     """Given a current_player_state, opponent state and board state, simulates the effects of
        applying (ending) their turn and the resulting player/card healths after attacking."""
-    c = []
-    for card in range(4):
-        if get_card_id(current_player_state, card):
-            c.append(card)
-    for card in c:
-        attack = cards[get_card_id(current_player_state, card)][0]
+    for card in OCCUPIED_LANES[get_occupancy_4bit(current_player_state)]:
+        card_id = get_card_id(current_player_state, card)
+        attack = CARD_ATTACK[card_id]
         if attack != 0:
-            attack_sigils = sigil_lookup[get_card_id(current_player_state, card)][0]
-            if attack_sigils:
-                for sigil in attack_sigils:
-                    if sigil == TOUCH_OF_DEATH:
-                        current_player_state, other_player_state, board_state = touch_of_death(current_player_state, other_player_state, board_state, card, attack) 
-                    elif sigil == AIRBORNE:
-                        current_player_state, other_player_state, board_state = airborne(current_player_state, other_player_state, board_state, card, attack) 
-                    elif sigil == BIFURCATED_STRIKE:
-                        current_player_state, other_player_state, board_state = bifurcated_strike(current_player_state, other_player_state, board_state, card, attack) 
+            attack_handlers = ATTACK_HANDLERS[card_id]
+            if attack_handlers:
+                for handler in attack_handlers:
+                    current_player_state, other_player_state, board_state = handler(current_player_state, other_player_state, board_state, card, attack)
             else:
                 other_card = get_card_id(other_player_state, card)
-                if other_card and AIRBORNE not in sigil_lookup[other_card][1]:
+                if other_card and not CARD_FLAGS[other_card] & FLAG_WATERBORNE:
                     other_health = get_card_health(other_player_state, card)
-                    if SHARP_QUILLS in sigil_lookup[other_card][1]:
+                    if CARD_FLAGS[other_card] & FLAG_SHARP_QUILLS:
                         current_player_state, other_player_state, board_state = sharp_quills(current_player_state, other_player_state, board_state, card, attack)                            
                     elif other_health > attack:
                         other_player_state = set_card_health(other_player_state, card, other_health-attack)
@@ -571,13 +837,10 @@ def apply_turn(current_player_state, other_player_state, board_state):
                 else:
                     health = get_health(board_state)
                     board_state = set_health(board_state, (health - attack) if get_current_player(board_state) == 0 else (health + attack))
-        on_turn_end_sigils = sigil_lookup[get_card_id(current_player_state, card)][2]
-        for sigil in on_turn_end_sigils:
-            if sigil == SPRINTER:
-                current_player_state = sprinter(current_player_state, card) 
-    for x in range(CARD_COUNT):
-        card_id = get_card_id(other_player_state, x)
-        if card_id and FLEDGLING in sigil_lookup[card_id][1]:
+        if CARD_FLAGS[get_card_id(current_player_state, card)] & FLAG_SPRINTER:
+            current_player_state = sprinter(current_player_state, card)
+    for x in OCCUPIED_LANES[get_occupancy_4bit(other_player_state)]:
+        if CARD_FLAGS[get_card_id(other_player_state, x)] & FLAG_FLEDGLING:
             other_player_state = place_card(other_player_state, 2, x)
     return current_player_state, other_player_state, board_state
 
@@ -585,4 +848,47 @@ def apply_turn(current_player_state, other_player_state, board_state):
 def is_game_over(board_state):
     """Returns True if either player has died, else False"""
     if get_health(board_state) <= 0 or get_health(board_state) >= 20:
-        return True
\ No newline at end of file
+        return True
+
+
+def get_winner(board_state):
+    """Returns the winning player (0,1) of a finished game, or None if the game is not over."""
+    if not is_game_over(board_state):
+        return None
+    # The player who ended the final turn won, and the turn has since passed to the loser.
+    return 1 - get_current_player(board_state)
+
+
+def compile_card_tables():
+    """
+    Compiles cards, sigil_lookup and the blood cost lookup tables from data.py into the flat
+    tables used by next_states and apply_turn, so that sigil lists are not scanned during play.
+
+    CARD_ATTACK and CARD_BLOOD hold each card's attack and blood cost, CARD_FLAGS a bitmask of its
+    FLAG_* sigils and ATTACK_HANDLERS the handler functions of its on attack sigils. PLACEMENT_TABLE
+    is indexed by blood cost then 4bit occupancy, with an empty list where no placement is possible.
+    The tables are filled in place, so references imported from this module stay valid.
+    """
+    handlers = {TOUCH_OF_DEATH: touch_of_death, AIRBORNE: airborne, BIFURCATED_STRIKE: bifurcated_strike}
+    CARD_ATTACK[:] = [attack for attack, _, _ in cards]
+    CARD_BLOOD[:] = [blood for _, _, blood in cards]
+    CARD_FLAGS[:] = []
+    ATTACK_HANDLERS[:] = []
+    for on_attack_sigils, special_sigils, on_turn_end_sigils in sigil_lookup:
+        flags = 0
+        for sigil in on_attack_sigils:
+            flags |= ON_ATTACK_FLAGS[sigil]
+        for sigil in special_sigils:
+            flags |= SPECIAL_FLAGS[sigil]
+        for sigil in on_turn_end_sigils:
+            flags |= ON_TURN_END_FLAGS[sigil]
+        CARD_FLAGS.append(flags)
+        ATTACK_HANDLERS.append(tuple(handlers[sigil] for sigil in on_attack_sigils))
+    lookup_tables = [lookup_table_0blood, lookup_table_1blood, lookup_table_2blood, lookup_table_3blood, lookup_table_4blood]
+    PLACEMENT_TABLE[:] = [[lookup_tables[blood].get(occupancy, []) for occupancy in range(1 << CARD_COUNT)] for blood in range(MAX_BLOOD + 1)]
+    sprinter_bits = [1 if card_id < len(CARD_FLAGS) and CARD_FLAGS[card_id] & FLAG_SPRINTER else 0 for card_id in range(CARD_ID_MASK + 1)]
+    SPRINTER_SIGIL_BITS[:] = [sprinter_bits[(half >> CARD_ID_SHIFT) & CARD_ID_MASK] | (sprinter_bits[(half >> (CARD_SHIFT + CARD_ID_SHIFT)) & CARD_ID_MASK] << CARD_SHIFT)
+                              for half in range(1 << ROW_HALF_SHIFT)]
+
+
+compile_card_tables()
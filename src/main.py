@@ -1,12 +1,17 @@
+import os
 import sys
 import time
+import random
 import concurrent.futures
 import threading
 import queue
 import multiprocessing
 from game import (get_card_id, get_current_player, get_drawn_cards, switch_player, is_game_over, initialise_gamestate, get_drawn_squirrels, play_card, apply_turn, draw_squirrel,
-                set_card_count, get_card_count, set_drawn_squirrels, set_drawn_cards, count_current_player_cards, remove_card, state_to_key, key_to_state)
-from ai import run_mcts
+                set_card_count, get_card_count, set_drawn_squirrels, set_drawn_cards, count_current_player_cards, remove_card)
+from ai import run_mcts, encode_move, apply_move, merge_metrics, write_metrics, merge_visits, gil_disabled, load_value_weights, most_visited_move
+from remote import remote_search, parse_addresses
+from profiling import profile_dir, turn_profile_path, worker_profile_paths, profiled_call, merge_profiles
+from record import RecordWriter
 from data import cards
 
 
@@ -101,28 +106,68 @@ def handle_ai_turn(state, player_efficiency_rates):
     simulation from a given state. After these return, it normalises the visits for all child 
     states of the root and calculates their overall efficiency. It then averages the values in player 
     efficiency rates and attempts to choose a move from the roots children with the same or a
-    slightly higher efficiency rating (if one exists).
+    slightly higher efficiency rating (if one exists). Each process is given its own seed, so that
+    forked workers do not all repeat the same random playouts.
 
-    It returns this state and a dictionary containing the roots children and their subsequent children.
+    Every worker also returns its search metrics (see SearchMetrics). A summary of the merged metrics
+    is printed, and if the INSCRYPTION_METRICS_FILE environment variable is set, the per worker and 
+    merged metrics of the turn are appended to that file as one JSON line. If INSCRYPTION_PROFILE_DIR 
+    is set, every worker search is run under cProfile and the worker profiles are merged into one 
+    pstats file per turn in that directory (see profiling.py). The size of each workers tree can be 
+    capped with the INSCRYPTION_NODE_LIMIT, INSCRYPTION_MEMORY_LIMIT and INSCRYPTION_PRUNE variables 
+    (see search_limits), and leaves can be evaluated with the linear value function by setting 
+    INSCRYPTION_VALUE_MIX (see value_options).
+
+    If INSCRYPTION_WORKERS is set to a list of host:port worker addresses (see remote.py), the search 
+    runs on those workers instead, with 4 searches each and the same tree limits and value options. 
+    Metrics and profiles stay on the workers in that case, and if every worker fails the search falls back to the local processes.
+
+    On a free threaded CPython build without the GIL, the 4 workers are threads sharing a single tree
+    (see ParallelMCTS) instead of processes (see search_backend). Profiling is only available with processes.
+
+    It returns the move code of this state and a dictionary containing the move codes of the roots 
+    children and their subsequent children. Workers only send move codes back, so states are rebuilt 
+    with apply_move for the chosen move (and the visualised moves) only.
     """
     aggregated_visits = {}
     aggregated_submoves = {}
-    with concurrent.futures.ProcessPoolExecutor(max_workers=4) as executor:
-        futures = [executor.submit(run_mcts, state) for _ in range(4)]
-        for future in concurrent.futures.as_completed(futures):
-            child_visits, subchild_visits = future.result()
-            for key, visits in child_visits.items():
-                aggregated_visits[key] = aggregated_visits.get(key, 0) + visits
-            for child_key, subchild_dict in subchild_visits.items():
-                if child_key not in aggregated_submoves:
-                    aggregated_submoves[child_key] = {}
-                for subchild_key, subchild_visits in subchild_dict.items():
-                    aggregated_submoves[child_key][subchild_key] = aggregated_submoves[child_key].get(subchild_key, 0) + subchild_visits
+    worker_metrics = []
+    directory = None
+    options = {**search_limits(), **value_options()}
+    remote_workers = os.environ.get("INSCRYPTION_WORKERS")
+    if remote_workers:
+        try:
+            aggregated_visits, aggregated_submoves = remote_search(state, parse_addresses(remote_workers), seed=random.getrandbits(32), searches=4, 
+                                                                   report=print, options=options)
+        except ConnectionError as error:
+            print(f"{error}, searching locally")
+    if not aggregated_visits and search_backend() == "threads":
+        aggregated_visits, aggregated_submoves, metrics = run_mcts(state, seed=random.getrandbits(32), metrics=True, threads=4, **options)
+        worker_metrics.append(metrics)
+    elif not aggregated_visits:
+        directory = profile_dir()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=4) as executor:
+            seeds = [random.getrandbits(32) for _ in range(4)]
+            if directory:
+                profile_path = turn_profile_path(directory)
+                worker_paths = worker_profile_paths(profile_path, len(seeds))
+                futures = [executor.submit(profiled_call, path, run_mcts, state, seed=seed, metrics=True, **options) for path, seed in zip(worker_paths, seeds)]
+            else:
+                futures = [executor.submit(run_mcts, state, seed=seed, metrics=True, **options) for seed in seeds]
+            for future in concurrent.futures.as_completed(futures):
+                child_visits, subchild_visits, metrics = future.result()
+                worker_metrics.append(metrics)
+                merge_visits(aggregated_visits, aggregated_submoves, child_visits, subchild_visits)
     percentages = normalise_visits(aggregated_visits)
     target_avg = sum(player_efficiency_rates) / len(player_efficiency_rates)
     print(f"Number of rollouts: {sum(aggregated_visits.values())}")
     print(f"Target Average: {target_avg}")
-    best_move_key, best_move_visits = max(aggregated_visits.items(), key=lambda item: item[1])
+    if worker_metrics:
+        report_metrics(worker_metrics)
+    if directory:
+        merge_profiles(worker_paths, profile_path)
+        print(f"Profile: {profile_path}")
+    best_move_key, best_move_visits = most_visited_move(aggregated_visits)
     best_percentage = (best_move_visits / max(aggregated_visits.values())) * 100
     if best_percentage <= target_avg:
         chosen_key = best_move_key
@@ -132,6 +177,54 @@ def handle_ai_turn(state, player_efficiency_rates):
     return chosen_key, aggregated_submoves
 
 
+def search_backend():
+    """Returns the local search backend, "threads" or "processes". INSCRYPTION_SEARCH_BACKEND selects one 
+       explicitly, otherwise threads are used when the GIL is disabled and processes otherwise."""
+    backend = os.environ.get("INSCRYPTION_SEARCH_BACKEND")
+    if backend in ("threads", "processes"):
+        return backend
+    return "threads" if gil_disabled() else "processes"
+
+
+def search_limits():
+    """Returns the per worker tree limits for run_mcts set in the environment: INSCRYPTION_NODE_LIMIT 
+       (nodes), INSCRYPTION_MEMORY_LIMIT (megabytes) and INSCRYPTION_PRUNE (1 to prune the least 
+       visited subtrees at a limit rather than stop expanding)."""
+    node_limit = os.environ.get("INSCRYPTION_NODE_LIMIT")
+    memory_limit = os.environ.get("INSCRYPTION_MEMORY_LIMIT")
+    return {
+        "node_limit": int(node_limit) if node_limit else None,
+        "memory_limit": int(float(memory_limit) * 1024 * 1024) if memory_limit else None,
+        "prune": os.environ.get("INSCRYPTION_PRUNE", "0") not in ("", "0"),
+    }
+
+
+def value_options():
+    """Returns the value function options for run_mcts set in the environment: INSCRYPTION_VALUE_MIX 
+       (0 to 1, the share of each simulation result taken from the value function) and 
+       INSCRYPTION_VALUE_WEIGHTS (the weights file, by default value_weights.json next to this file)."""
+    mix = float(os.environ.get("INSCRYPTION_VALUE_MIX") or 0)
+    if not mix:
+        return {}
+    path = os.environ.get("INSCRYPTION_VALUE_WEIGHTS") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "value_weights.json")
+    return {"value_weights": load_value_weights(path), "value_mix": mix}
+
+
+def report_metrics(worker_metrics):
+    """Prints a summary of the merged search metrics of an AI turn, and appends the per worker and 
+       merged metrics to the file named by INSCRYPTION_METRICS_FILE if it is set."""
+    merged = merge_metrics(worker_metrics)
+    print(f"Iterations/sec: {merged['iterations_per_second']:.0f}  Rollouts/sec: {merged['rollouts_per_second']:.0f}  "
+          f"Nodes: {merged['nodes']}  Depth: {merged['average_depth']:.1f} avg / {merged['max_depth']} max")
+    print(f"Rollout time: {merged['rollout_time']:.1f}s  Tree time: {merged['expansion_time']:.1f}s  "
+          f"Cache hit rate: {merged['cache_hit_rate']:.1%}  Rollout length: {merged['average_rollout_length']:.1f}  Stalemates: {merged['stalemates']}")
+    if merged["tree_bytes"] or merged["pruned"]:
+        print(f"Tree memory: {merged['tree_bytes'] / (1024 * 1024):.1f} MB  Pruned nodes: {merged['pruned']}")
+    path = os.environ.get("INSCRYPTION_METRICS_FILE")
+    if path:
+        write_metrics(path, {"timestamp": time.time(), "workers": worker_metrics, "total": merged})
+
+
 def get_submove_efficiencies(chosen_key, aggregated_submoves):
     """This calculates and returns the efficiencies of submoves for a chosen move."""
     submoves_for_chosen = aggregated_submoves.get(chosen_key, {})
@@ -163,15 +256,15 @@ def normalise_subvisits(visits):
     return norm
 
 
-def visualise_best_move(aggregated_submoves):
-    """Calculates the best and worst moves the human could have made and shows them on-screen for 3 seconds each."""
+def visualise_best_move(state, aggregated_submoves):
+    """Calculates the best and worst moves the human could have made from state and shows them on-screen for 3 seconds each."""
     human_efficiencies = { key: norm_eff for key, (raw, norm_eff) in aggregated_submoves.items() }
     best_human_key = max(human_efficiencies.items(), key=lambda x: x[1])[0]
     worst_human_key = min(human_efficiencies.items(), key=lambda x: x[1])[0]
-    best_human_state = key_to_state(best_human_key)
+    best_human_state = apply_move(state, best_human_key)
     gui.state = best_human_state
     time.sleep(3)
-    worst_human_state = key_to_state(worst_human_key)
+    worst_human_state = apply_move(state, worst_human_key)
     gui.state = worst_human_state
     time.sleep(3)
 
@@ -190,25 +283,48 @@ def update_player_efficiency_rates(aggregated_submoves, human_move_key, player_e
 
 
 def run_game(state, player_efficiency_rates, adaptive_mode, visualise_moves):
-    """This function controls the overall game loop, current_players, applying turns etc."""
-    while not is_game_over(state["board_state"]):
-        if not gui.running:
-            sys.exit()
-        gui.state = state
-        if get_current_player(state["board_state"]) == 0:
-            chosen_key, aggregated_submoves  = handle_ai_turn(state, player_efficiency_rates)
-            state = key_to_state(chosen_key)
-            aggregated_submoves = get_submove_efficiencies(chosen_key, aggregated_submoves)
-        else:
-            state = handle_draw_phase(state)
-            state = handle_play_phase(state)
-            state["current_player_state"], state["other_player_state"], state["board_state"] = apply_turn(state["current_player_state"], state["other_player_state"], state["board_state"])
-            state = switch_player(state)
-            if adaptive_mode:
-                player_efficiency_rates = update_player_efficiency_rates(aggregated_submoves, state_to_key(state), player_efficiency_rates)
-            if visualise_moves:
-                visualise_best_move(aggregated_submoves)
-                gui.state = state
+    """This function controls the overall game loop, current_players, applying turns etc. If the 
+       INSCRYPTION_RECORD_FILE environment variable is set, the game and every move of both players 
+       are appended to that game record file as they are played (see record.py), with the start time
+       as the game id."""
+    path = os.environ.get("INSCRYPTION_RECORD_FILE")
+    writer = RecordWriter(path) if path else None
+    game_id = int(time.time())
+    turn = 0
+    if writer:
+        writer.write_game(game_id, 0, state)
+        writer.flush()
+    try:
+        while not is_game_over(state["board_state"]):
+            if not gui.running:
+                sys.exit()
+            gui.state = state
+            start_state = dict(state)
+            move_start = time.time()
+            if get_current_player(state["board_state"]) == 0:
+                chosen_key, aggregated_submoves  = handle_ai_turn(state, player_efficiency_rates)
+                state = apply_move(state, chosen_key)
+                aggregated_submoves = get_submove_efficiencies(chosen_key, aggregated_submoves)
+                move = chosen_key
+            else:
+                state = handle_draw_phase(state)
+                state = handle_play_phase(state)
+                row = state["current_player_state"]
+                state["current_player_state"], state["other_player_state"], state["board_state"] = apply_turn(state["current_player_state"], state["other_player_state"], state["board_state"])
+                state = switch_player(state)
+                move = encode_move(start_state, row, state)
+                if adaptive_mode:
+                    player_efficiency_rates = update_player_efficiency_rates(aggregated_submoves, move, player_efficiency_rates)
+                if visualise_moves:
+                    visualise_best_move(start_state, aggregated_submoves)
+                    gui.state = state
+            if writer:
+                writer.write_turn(game_id, turn, start_state, move, search_time=time.time() - move_start)
+                writer.flush()
+            turn += 1
+    finally:
+        if writer:
+            writer.close()
     return state
 
 
@@ -0,0 +1,153 @@
+import os
+import sys
+import time
+import argparse
+import importlib
+import importlib.util
+import game
+from game import state_to_key
+from ai import HAS_BEEN_DRAWN, get_draw_id_and_squirrel_drawable
+from bench import benchmark_positions
+
+# Constants.
+DEFAULT_DEPTH = 2
+DEFAULT_POSITIONS = 8
+
+
+def load_engine(name):
+    """Returns an engine module given a module name (e.g. game) or the path of a .py file that provides
+       next_states, apply_turn, set_drawn_cards, set_drawn_squirrels, switch_player and is_game_over."""
+    if name.endswith(".py"):
+        module_name = "perft_engine_" + os.path.splitext(os.path.basename(name))[0]
+        spec = importlib.util.spec_from_file_location(module_name, name)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    return importlib.import_module(name)
+
+
+def successors(engine, state, generate=None):
+    """
+    Returns every state reachable from state in one turn with the given engine, like
+    next_states + set_drawn_and_apply_state but with every game function taken from engine.
+    generate overrides the engines next_states (e.g. with canonical_next_states).
+    """
+    generate = generate or engine.next_states
+    draw_id, squirrel_drawable = get_draw_id_and_squirrel_drawable(state)
+    states = []
+    for current_player_state, current_hand, random_draw, squirrel_draw in generate(state["current_player_state"], state["current_player_hand"], True, draw_id, squirrel_drawable):
+        board_state = state["board_state"]
+        if random_draw == HAS_BEEN_DRAWN:
+            board_state = engine.set_drawn_cards(board_state)
+        elif squirrel_draw == HAS_BEEN_DRAWN:
+            board_state = engine.set_drawn_squirrels(board_state)
+        current_player_state, other_state, board_state = engine.apply_turn(current_player_state, state["other_player_state"], board_state)
+        states.append(engine.switch_player({
+            "board_state": board_state,
+            "current_player_state": current_player_state,
+            "current_player_hand": current_hand,
+            "other_player_state": other_state,
+            "other_player_hand": state["other_player_hand"],
+            "p0_draws": state["p0_draws"],
+            "p1_draws": state["p1_draws"]
+        }))
+    return states
+
+
+def perft(state, depth, engine=game, generate=None, keep_keys=False):
+    """
+    Counts the distinct end of turn states reachable from state after 1 to depth turns. Each depth is
+    a set of distinct states, and finished games are not expanded further.
+
+    Returns:
+        counts (list): The number of distinct states at each depth from 1 to depth.
+        nodes (int): The total number of successor states generated (before removing duplicates).
+        levels (list): The set of state keys at each depth if keep_keys is set, else None.
+    """
+    frontier = {state_to_key(state): state}
+    counts = []
+    levels = [] if keep_keys else None
+    nodes = 0
+    for _ in range(depth):
+        next_frontier = {}
+        for current in frontier.values():
+            if engine.is_game_over(current["board_state"]):
+                continue
+            for next_state in successors(engine, current, generate):
+                nodes += 1
+                next_frontier.setdefault(state_to_key(next_state), next_state)
+        frontier = next_frontier
+        counts.append(len(frontier))
+        if keep_keys:
+            levels.append(set(frontier))
+    return counts, nodes, levels
+
+
+def cross_check(state, depth, engines, generators=(None, None)):
+    """
+    Runs perft with two engines (or generators) from state and returns None if every depth reaches the
+    same set of states, else (depth, keys only reached by the first, keys only reached by the second)
+    for the first depth that differs.
+    """
+    first = perft(state, depth, engines[0], generators[0], keep_keys=True)[2]
+    second = perft(state, depth, engines[1], generators[1], keep_keys=True)[2]
+    for level, (first_keys, second_keys) in enumerate(zip(first, second), 1):
+        if first_keys != second_keys:
+            return level, first_keys - second_keys, second_keys - first_keys
+    return None
+
+
+def parse_args(argv=None):
+    """Parses the perft command line arguments."""
+    parser = argparse.ArgumentParser(prog="python -m perft", description="Count distinct end of turn states to a given depth.")
+    parser.add_argument("-d", "--depth", type=int, default=DEFAULT_DEPTH, help="number of turns to search (default: 2)")
+    parser.add_argument("-n", "--positions", type=int, default=DEFAULT_POSITIONS, help="number of corpus positions (default: 8)")
+    parser.add_argument("--seed", type=int, default=None, help="corpus seed (default: the benchmark corpus)")
+    parser.add_argument("--engine", default="game", help="engine module name or .py path (default: game)")
+    parser.add_argument("--compare", default=None, help="cross-check against this engine module name or .py path")
+    parser.add_argument("--canonical", action="store_true", help="generate moves with canonical_next_states (cross-checked against next_states if --compare is not given)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Runs the perft command line interface. Returns 1 if a cross-check finds a difference."""
+    args = parse_args(argv)
+    engine = load_engine(args.engine)
+    generate = engine.canonical_next_states if args.canonical else None
+    positions = benchmark_positions(args.positions) if args.seed is None else benchmark_positions(args.positions, args.seed)
+    total_nodes = 0
+    total_time = 0
+    for index, state in enumerate(positions):
+        engine.memo.clear()
+        start = time.perf_counter()
+        counts, nodes, _ = perft(state, args.depth, engine, generate)
+        elapsed = time.perf_counter() - start
+        total_nodes += nodes
+        total_time += elapsed
+        depths = "  ".join(f"d{depth}={count}" for depth, count in enumerate(counts, 1))
+        print(f"position {index}: {depths}  nodes={nodes}  {nodes / elapsed if elapsed else 0:.0f} nodes/s")
+    print(f"total: {total_nodes} nodes in {total_time:.2f}s, {total_nodes / total_time if total_time else 0:.0f} nodes/s")
+
+    if args.compare or args.canonical:
+        engines = (engine, load_engine(args.compare) if args.compare else engine)
+        generators = (generate, None)
+        failures = 0
+        for index, state in enumerate(positions):
+            difference = cross_check(state, args.depth, engines, generators)
+            if difference:
+                failures += 1
+                depth, only_first, only_second = difference
+                print(f"position {index}: mismatch at depth {depth}, {len(only_first)} states only in the first engine, {len(only_second)} only in the second")
+                for key in list(only_first)[:3]:
+                    print(f"  first only:  {key[:5]}")
+                for key in list(only_second)[:3]:
+                    print(f"  second only: {key[:5]}")
+        if failures:
+            print(f"{failures} of {len(positions)} positions differ")
+            return 1
+        print(f"all {len(positions)} positions match")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+import os
+import time
+import pstats
+import cProfile
+
+"""
+Opt in profiling of the search. Each worker runs its run_mcts call under cProfile and dumps the
+profile to its own file, then the worker profiles of a turn are merged into a single pstats file.
+
+Profiling is enabled by setting INSCRYPTION_PROFILE_DIR to a directory (or with --profile in
+selfplay.py). The merged files can be read with python -m pstats, or viewed as a flame graph
+with e.g. snakeviz or flameprof.
+"""
+
+# Constants.
+PROFILE_DIR_VARIABLE = "INSCRYPTION_PROFILE_DIR"
+
+
+def profile_dir():
+    """Returns the profile directory from INSCRYPTION_PROFILE_DIR, creating it if needed, or None if profiling is off."""
+    directory = os.environ.get(PROFILE_DIR_VARIABLE)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return directory or None
+
+
+def turn_profile_path(directory, name=None):
+    """Returns the path of the merged profile of a turn, named after the current time unless name is given."""
+    return os.path.join(directory, f"{name or 'turn-' + time.strftime('%Y%m%d-%H%M%S')}.prof")
+
+
+def worker_profile_paths(path, workers):
+    """Returns the paths the workers of a turn dump their profiles to, next to the merged profile at path."""
+    base = os.path.splitext(path)[0]
+    return [f"{base}.worker{worker}.prof" for worker in range(workers)]
+
+
+def profiled_call(path, function, *args, **kwargs):
+    """Calls function(*args, **kwargs) under cProfile, dumps the profile to path and returns the result.
+       Module level, so it can be submitted to a process pool in place of function."""
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args, **kwargs)
+    finally:
+        profiler.dump_stats(path)
+
+
+def merge_profiles(paths, path, remove=True):
+    """Merges the profiles dumped at paths into a single pstats file at path, removing the worker
+       files unless remove is False. Returns the merged pstats.Stats, or None if no profile exists."""
+    paths = [worker_path for worker_path in paths if os.path.exists(worker_path)]
+    if not paths:
+        return None
+    stats = pstats.Stats(*paths)
+    stats.dump_stats(path)
+    if remove:
+        for worker_path in paths:
+            os.remove(worker_path)
+    return stats
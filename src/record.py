@@ -0,0 +1,215 @@
+import os
+import mmap
+import struct
+from game import DRAWS_LENGTH, get_current_player
+from ai import packed_move
+
+"""
+game record file =
+      (16 byte) - file header --- 8 byte magic, uint32 version, uint32 record size
+      (56 byte x N) - fixed size little endian records, appended as games are played
+
+game record =
+      uint8 kind (RECORD_GAME), 3 pad bytes, uint32 game, uint64 seed,
+      12 x uint8 player 0 draws, 12 x uint8 player 1 draws, 16 pad bytes
+
+turn record =
+      uint8 kind (RECORD_TURN), uint8 player to move, uint16 turn, uint32 game, uint32 board state,
+      uint32 player 0 state, uint32 player 1 state, uint64 player 0 hand, uint64 player 1 hand,
+      uint64 move code played, uint32 visits of the move, uint32 total root visits, float32 search seconds
+
+Player states and hands are stored by player id rather than as current/other. Every record has the
+same size, so record i is at FILE_HEADER_SIZE + i * RECORD_SIZE and the records of a file can be
+mapped as an array, e.g. numpy.memmap(path, dtype=numpy.dtype(RECORD_DTYPE), offset=FILE_HEADER_SIZE).
+"""
+
+# Constants.
+MAGIC = b"INSCREC\0"
+VERSION = 1
+FILE_HEADER_FORMAT = "<8sII"
+FILE_HEADER_SIZE = struct.calcsize(FILE_HEADER_FORMAT)
+MAX_GAME_ID = (1 << 32) - 1
+MAX_SEED = (1 << 64) - 1
+RECORD_GAME = 0
+RECORD_TURN = 1
+GAME_FORMAT = "<B3xIQ12s12s16x"
+TURN_FORMAT = "<BBHIIIIQQQIIf"
+RECORD_SIZE = struct.calcsize(TURN_FORMAT)
+TURN_FIELDS = ("kind", "player", "turn", "game", "board_state", "p0_state", "p1_state", "p0_hand", "p1_hand", "move", "visits", "rollouts", "search_time")
+# Field name -> (struct code, byte offset) within a turn record.
+TURN_OFFSETS = {name: (code, struct.calcsize("<" + TURN_FORMAT[1:1 + i])) for i, (name, code) in enumerate(zip(TURN_FIELDS, TURN_FORMAT[1:]))}
+# A numpy structured dtype description of a turn record (game records share the kind and game fields).
+RECORD_DTYPE = [("kind", "<u1"), ("player", "<u1"), ("turn", "<u2"), ("game", "<u4"), ("board_state", "<u4"),
+                ("p0_state", "<u4"), ("p1_state", "<u4"), ("p0_hand", "<u8"), ("p1_hand", "<u8"),
+                ("move", "<u8"), ("visits", "<u4"), ("rollouts", "<u4"), ("search_time", "<f4")]
+
+
+def pack_game(game, seed, state):
+    """Returns the game record for a game starting from state, with its seed and draw sequences. The 
+       game id must fit in 32 bits and the seed in 64 bits, else a ValueError is raised."""
+    if not 0 <= game <= MAX_GAME_ID:
+        raise ValueError(f"Game id {game} is outside 0 to {MAX_GAME_ID}")
+    if not 0 <= seed <= MAX_SEED:
+        raise ValueError(f"Seed {seed} is outside 0 to {MAX_SEED}")
+    return struct.pack(GAME_FORMAT, RECORD_GAME, game, seed, bytes(state["p0_draws"][:DRAWS_LENGTH]), bytes(state["p1_draws"][:DRAWS_LENGTH]))
+
+
+def pack_turn(game, turn, state, move, visits=0, rollouts=0, search_time=0.0):
+    """Returns the turn record for the move code move played from state, along with its search statistics."""
+    player = get_current_player(state["board_state"])
+    if player == 0:
+        rows = (state["current_player_state"], state["other_player_state"])
+        hands = (state["current_player_hand"], state["other_player_hand"])
+    else:
+        rows = (state["other_player_state"], state["current_player_state"])
+        hands = (state["other_player_hand"], state["current_player_hand"])
+    return struct.pack(TURN_FORMAT, RECORD_TURN, player, turn, game, state["board_state"], rows[0], rows[1],
+                       hands[0], hands[1], packed_move(move), visits, rollouts, search_time)
+
+
+def turn_to_state(record, draws):
+    """Given an unpacked turn record and the (p0_draws, p1_draws) of its game, returns the state before the move."""
+    _, player, _, _, board_state, p0_state, p1_state, p0_hand, p1_hand = record[:9]
+    rows = (p0_state, p1_state)
+    hands = (p0_hand, p1_hand)
+    return {
+        "board_state": board_state,
+        "current_player_state": rows[player],
+        "current_player_hand": hands[player],
+        "other_player_state": rows[1 - player],
+        "other_player_hand": hands[1 - player],
+        "p0_draws": list(draws[0]),
+        "p1_draws": list(draws[1])
+    }
+
+
+class RecordWriter:
+    """
+    Streaming, append only writer for game record files. Records are written as soon as they are
+    produced, so a crashed run keeps every completed record.
+
+    Attributes:
+        file (file): The underlying binary file, opened for appending.
+        games (int): The number of game records written by this writer.
+    """
+
+    def __init__(self, path):
+        """Opens path for appending, writing the file header if the file is new and checking it otherwise."""
+        self.file = open(path, "ab")
+        self.games = 0
+        if self.file.tell() == 0:
+            self.file.write(struct.pack(FILE_HEADER_FORMAT, MAGIC, VERSION, RECORD_SIZE))
+        else:
+            with open(path, "rb") as header_file:
+                check_header(header_file.read(FILE_HEADER_SIZE))
+
+    def write_game(self, game, seed, state):
+        """Appends the game record for a game starting from state."""
+        self.file.write(pack_game(game, seed, state))
+        self.games += 1
+
+    def write_turn(self, game, turn, state, move, visits=0, rollouts=0, search_time=0.0):
+        """Appends the turn record for a move played from state."""
+        self.file.write(pack_turn(game, turn, state, move, visits, rollouts, search_time))
+
+    def write_records(self, data):
+        """Appends already packed records, such as those returned by a worker process."""
+        if len(data) % RECORD_SIZE:
+            raise ValueError(f"Packed records must be a multiple of {RECORD_SIZE} bytes, got {len(data)}")
+        self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def check_header(header):
+    """Raises a ValueError if header is not a supported game record file header."""
+    if len(header) < FILE_HEADER_SIZE:
+        raise ValueError("Not a game record file: header is truncated")
+    magic, version, record_size = struct.unpack(FILE_HEADER_FORMAT, header[:FILE_HEADER_SIZE])
+    if magic != MAGIC:
+        raise ValueError("Not a game record file: bad magic")
+    if version != VERSION or record_size != RECORD_SIZE:
+        raise ValueError(f"Unsupported game record file version {version} with record size {record_size}")
+
+
+class RecordReader:
+    """
+    Memory mapped reader for game record files. Nothing is read until it is asked for, and records
+    are unpacked one at a time straight from the mapping, so files with millions of turns can be
+    scanned without holding them in memory.
+
+    Attributes:
+        path (str): The path of the record file.
+        count (int): The number of complete records in the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.count = max(0, size - FILE_HEADER_SIZE) // RECORD_SIZE
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        check_header(self.map[:FILE_HEADER_SIZE])
+
+    def __len__(self):
+        return self.count
+
+    def kind(self, index):
+        """Returns the kind (RECORD_GAME or RECORD_TURN) of record index."""
+        return self.map[FILE_HEADER_SIZE + index * RECORD_SIZE]
+
+    def __getitem__(self, index):
+        """Returns record index unpacked as a tuple, in GAME_FORMAT or TURN_FORMAT order."""
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        offset = FILE_HEADER_SIZE + index * RECORD_SIZE
+        if self.map[offset] == RECORD_GAME:
+            return struct.unpack_from(GAME_FORMAT, self.map, offset)
+        return struct.unpack_from(TURN_FORMAT, self.map, offset)
+
+    def column(self, name):
+        """Yields the value of one turn record field (see TURN_FIELDS) for every turn record, in file order."""
+        code, field_offset = TURN_OFFSETS[name]
+        field_format = "<" + code
+        data = self.map
+        for offset in range(FILE_HEADER_SIZE, FILE_HEADER_SIZE + self.count * RECORD_SIZE, RECORD_SIZE):
+            if data[offset] == RECORD_TURN:
+                yield struct.unpack_from(field_format, data, offset + field_offset)[0]
+
+    def turns(self):
+        """Yields every turn record as a tuple, in file order."""
+        data = self.map
+        for offset in range(FILE_HEADER_SIZE, FILE_HEADER_SIZE + self.count * RECORD_SIZE, RECORD_SIZE):
+            if data[offset] == RECORD_TURN:
+                yield struct.unpack_from(TURN_FORMAT, data, offset)
+
+    def games(self):
+        """Returns {game: (seed, (p0_draws, p1_draws))} for every game record."""
+        games = {}
+        data = self.map
+        for offset in range(FILE_HEADER_SIZE, FILE_HEADER_SIZE + self.count * RECORD_SIZE, RECORD_SIZE):
+            if data[offset] == RECORD_GAME:
+                _, game, seed, p0_draws, p1_draws = struct.unpack_from(GAME_FORMAT, data, offset)
+                games[game] = (seed, (list(p0_draws), list(p1_draws)))
+        return games
+
+    def close(self):
+        if self.map:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
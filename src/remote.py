@@ -0,0 +1,308 @@
+import sys
+import time
+import socket
+import struct
+import argparse
+import socketserver
+import concurrent.futures
+import multiprocessing
+from game import DRAWS_LENGTH
+from ai import run_mcts, merge_visits, packed_move
+
+"""
+Search workers on other hosts. A worker server runs root parallel run_mcts searches for jobs sent
+over TCP, and remote_search sends one job to every worker and merges the visits like handle_ai_turn.
+
+frame = uint32 payload length, payload (little endian)
+
+job payload =
+      uint8 MESSAGE_JOB, uint8 PROTOCOL_VERSION, uint32 board state, uint32 current player state,
+      uint64 current player hand, uint32 other player state, uint64 other player hand,
+      12 x uint8 player 0 draws, 12 x uint8 player 1 draws, float64 search seconds,
+      uint32 iterations (0 to search for the time), uint64 seed, float64 exploration constant,
+      uint32 searches (run in parallel on the worker, seeded seed, seed + 1, ...),
+      uint32 node limit (0 for none), uint64 memory limit in bytes (0 for none), uint8 prune,
+      float64 value mix, uint32 value weight count, then every value weight as a float64
+
+result payload =
+      uint8 MESSAGE_RESULT, uint32 move count, then for every move: uint64 move code, uint32 visits,
+      uint32 reply count, then for every reply: uint64 move code, uint32 visits
+
+error payload = uint8 MESSAGE_ERROR, utf-8 message
+"""
+
+# Constants.
+PROTOCOL_VERSION = 2
+MESSAGE_JOB = 1
+MESSAGE_RESULT = 2
+MESSAGE_ERROR = 3
+LENGTH_FORMAT = "<I"
+LENGTH_SIZE = struct.calcsize(LENGTH_FORMAT)
+JOB_FORMAT = "<BBIIQIQ12s12sdIQdIIQBdI"
+WEIGHT_FORMAT = "<d"
+RESULT_FORMAT = "<BI"
+MOVE_FORMAT = "<QII"
+REPLY_FORMAT = "<QI"
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+DEFAULT_PORT = 5155
+CONNECT_TIMEOUT = 5.0
+RESULT_GRACE = 5.0
+IDLE_TIMEOUT = 60.0
+
+
+def pack_job(state, search_time, iterations=None, seed=0, exploration_constant=1.5, searches=1, options=None):
+    """Returns the job payload for a search from state. options holds the node_limit, memory_limit, prune,
+       value_weights and value_mix arguments of run_mcts (as in main.handle_ai_turn), all optional."""
+    options = options or {}
+    weights = options.get("value_weights") or []
+    header = struct.pack(JOB_FORMAT, MESSAGE_JOB, PROTOCOL_VERSION, state["board_state"], state["current_player_state"],
+                         state["current_player_hand"], state["other_player_state"], state["other_player_hand"],
+                         bytes(state["p0_draws"][:DRAWS_LENGTH]), bytes(state["p1_draws"][:DRAWS_LENGTH]),
+                         search_time, iterations or 0, seed, exploration_constant, searches, options.get("node_limit") or 0,
+                         options.get("memory_limit") or 0, bool(options.get("prune")), options.get("value_mix", 0.0), len(weights))
+    return header + b"".join(struct.pack(WEIGHT_FORMAT, weight) for weight in weights)
+
+
+def job_options(node_limit=0, memory_limit=0, prune=False, value_mix=0.0, value_weights=()):
+    """Returns the run_mcts keyword arguments of a job, with zero limits and no weights mapped to None."""
+    return {
+        "node_limit": node_limit or None,
+        "memory_limit": memory_limit or None,
+        "prune": bool(prune),
+        "value_weights": list(value_weights) or None,
+        "value_mix": value_mix
+    }
+
+
+def unpack_job(payload):
+    """Returns (state, search_time, iterations, seed, exploration_constant, searches, options) from a job payload."""
+    message, version = struct.unpack_from("<BB", payload)
+    if message != MESSAGE_JOB or version != PROTOCOL_VERSION:
+        raise ValueError(f"Unsupported job message {message} version {version}")
+    (_, _, board_state, current_player_state, current_player_hand, other_player_state, other_player_hand,
+     p0_draws, p1_draws, search_time, iterations, seed, exploration_constant, searches, node_limit, memory_limit, prune,
+     value_mix, weight_count) = struct.unpack_from(JOB_FORMAT, payload)
+    weights = struct.unpack_from(f"<{weight_count}d", payload, struct.calcsize(JOB_FORMAT))
+    state = {
+        "board_state": board_state,
+        "current_player_state": current_player_state,
+        "current_player_hand": current_player_hand,
+        "other_player_state": other_player_state,
+        "other_player_hand": other_player_hand,
+        "p0_draws": list(p0_draws),
+        "p1_draws": list(p1_draws)
+    }
+    options = job_options(node_limit, memory_limit, prune, value_mix, weights)
+    return state, search_time, iterations or None, seed, exploration_constant, searches, options
+
+
+def pack_result(children_visits, submove_visits):
+    """Returns the result payload for the visits of a search (as returned by run_mcts)."""
+    parts = [struct.pack(RESULT_FORMAT, MESSAGE_RESULT, len(children_visits))]
+    for move, visits in children_visits.items():
+        replies = submove_visits.get(move, {})
+        parts.append(struct.pack(MOVE_FORMAT, packed_move(move), visits, len(replies)))
+        parts.extend(struct.pack(REPLY_FORMAT, packed_move(reply), reply_visits) for reply, reply_visits in replies.items())
+    return b"".join(parts)
+
+
+def unpack_result(payload):
+    """Returns (children_visits, submove_visits) from a result payload, raising a ValueError for an error
+       or empty payload."""
+    if not payload:
+        raise ValueError("Empty result payload")
+    if payload[0] == MESSAGE_ERROR:
+        raise ValueError(f"Worker error: {payload[1:].decode('utf-8', 'replace')}")
+    message, count = struct.unpack_from(RESULT_FORMAT, payload)
+    if message != MESSAGE_RESULT:
+        raise ValueError(f"Unexpected message {message}")
+    offset = struct.calcsize(RESULT_FORMAT)
+    children_visits = {}
+    submove_visits = {}
+    for _ in range(count):
+        move, visits, reply_count = struct.unpack_from(MOVE_FORMAT, payload, offset)
+        offset += struct.calcsize(MOVE_FORMAT)
+        children_visits[move] = visits
+        replies = submove_visits[move] = {}
+        for _ in range(reply_count):
+            reply, reply_visits = struct.unpack_from(REPLY_FORMAT, payload, offset)
+            offset += struct.calcsize(REPLY_FORMAT)
+            replies[reply] = reply_visits
+    return children_visits, submove_visits
+
+
+def send_frame(sock, payload):
+    """Sends a length prefixed payload."""
+    sock.sendall(struct.pack(LENGTH_FORMAT, len(payload)) + payload)
+
+
+def recv_exact(sock, size, deadline=None):
+    """Reads exactly size bytes, raising a ConnectionError if the peer closes the connection and 
+       socket.timeout if deadline (a time.monotonic() value) passes first."""
+    chunks = []
+    while size:
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout("Worker did not reply in time")
+            sock.settimeout(remaining)
+        chunk = sock.recv(min(size, 1 << 16))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_frame(sock, deadline=None):
+    """Reads a length prefixed payload."""
+    size, = struct.unpack(LENGTH_FORMAT, recv_exact(sock, LENGTH_SIZE, deadline))
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {size} bytes is too large")
+    return recv_exact(sock, size, deadline)
+
+
+def run_job(payload, executor=None):
+    """Runs the searches of a job payload, in executor if given (else one after another), and returns
+       the result payload with the visits of every search merged."""
+    state, search_time, iterations, seed, exploration_constant, searches, options = unpack_job(payload)
+    aggregated_visits = {}
+    aggregated_submoves = {}
+    if executor is None:
+        results = [run_mcts(state, search_time, exploration_constant, seed=seed + i, iterations=iterations, **options) for i in range(searches)]
+    else:
+        futures = [executor.submit(run_mcts, state, search_time, exploration_constant, seed=seed + i, iterations=iterations, **options)
+                   for i in range(searches)]
+        results = [future.result() for future in futures]
+    for children_visits, submove_visits in results:
+        merge_visits(aggregated_visits, aggregated_submoves, children_visits, submove_visits)
+    return pack_result(aggregated_visits, aggregated_submoves)
+
+
+class WorkerHandler(socketserver.BaseRequestHandler):
+    """Answers every job frame on a connection with a result (or error) frame until the client disconnects."""
+
+    def handle(self):
+        self.request.settimeout(IDLE_TIMEOUT)
+        while True:
+            try:
+                payload = recv_frame(self.request)
+            except (ConnectionError, socket.timeout, struct.error):
+                return
+            try:
+                reply = run_job(payload, self.server.executor)
+            except Exception as error:
+                reply = bytes([MESSAGE_ERROR]) + str(error).encode("utf-8")
+            try:
+                send_frame(self.request, reply)
+            except OSError:
+                return
+
+
+class WorkerServer(socketserver.ThreadingTCPServer):
+    """
+    A search worker server. Each connection is handled on its own thread, and the searches of its jobs
+    run in executor (e.g. a ProcessPoolExecutor with one process per core) or on that thread if None.
+
+    Attributes:
+        executor (concurrent.futures.Executor or None): Runs the searches of each job.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, executor=None):
+        super().__init__(address, WorkerHandler)
+        self.executor = executor
+
+
+def search_worker(address, job, timeout):
+    """Sends a job payload to the worker at address and returns its (children_visits, submove_visits),
+       waiting at most timeout seconds in total."""
+    deadline = time.monotonic() + timeout
+    with socket.create_connection(address, timeout=min(CONNECT_TIMEOUT, timeout)) as sock:
+        send_frame(sock, job)
+        return unpack_result(recv_frame(sock, deadline))
+
+
+def remote_search(state, workers, search_time=13, exploration_constant=1.5, seed=0, iterations=None, searches=1, timeout=None, report=None,
+                  options=None):
+    """
+    Runs a search from state on every worker at once and merges their visits like handle_ai_turn.
+
+    Parameters:
+        state (dict): The state to search from.
+        workers (list): The (host, port) address of every worker.
+        search_time (float): The search time of each search.
+        exploration_constant (float): The exploration constant of each search.
+        seed (int): Worker i seeds its searches from seed + i * searches, so no two searches share a seed.
+        iterations (int or None): Run exactly this many iterations per search instead of searching for the time.
+        searches (int): The number of parallel searches each worker runs (e.g. its core count).
+        timeout (float or None): Seconds to wait for each worker, search_time + RESULT_GRACE by default. 
+                                 Workers that fail or time out are left out of the result.
+        report (function or None): Called with a message for every worker that fails.
+        options (dict or None): The tree limit and value function arguments of run_mcts for each search 
+                                (node_limit, memory_limit, prune, value_weights and value_mix).
+
+    Returns:
+        children_visits (dict): The merged visits of every move from the root.
+        submove_visits (dict): The merged visits of every reply to every move from the root.
+    """
+    if timeout is None:
+        timeout = search_time + RESULT_GRACE
+    aggregated_visits = {}
+    aggregated_submoves = {}
+    failures = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(workers))) as executor:
+        futures = {executor.submit(search_worker, address, pack_job(state, search_time, iterations, seed + i * searches, exploration_constant, searches, options), timeout): address
+                   for i, address in enumerate(workers)}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                children_visits, submove_visits = future.result()
+            except (OSError, ValueError, struct.error) as error:
+                failures += 1
+                if report:
+                    report(f"worker {futures[future][0]}:{futures[future][1]} failed: {error}")
+                continue
+            merge_visits(aggregated_visits, aggregated_submoves, children_visits, submove_visits)
+    if failures == len(workers):
+        raise ConnectionError(f"All {len(workers)} workers failed")
+    return aggregated_visits, aggregated_submoves
+
+
+def parse_addresses(text):
+    """Parses a comma separated list of host:port (or host, for the default port) worker addresses."""
+    addresses = []
+    for part in text.split(","):
+        host, _, port = part.strip().rpartition(":")
+        if not host:
+            host, port = port, DEFAULT_PORT
+        addresses.append((host, int(port)))
+    return addresses
+
+
+def parse_args(argv=None):
+    """Parses the worker server command line arguments."""
+    parser = argparse.ArgumentParser(prog="python -m remote", description="Serve run_mcts searches to remote clients.")
+    parser.add_argument("--host", default="0.0.0.0", help="address to listen on (default: all interfaces)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of search processes (default: CPU count)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Runs a worker server until interrupted."""
+    args = parse_args(argv)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+        with WorkerServer((args.host, args.port), executor) as server:
+            print(f"Serving searches on {args.host}:{server.server_address[1]}")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
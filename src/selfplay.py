@@ -0,0 +1,159 @@
+import os
+import sys
+import time
+import random
+import argparse
+import concurrent.futures
+import multiprocessing
+from game import initialise_gamestate, is_game_over, get_current_player, get_winner
+from ai import run_mcts, apply_move, most_visited_move
+from record import RecordWriter, pack_game, pack_turn, MAX_GAME_ID
+from profiling import turn_profile_path, profiled_call
+
+# Constants.
+DEFAULT_GAMES = 8
+DEFAULT_SEARCH_TIME = 0.5
+DEFAULT_MAX_TURNS = 200
+DRAW = -1
+
+
+def choose_move(state, search_time, exploration_constant, seed=None, iterations=None):
+    """Runs a single search from state and returns the move code of the most visited root child,
+       its visits and the total visits of the roots children."""
+    children_visits, _ = run_mcts(state, search_time, exploration_constant, seed=seed, iterations=iterations)
+    move, visits = most_visited_move(children_visits)
+    return move, visits, sum(children_visits.values())
+
+
+def game_winner(state):
+    """Returns the winner (0 or 1) of the game in state, or DRAW if it is not over."""
+    winner = get_winner(state["board_state"])
+    return DRAW if winner is None else winner
+
+
+def play_game(seed, search_times, exploration_constants=(1.5, 1.5), max_turns=DEFAULT_MAX_TURNS, record=False, iterations=(None, None), profile_dir=None):
+    """
+    Plays one AI vs AI game from initialise_gamestate and returns a summary of the result.
+
+    Parameters:
+        seed (int): Seeds the random number generator of the game, which deals the draws and seeds every search.
+        search_times (tuple): The search time per move in seconds for player 0 and player 1.
+        exploration_constants (tuple): The exploration constant for player 0 and player 1.
+        max_turns (int): The number of turns after which the game is scored as a draw.
+        record (bool): If True, the packed game and turn records (see record.py) of the game are
+                       returned under "record", with the seed as the game id.
+        iterations (tuple): The search iterations per move for player 0 and player 1, or None to use 
+                            the search time. When both are set the whole game is reproducible from its seed.
+        profile_dir (str or None): If given, every search is run under cProfile and dumped to a pstats
+                                   file per turn in this directory (see profiling.py).
+
+    Returns:
+        result (dict): The seed, winner (0, 1 or DRAW), number of turns and duration in seconds.
+    """
+    rng = random.Random(seed)
+    start_time = time.time()
+    state = initialise_gamestate(rng)
+    records = [pack_game(seed, seed, state)] if record else None
+    turns = 0
+    while not is_game_over(state["board_state"]) and turns < max_turns:
+        player = get_current_player(state["board_state"])
+        move_start = time.time()
+        search = (state, search_times[player], exploration_constants[player], rng.getrandbits(32), iterations[player])
+        if profile_dir:
+            move, visits, rollouts = profiled_call(turn_profile_path(profile_dir, f"game{seed}-turn{turns}"), choose_move, *search)
+        else:
+            move, visits, rollouts = choose_move(*search)
+        if record:
+            records.append(pack_turn(seed, turns, state, move, visits, rollouts, time.time() - move_start))
+        state = apply_move(state, move)
+        turns += 1
+    result = {"seed": seed, "winner": game_winner(state), "turns": turns, "duration": time.time() - start_time}
+    if record:
+        result["record"] = b"".join(records)
+    return result
+
+
+def run_selfplay(games, search_times, exploration_constants=(1.5, 1.5), seed=0, workers=None, max_turns=DEFAULT_MAX_TURNS, report=print, record_path=None, iterations=(None, None), profile_dir=None):
+    """
+    Plays games AI vs AI games across a process pool and returns the results in seed order,
+    along with the total wall clock time. Game i is played with seed + i. If record_path is 
+    given, the records of each game are appended to it as soon as the game finishes. If profile_dir
+    is given, a pstats file is written there for every turn of every game. Recorded games use
+    their seed as the game id, so with record_path every seed must fit in 32 bits.
+    """
+    if record_path and (seed < 0 or seed + games - 1 > MAX_GAME_ID):
+        raise ValueError(f"Recorded game seeds must be between 0 and {MAX_GAME_ID}, got {seed} to {seed + games - 1}")
+    start_time = time.time()
+    results = []
+    writer = RecordWriter(record_path) if record_path else None
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(play_game, seed + i, search_times, exploration_constants, max_turns, writer is not None, iterations, profile_dir) for i in range(games)]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            if writer:
+                writer.write_records(result.pop("record"))
+                writer.flush()
+            results.append(result)
+            if report:
+                winner = "draw" if result["winner"] == DRAW else f"player {result['winner']}"
+                report(f"seed {result['seed']}: {winner} after {result['turns']} turns ({result['duration']:.1f}s)")
+    if writer:
+        writer.close()
+    results.sort(key=lambda result: result["seed"])
+    return results, time.time() - start_time
+
+
+def summarise(results, elapsed):
+    """Returns the win, draw, turn and throughput totals of a list of game results."""
+    games = len(results)
+    return {
+        "games": games,
+        "player_0_wins": sum(1 for result in results if result["winner"] == 0),
+        "player_1_wins": sum(1 for result in results if result["winner"] == 1),
+        "draws": sum(1 for result in results if result["winner"] == DRAW),
+        "average_turns": sum(result["turns"] for result in results) / games if games else 0,
+        "elapsed": elapsed,
+        "games_per_second": games / elapsed if elapsed > 0 else 0,
+    }
+
+
+def parse_args(argv=None):
+    """Parses the self-play command line arguments."""
+    parser = argparse.ArgumentParser(prog="python -m selfplay", description="Play headless AI vs AI games in parallel.")
+    parser.add_argument("-n", "--games", type=int, default=DEFAULT_GAMES, help="number of games to play")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game, game i uses seed + i")
+    parser.add_argument("--time", type=float, default=DEFAULT_SEARCH_TIME, help="search time per move in seconds for both players")
+    parser.add_argument("--p0-time", type=float, default=None, help="search time per move in seconds for player 0")
+    parser.add_argument("--p1-time", type=float, default=None, help="search time per move in seconds for player 1")
+    parser.add_argument("--iterations", type=int, default=None, help="search iterations per move for both players (overrides the time)")
+    parser.add_argument("--p0-iterations", type=int, default=None, help="search iterations per move for player 0")
+    parser.add_argument("--p1-iterations", type=int, default=None, help="search iterations per move for player 1")
+    parser.add_argument("--p0-exploration", type=float, default=1.5, help="exploration constant for player 0")
+    parser.add_argument("--p1-exploration", type=float, default=1.5, help="exploration constant for player 1")
+    parser.add_argument("--max-turns", type=int, default=DEFAULT_MAX_TURNS, help="turns before a game is scored as a draw")
+    parser.add_argument("--record", default=None, help="append game records to this file (see record.py)")
+    parser.add_argument("--profile", default=None, help="write a cProfile pstats file per turn to this directory")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print the summary")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Runs the self-play command line interface."""
+    args = parse_args(argv)
+    search_times = (args.time if args.p0_time is None else args.p0_time, args.time if args.p1_time is None else args.p1_time)
+    exploration_constants = (args.p0_exploration, args.p1_exploration)
+    iterations = (args.iterations if args.p0_iterations is None else args.p0_iterations, args.iterations if args.p1_iterations is None else args.p1_iterations)
+    results, elapsed = run_selfplay(args.games, search_times, exploration_constants, args.seed, args.workers, args.max_turns, None if args.quiet else print, args.record, iterations, args.profile)
+    summary = summarise(results, elapsed)
+    print(f"Games: {summary['games']}  player 0 wins: {summary['player_0_wins']}  player 1 wins: {summary['player_1_wins']}  draws: {summary['draws']}")
+    print(f"Average turns: {summary['average_turns']:.1f}")
+    print(f"Elapsed: {summary['elapsed']:.1f}s  games/sec: {summary['games_per_second']:.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,231 @@
+import os
+import sys
+import mmap
+import math
+import struct
+import random
+import argparse
+from game import DRAWS_LENGTH, next_states, state_to_key
+from ai import MCTS, MCTSNode, count_nodes, packed_move
+from bench import benchmark_positions
+
+"""
+search tree snapshot file =
+      (48 byte) - file header --- 8 byte magic, uint32 version, uint32 node size, uint32 node count,
+                  12 x uint8 player 0 draws, 12 x uint8 player 1 draws, 4 pad bytes
+      (80 byte x N) - fixed size little endian node records, in breadth first order
+
+node record =
+      int32 parent index (-1 for the root), uint32 first child index, uint32 child count, uint32 visits,
+      float64 total reward (fractional with the value function), uint64 move code (0 for the root), uint64 Zobrist key,
+      uint32 board state, uint32 current player state, uint32 other player state, 4 pad bytes,
+      uint64 current player hand, uint64 other player hand, float64 prior
+
+Nodes are written breadth first, so the children of a node are the child count records starting at
+its first child index, and a snapshot can be navigated straight from the memory mapped file (see
+TreeSnapshot) without rebuilding the tree. Every node of a search shares the same draw sequences, so
+they are stored once in the header. Untried actions are not stored; load_tree regenerates them.
+"""
+
+# Constants.
+MAGIC = b"INSCTREE"
+VERSION = 2
+HEADER_FORMAT = "<8sIII12s12s4x"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+NODE_FORMAT = "<iIIIdQQIII4xQQd"
+NODE_SIZE = struct.calcsize(NODE_FORMAT)
+NODE_FIELDS = ("parent", "first_child", "child_count", "visits", "total_reward", "move", "key", "board_state",
+               "current_player_state", "other_player_state", "current_player_hand", "other_player_hand", "prior")
+DEFAULT_SEARCH_TIME = 10.0
+
+
+def pack_node(node, parent, first_child):
+    """Returns the node record of an MCTSNode, given the indices of its parent and its first child."""
+    state = node.state
+    return struct.pack(NODE_FORMAT, parent, first_child, len(node.children), node.visits, node.total_reward,
+                       packed_move(node.move or 0), node.key, state["board_state"], state["current_player_state"], state["other_player_state"],
+                       state["current_player_hand"], state["other_player_hand"], node.prior)
+
+
+def save_tree(root, path):
+    """Writes the tree below (and including) root to a snapshot file at path, replacing any existing file.
+       The file is written to a temporary path first, so an interrupted save never leaves a partial snapshot."""
+    nodes = [root]
+    parents = [-1]
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, NODE_SIZE, count_nodes(root),
+                               bytes(root.state["p0_draws"][:DRAWS_LENGTH]), bytes(root.state["p1_draws"][:DRAWS_LENGTH])))
+        index = 0
+        while index < len(nodes):
+            node = nodes[index]
+            file.write(pack_node(node, parents[index], len(nodes)))
+            nodes.extend(node.children)
+            parents.extend([index] * len(node.children))
+            index += 1
+    os.replace(temporary_path, path)
+
+
+def check_header(header):
+    """Raises a ValueError if header is not a supported snapshot file header."""
+    if len(header) < HEADER_SIZE:
+        raise ValueError("Not a search tree snapshot: header is truncated")
+    magic, version, node_size, _, _, _ = struct.unpack(HEADER_FORMAT, header[:HEADER_SIZE])
+    if magic != MAGIC:
+        raise ValueError("Not a search tree snapshot: bad magic")
+    if version != VERSION or node_size != NODE_SIZE:
+        raise ValueError(f"Unsupported search tree snapshot version {version} with node size {node_size}")
+
+
+class TreeSnapshot:
+    """
+    Memory mapped reader for search tree snapshot files. Nodes are unpacked one at a time straight
+    from the mapping, so the statistics of a large tree can be inspected without loading it.
+
+    Attributes:
+        path (str): The path of the snapshot file.
+        count (int): The number of nodes in the snapshot.
+        draws (tuple): The (p0_draws, p1_draws) draw sequences shared by every node.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        try:
+            check_header(self.map[:HEADER_SIZE])
+            _, _, _, self.count, p0_draws, p1_draws = struct.unpack_from(HEADER_FORMAT, self.map)
+            if size < HEADER_SIZE + self.count * NODE_SIZE:
+                raise ValueError("Search tree snapshot is truncated")
+        except ValueError:
+            self.close()
+            raise
+        self.draws = (list(p0_draws), list(p1_draws))
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        """Returns node record index unpacked as a tuple, in NODE_FIELDS order."""
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return struct.unpack_from(NODE_FORMAT, self.map, HEADER_SIZE + index * NODE_SIZE)
+
+    def children(self, index):
+        """Returns the range of node indices of the children of node index."""
+        _, first_child, child_count = struct.unpack_from("<iII", self.map, HEADER_SIZE + index * NODE_SIZE)
+        return range(first_child, first_child + child_count)
+
+    def state(self, index):
+        """Returns the game state of node index."""
+        return record_to_state(self[index], self.draws)
+
+    def root_moves(self):
+        """Returns {move code: visits} for the children of the root, as run_mcts does."""
+        moves = {}
+        for child in self.children(0):
+            fields = dict(zip(NODE_FIELDS, self[child]))
+            moves[fields["move"]] = fields["visits"]
+        return moves
+
+    def close(self):
+        if self.map:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def record_to_state(record, draws):
+    """Given an unpacked node record and the (p0_draws, p1_draws) of its snapshot, returns the state of the node."""
+    return {
+        "board_state": record[NODE_FIELDS.index("board_state")],
+        "current_player_state": record[NODE_FIELDS.index("current_player_state")],
+        "current_player_hand": record[NODE_FIELDS.index("current_player_hand")],
+        "other_player_state": record[NODE_FIELDS.index("other_player_state")],
+        "other_player_hand": record[NODE_FIELDS.index("other_player_hand")],
+        "p0_draws": list(draws[0]),
+        "p1_draws": list(draws[1])
+    }
+
+
+def load_tree(path, generate=next_states):
+    """
+    Rebuilds the MCTSNode tree saved in a snapshot file and returns its root, ready to be searched
+    further with MCTS.search(..., root=root). Visits, rewards, priors, move codes and Zobrist keys are 
+    restored, and the untried actions of every node are regenerated with generate, less the children 
+    already expanded. RAVE statistics are not saved, and pruned nodes become expandable again.
+    """
+    with TreeSnapshot(path) as snapshot:
+        draws = snapshot.draws
+        nodes = []
+        for index in range(len(snapshot)):
+            record = snapshot[index]
+            fields = dict(zip(NODE_FIELDS, record))
+            visits = fields["visits"]
+            total_reward = fields["total_reward"]
+            state = record_to_state(record, draws)
+            # Every node shares the roots draw lists, like the states of a search.
+            if nodes:
+                state["p0_draws"], state["p1_draws"] = nodes[0].state["p0_draws"], nodes[0].state["p1_draws"]
+                node = nodes[fields["parent"]].add_child(state, fields["prior"], (), generate, fields["key"], move=fields["move"])
+            else:
+                node = MCTSNode(state, prior=fields["prior"], generate=generate, key=fields["key"])
+            node.visits = visits
+            node.total_reward = total_reward
+            if node.parent is not None:
+                node.parent.child_visits[node.index] = visits
+                node.parent.child_means[node.index] = total_reward / visits if visits else 0.0
+                node.parent.child_inv_sqrt[node.index] = 1 / math.sqrt(visits) if visits else 0.0
+            nodes.append(node)
+    for node in nodes:
+        if node.children:
+            tried = {state_to_key(child.state) for child in node.children}
+            untried = [(state, row) for state, row in zip(node.untried_actions, node.untried_rows) if state_to_key(state) not in tried]
+            node.untried_actions = [state for state, _ in untried]
+            node.untried_rows = [row for _, row in untried]
+    return nodes[0]
+
+
+def parse_args(argv=None):
+    """Parses the snapshot command line arguments."""
+    parser = argparse.ArgumentParser(prog="python -m snapshot", description="Run, checkpoint and extend long searches with search tree snapshots.")
+    parser.add_argument("tree", help="snapshot file, extended if it exists and created otherwise")
+    parser.add_argument("--position", type=int, default=0, help="benchmark corpus position to search when creating a new snapshot")
+    parser.add_argument("--time", type=float, default=DEFAULT_SEARCH_TIME, help="search time in seconds")
+    parser.add_argument("--iterations", type=int, default=None, help="search iterations (overrides the time)")
+    parser.add_argument("--seed", type=int, default=None, help="search seed")
+    parser.add_argument("--exploration", type=float, default=1.5, help="exploration constant")
+    parser.add_argument("--top", type=int, default=10, help="number of root moves to print")
+    parser.add_argument("--info", action="store_true", help="only print the root moves of the snapshot, without searching")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Runs the snapshot command line interface."""
+    args = parse_args(argv)
+    if not args.info:
+        mcts = MCTS(args.exploration, rng=random if args.seed is None else random.Random(args.seed))
+        if os.path.exists(args.tree):
+            root = load_tree(args.tree)
+            state = root.state
+        else:
+            root = None
+            state = benchmark_positions(args.position + 1)[args.position]
+        root = mcts.search(state, args.time, args.iterations, root)
+        save_tree(root, args.tree)
+    with TreeSnapshot(args.tree) as snapshot:
+        moves = sorted(snapshot.root_moves().items(), key=lambda item: -item[1])
+        print(f"{len(snapshot)} nodes, {dict(zip(NODE_FIELDS, snapshot[0]))['visits']} root visits")
+        for move, visits in moves[:args.top]:
+            print(f"move {move:#x}: {visits} visits")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+import ast
+import sys
+import math
+import time
+import random
+import argparse
+import concurrent.futures
+import multiprocessing
+import ai
+from game import initialise_gamestate, is_game_over, get_current_player
+from ai import run_mcts, apply_move, merge_visits, most_visited_move
+from selfplay import DRAW, DEFAULT_MAX_TURNS, game_winner
+
+"""
+Parameter tuning by AI vs AI matches. A configuration is a set of options for each move:
+
+      workers            number of root parallel searches merged per move (run one after another,
+                         so the CPU time per move is workers x search_time)
+      UPPERCASE_NAMES    ai module constants set for the moves of that configuration (e.g. MAX_ITERATIONS)
+      anything else      run_mcts keyword arguments (e.g. search_time, exploration_constant, prior_weight)
+
+A candidate configuration plays game pairs against a baseline, each pair sharing a seed (and so the
+same draws) with the colours swapped. The two games of a pair are correlated, so the pair is the unit
+of the statistics: the pentanomial counts how many pairs the candidate scored 0, 0.5, 1, 1.5 and 2 in.
+After every pair a sequential probability ratio test (SPRT) of elo0 against elo1 decides whether to
+stop, and the Elo difference is reported with a confidence interval.
+"""
+
+# Constants.
+DEFAULT_MAX_GAMES = 400
+DEFAULT_MIN_GAMES = 20
+DEFAULT_ELO0 = 0.0
+DEFAULT_ELO1 = 30.0
+DEFAULT_ALPHA = 0.05
+DEFAULT_BETA = 0.05
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_SEARCH_TIME = 0.5
+H0_ACCEPTED = "H0"
+H1_ACCEPTED = "H1"
+INCONCLUSIVE = "inconclusive"
+
+
+def parse_config(text):
+    """Parses a configuration such as "exploration_constant=2.0,MAX_ITERATIONS=60,workers=2" into a dictionary.
+       Values are Python literals, anything else is kept as a string."""
+    config = {}
+    for part in filter(None, (part.strip() for part in text.split(","))):
+        name, separator, value = part.partition("=")
+        if not separator:
+            raise ValueError(f"Expected name=value, got {part!r}")
+        try:
+            config[name.strip()] = ast.literal_eval(value.strip())
+        except (ValueError, SyntaxError):
+            config[name.strip()] = value.strip()
+    return config
+
+
+def format_config(config):
+    """Returns a configuration in the form parse_config reads."""
+    return ",".join(f"{name}={value}" for name, value in config.items())
+
+
+def choose_move(state, config, seed):
+    """Returns the most visited move from state over the merged searches of a configuration. Module 
+       constants of the configuration are set for the searches and restored afterwards."""
+    constants = {name: value for name, value in config.items() if name.isupper()}
+    options = {name: value for name, value in config.items() if not name.isupper() and name != "workers"}
+    options.setdefault("search_time", DEFAULT_SEARCH_TIME)
+    saved = {name: getattr(ai, name) for name in constants}
+    aggregated_visits = {}
+    aggregated_submoves = {}
+    try:
+        for name, value in constants.items():
+            setattr(ai, name, value)
+        for worker in range(config.get("workers", 1)):
+            merge_visits(aggregated_visits, aggregated_submoves, *run_mcts(state, seed=seed + worker, **options))
+    finally:
+        for name, value in saved.items():
+            setattr(ai, name, value)
+    return most_visited_move(aggregated_visits)[0]
+
+
+def play_match_game(seed, configs, max_turns=DEFAULT_MAX_TURNS):
+    """Plays one game from initialise_gamestate(random.Random(seed)) with configs[player] choosing the
+       moves of each player, and returns the winner (0, 1 or DRAW)."""
+    rng = random.Random(seed)
+    state = initialise_gamestate(rng)
+    for _ in range(max_turns):
+        if is_game_over(state["board_state"]):
+            break
+        state = apply_move(state, choose_move(state, configs[get_current_player(state["board_state"])], rng.getrandbits(32)))
+    return game_winner(state)
+
+
+def play_pair(seed, candidate, baseline, max_turns=DEFAULT_MAX_TURNS):
+    """Plays the candidate against the baseline twice from the same seed, with the colours swapped, 
+       and returns the candidates two scores (1 win, 0.5 draw, 0 loss)."""
+    scores = []
+    for candidate_player, configs in ((0, (candidate, baseline)), (1, (baseline, candidate))):
+        winner = play_match_game(seed, configs, max_turns)
+        scores.append(0.5 if winner == DRAW else float(winner == candidate_player))
+    return scores
+
+
+def score_statistics(pentanomial):
+    """Returns the mean score per game and the variance of the mean score of a pair, given the
+       pentanomial counts of pairs scoring 0, 0.5, 1, 1.5 and 2."""
+    pairs = sum(pentanomial)
+    if not pairs:
+        return 0.5, 0.0
+    score = sum(count * index / 4 for index, count in enumerate(pentanomial)) / pairs
+    variance = sum(count * (index / 4 - score) ** 2 for index, count in enumerate(pentanomial)) / pairs
+    return score, variance
+
+
+def elo_to_score(elo):
+    """Returns the expected score of a player elo Elo stronger than its opponent."""
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def score_to_elo(score):
+    """Returns the Elo difference that gives an expected score (clamped away from 0 and 1)."""
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def elo_interval(pentanomial, confidence=DEFAULT_CONFIDENCE):
+    """Returns the Elo difference of the pentanomial pair counts and its confidence interval as 
+       (elo, low, high), from the normal approximation of the mean pair score."""
+    pairs = sum(pentanomial)
+    score, variance = score_statistics(pentanomial)
+    if not pairs:
+        return 0.0, -math.inf, math.inf
+    # Two sided normal quantile by bisection of the error function.
+    low, high = 0.0, 10.0
+    for _ in range(60):
+        middle = (low + high) / 2
+        if math.erf(middle / math.sqrt(2)) < confidence:
+            low = middle
+        else:
+            high = middle
+    margin = low * math.sqrt(variance / pairs)
+    return score_to_elo(score), score_to_elo(score - margin), score_to_elo(score + margin)
+
+
+def sprt_llr(pentanomial, elo0=DEFAULT_ELO0, elo1=DEFAULT_ELO1):
+    """Returns the log likelihood ratio of H1 (the candidate is elo1 stronger) against H0 (elo0 stronger),
+       using the normal approximation of the pentanomial pair score model (as in GSPRT)."""
+    pairs = sum(pentanomial)
+    score, variance = score_statistics(pentanomial)
+    if not pairs or not variance:
+        return 0.0
+    score0 = elo_to_score(elo0)
+    score1 = elo_to_score(elo1)
+    return pairs * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+
+def sprt_bounds(alpha=DEFAULT_ALPHA, beta=DEFAULT_BETA):
+    """Returns the (lower, upper) log likelihood ratio bounds at which H0 or H1 is accepted."""
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def run_match(candidate, baseline, max_games=DEFAULT_MAX_GAMES, min_games=DEFAULT_MIN_GAMES, elo0=DEFAULT_ELO0, elo1=DEFAULT_ELO1,
+              alpha=DEFAULT_ALPHA, beta=DEFAULT_BETA, seed=0, workers=None, max_turns=DEFAULT_MAX_TURNS, report=print):
+    """
+    Plays game pairs of candidate against baseline across a process pool until the SPRT, checked
+    after every pair, accepts a hypothesis (after at least min_games games) or max_games games have 
+    been played. Pair i is played with seed + i. Pending pairs are cancelled as soon as the test stops.
+
+    Returns:
+        result (dict): The win/draw/loss counts and the pentanomial pair counts of the candidate, its 
+                       Elo difference with a 95% confidence interval, the final log likelihood ratio, 
+                       the decision (H0_ACCEPTED, H1_ACCEPTED or INCONCLUSIVE) and the elapsed time.
+    """
+    start_time = time.time()
+    lower, upper = sprt_bounds(alpha, beta)
+    counts = {1.0: 0, 0.5: 0, 0.0: 0}
+    pentanomial = [0] * 5
+    decision = INCONCLUSIVE
+    llr = 0.0
+    pairs = (max_games + 1) // 2
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(play_pair, seed + i, candidate, baseline, max_turns) for i in range(pairs)]
+        for future in concurrent.futures.as_completed(futures):
+            scores = future.result()
+            for score in scores:
+                counts[score] += 1
+            pentanomial[int(2 * sum(scores))] += 1
+            games = sum(counts.values())
+            llr = sprt_llr(pentanomial, elo0, elo1)
+            if report:
+                report(f"games {games}: +{counts[1.0]} ={counts[0.5]} -{counts[0.0]}  LLR {llr:+.2f} ({lower:.2f}, {upper:.2f})")
+            if games >= min_games and (llr <= lower or llr >= upper):
+                decision = H1_ACCEPTED if llr >= upper else H0_ACCEPTED
+                break
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    elo, low, high = elo_interval(pentanomial)
+    return {
+        "candidate": candidate,
+        "baseline": baseline,
+        "wins": counts[1.0],
+        "draws": counts[0.5],
+        "losses": counts[0.0],
+        "games": sum(counts.values()),
+        "pentanomial": pentanomial,
+        "elo": elo,
+        "elo_low": low,
+        "elo_high": high,
+        "llr": llr,
+        "decision": decision,
+        "elapsed": time.time() - start_time,
+    }
+
+
+def parse_args(argv=None):
+    """Parses the tuning command line arguments."""
+    parser = argparse.ArgumentParser(prog="python -m tune", description="Test candidate search settings against a baseline with SPRT.")
+    parser.add_argument("--baseline", default=f"search_time={DEFAULT_SEARCH_TIME}", help="baseline configuration, e.g. search_time=0.5,exploration_constant=1.5")
+    parser.add_argument("--candidate", action="append", required=True, help="candidate configuration (repeatable), options not given are taken from the baseline")
+    parser.add_argument("-n", "--max-games", type=int, default=DEFAULT_MAX_GAMES, help="maximum games per candidate")
+    parser.add_argument("--min-games", type=int, default=DEFAULT_MIN_GAMES, help="games before the SPRT may stop")
+    parser.add_argument("--elo0", type=float, default=DEFAULT_ELO0, help="Elo difference of H0")
+    parser.add_argument("--elo1", type=float, default=DEFAULT_ELO1, help="Elo difference of H1")
+    parser.add_argument("--alpha", type=float, default=DEFAULT_ALPHA, help="false positive rate")
+    parser.add_argument("--beta", type=float, default=DEFAULT_BETA, help="false negative rate")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game pair, pair i uses seed + i")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--max-turns", type=int, default=DEFAULT_MAX_TURNS, help="turns before a game is scored as a draw")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print the result of each candidate")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Runs the tuning command line interface."""
+    args = parse_args(argv)
+    baseline = parse_config(args.baseline)
+    results = []
+    for text in args.candidate:
+        candidate = {**baseline, **parse_config(text)}
+        print(f"candidate {format_config(candidate)} vs baseline {format_config(baseline)}")
+        result = run_match(candidate, baseline, args.max_games, args.min_games, args.elo0, args.elo1, args.alpha, args.beta,
+                           args.seed, args.workers, args.max_turns, None if args.quiet else print)
+        results.append(result)
+        print(f"{result['decision']}: +{result['wins']} ={result['draws']} -{result['losses']}  "
+              f"Elo {result['elo']:+.1f} [{result['elo_low']:+.1f}, {result['elo_high']:+.1f}]  ({result['elapsed']:.0f}s)")
+    if len(results) > 1:
+        print()
+        for result in sorted(results, key=lambda result: -result["elo"]):
+            print(f"{result['elo']:+7.1f} [{result['elo_low']:+7.1f}, {result['elo_high']:+7.1f}]  {result['decision']:12}  {format_config(result['candidate'])}")
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,188 @@
+import sys
+import json
+import random
+import argparse
+import concurrent.futures
+import multiprocessing
+from game import initialise_gamestate, is_game_over, next_states, get_current_player, get_winner
+from ai import VALUE_FEATURES, value_features, linear_value, get_draw_id_and_squirrel_drawable, set_drawn_and_apply_state, apply_move
+from record import RecordReader, turn_to_state, TURN_FIELDS
+
+"""
+Offline training of the linear value function used by MCTS (see value_features and run_mcts).
+
+Every position of a self-play game becomes a sample: its VALUE_FEATURES for the player to move, and
+the result of the game for that player (1 for a win, -1 for a loss, 0 for a draw). The weights are
+fitted by ridge regularised least squares and saved as a small JSON file:
+
+      {"features": [...VALUE_FEATURES], "weights": [...], "samples": N, "source": "..."}
+"""
+
+# Constants.
+DEFAULT_GAMES = 4000
+DEFAULT_MAX_TURNS = 200
+DEFAULT_RIDGE = 1e-3
+DEFAULT_HOLDOUT = 0.1
+CHUNK_GAMES = 100
+
+
+def state_features(state):
+    """Returns the value features of a state dictionary."""
+    return value_features(state["board_state"], state["current_player_state"], state["current_player_hand"],
+                          state["other_player_state"], state["other_player_hand"])
+
+
+def label_samples(positions, winner):
+    """Given the (features, player to move) of every position of a game and its winner (None for a
+       draw), returns the (features, target) samples of the game."""
+    if winner is None:
+        return [(features, 0.0) for features, _ in positions]
+    return [(features, 1.0 if player == winner else -1.0) for features, player in positions]
+
+
+def random_game_samples(seed, max_turns=DEFAULT_MAX_TURNS):
+    """Plays a game with uniformly random moves (the rollout policy) from initialise_gamestate and returns its samples."""
+    rng = random.Random(seed)
+    state = initialise_gamestate(rng)
+    positions = []
+    for _ in range(max_turns):
+        if is_game_over(state["board_state"]):
+            break
+        positions.append((state_features(state), get_current_player(state["board_state"])))
+        draw_id, squirrel_drawable = get_draw_id_and_squirrel_drawable(state)
+        state = set_drawn_and_apply_state(state, *rng.choice(next_states(state["current_player_state"], state["current_player_hand"], True, draw_id, squirrel_drawable)))
+    return label_samples(positions, get_winner(state["board_state"]))
+
+
+def random_games_samples(seeds, max_turns=DEFAULT_MAX_TURNS):
+    """Returns the samples of a random game for every seed."""
+    samples = []
+    for seed in seeds:
+        samples.extend(random_game_samples(seed, max_turns))
+    return samples
+
+
+def record_samples(path):
+    """Returns the samples of every game in a game record file (see record.py), such as one written
+       by selfplay.py --record. The winner of each game is found by replaying its last move."""
+    with RecordReader(path) as reader:
+        games = reader.games()
+        turns = {}
+        for turn in reader.turns():
+            fields = dict(zip(TURN_FIELDS, turn))
+            turns.setdefault(fields["game"], []).append(turn)
+    samples = []
+    for game, game_turns in turns.items():
+        draws = games[game][1]
+        states = [turn_to_state(turn, draws) for turn in game_turns]
+        final_state = apply_move(states[-1], dict(zip(TURN_FIELDS, game_turns[-1]))["move"])
+        samples.extend(label_samples([(state_features(state), get_current_player(state["board_state"])) for state in states], get_winner(final_state["board_state"])))
+    return samples
+
+
+def solve(matrix, vector):
+    """Solves matrix x = vector for x by Gaussian elimination with partial pivoting."""
+    size = len(vector)
+    rows = [list(row) + [value] for row, value in zip(matrix, vector)]
+    for column in range(size):
+        pivot = max(range(column, size), key=lambda row: abs(rows[row][column]))
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        if rows[column][column] == 0:
+            raise ValueError("Singular system, the features do not vary across the samples")
+        for row in range(column + 1, size):
+            factor = rows[row][column] / rows[column][column]
+            if factor:
+                for index in range(column, size + 1):
+                    rows[row][index] -= factor * rows[column][index]
+    solution = [0.0] * size
+    for row in reversed(range(size)):
+        solution[row] = (rows[row][size] - sum(rows[row][index] * solution[index] for index in range(row + 1, size))) / rows[row][row]
+    return solution
+
+
+def fit(samples, ridge=DEFAULT_RIDGE):
+    """Returns the least squares weights for the samples, with an L2 penalty of ridge per sample on
+       every weight but the bias."""
+    size = len(VALUE_FEATURES)
+    matrix = [[0.0] * size for _ in range(size)]
+    vector = [0.0] * size
+    for features, target in samples:
+        for i in range(size):
+            feature = features[i]
+            if feature:
+                row = matrix[i]
+                for j in range(size):
+                    row[j] += feature * features[j]
+                vector[i] += feature * target
+    for i in range(1, size):
+        matrix[i][i] += ridge * len(samples)
+    return solve(matrix, vector)
+
+
+def score(weights, samples):
+    """Returns the mean squared error of the value function on the samples, and how often it predicts
+       the winner of the decided samples (the sign of the value)."""
+    error = 0.0
+    correct = 0
+    decided = 0
+    for features, target in samples:
+        value = linear_value(weights, features)
+        error += (value - target) ** 2
+        if target:
+            decided += 1
+            correct += (value > 0) == (target > 0)
+    return error / len(samples) if samples else 0.0, correct / decided if decided else 0.0
+
+
+def save_weights(path, weights, samples, source):
+    """Writes a weights file for load_value_weights."""
+    with open(path, "w") as file:
+        json.dump({"features": list(VALUE_FEATURES), "weights": weights, "samples": samples, "source": source}, file, indent=2)
+
+
+def parse_args(argv=None):
+    """Parses the value training command line arguments."""
+    parser = argparse.ArgumentParser(prog="python -m value", description="Train the linear value function from self-play outcomes.")
+    parser.add_argument("-o", "--output", required=True, help="weights file to write")
+    parser.add_argument("--record", action="append", default=[], help="train on the games in this record file (repeatable) instead of random games")
+    parser.add_argument("-n", "--games", type=int, default=DEFAULT_GAMES, help="number of random self-play games")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first random game, game i uses seed + i")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--ridge", type=float, default=DEFAULT_RIDGE, help="L2 regularisation strength")
+    parser.add_argument("--holdout", type=float, default=DEFAULT_HOLDOUT, help="fraction of games held out for scoring")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Runs the value training command line interface."""
+    args = parse_args(argv)
+    if args.record:
+        samples = []
+        for path in args.record:
+            samples.extend(record_samples(path))
+        source = "records: " + ", ".join(args.record)
+    else:
+        seeds = list(range(args.seed, args.seed + args.games))
+        chunks = [seeds[i:i + CHUNK_GAMES] for i in range(0, len(seeds), CHUNK_GAMES)]
+        samples = []
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+            for chunk_samples in executor.map(random_games_samples, chunks):
+                samples.extend(chunk_samples)
+        source = f"{args.games} random games from seed {args.seed}"
+    # Samples are in game order, so the held out samples come from games not trained on.
+    split = len(samples) - int(len(samples) * args.holdout)
+    weights = fit(samples[:split], args.ridge)
+    print(f"Samples: {len(samples)} ({split} train, {len(samples) - split} held out)")
+    for name, samples_set in (("train", samples[:split]), ("holdout", samples[split:])):
+        if samples_set:
+            error, accuracy = score(weights, samples_set)
+            print(f"{name:8} mse {error:.4f}  winner accuracy {accuracy:.1%}")
+    for name, weight in zip(VALUE_FEATURES, weights):
+        print(f"{name:22} {weight:+.4f}")
+    save_weights(args.output, weights, split, source)
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
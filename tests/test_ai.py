@@ -10,6 +10,20 @@ import ai
 def run_tests():
     test_set_drawn_and_apply_state()
     get_draw_id_and_squirrel_drawable()
+    test_health_swing()
+    test_progressive_widening()
+    test_move_prior()
+    test_placement_keys()
+    test_rave()
+    test_best_child()
+    test_rollout()
+    test_transpositions()
+    test_encode_move()
+    test_turn_decomposition()
+    test_seeded_search()
+    test_search_metrics()
+    test_node_limit()
+    test_parallel_search()
     print("All tests passed!")
 
 def test_set_drawn_and_apply_state():
@@ -30,4 +44,234 @@ def get_draw_id_and_squirrel_drawable():
     assert result_draw_id == 2
     assert result_squirrel_drawable == 1
 
+def test_health_swing():
+    state = {"board_state": 0b0001000100100010001010}
+    next_state = {"board_state": 0b0001000100100010101000}
+    assert ai.health_swing(state, next_state) == 2
+    state = {"board_state": 0b0001000100100010101010}
+    next_state = {"board_state": 0b0001000100100010001000}
+    assert ai.health_swing(state, next_state) == -2
+
+def test_progressive_widening():
+    state = game.initialise_gamestate()
+    node = ai.MCTSNode(state)
+    assert node.can_expand()
+    assert node.can_expand(1.0, 0.5)
+    node.add_child(node.untried_actions.pop())
+    assert not node.can_expand(1.0, 0.5)
+    node.visits = 4
+    assert node.can_expand(1.0, 0.5)
+    mcts = ai.MCTS(1.5, 1.0, 0.5)
+    node = ai.MCTSNode(state)
+    mcts.expand(node)
+    assert node.ordered
+    assert node.untried_priors == sorted(node.untried_priors)
+    assert len(node.untried_priors) == len(node.untried_actions)
+    assert 0 < node.children[0].prior < 1
+
+def test_move_prior():
+    state = {"board_state": 0b0001000100100010001010, "current_player_state": 0b0010010000000000, "other_player_state": 0}
+    attack = {"board_state": 0b0001000100100010100111, "current_player_state": 0, "other_player_state": 0b0010010000000000}
+    sacrifice = {"board_state": 0b0001000100100010101010, "current_player_state": 0, "other_player_state": 0}
+    assert ai.board_value(0b0010010000000000) == 5
+    assert ai.move_prior(state, attack) > 0.5 > ai.move_prior(state, sacrifice)
+
+def test_placement_keys():
+    start_state = 0b00010010000000000000000000000000
+    end_state = 0b00010010000000000010010000000000
+    assert ai.placement_keys(1, start_state, end_state) == ((1 << 6) | (2 << 2) | 1,)
+    assert ai.placement_keys(0, start_state, start_state) == ()
+
+def test_rave():
+    state = game.initialise_gamestate()
+    mcts = ai.MCTS(1.5, rave_equivalence=300)
+    root = ai.MCTSNode(state)
+    child = mcts.expand(root)
+    mcts.backpropagate(child, 1, [(1 << 6) | (6 << 2) | 0])
+    assert mcts.amaf[(1 << 6) | (6 << 2) | 0] == [1, 1]
+    for key in child.amaf_keys:
+        assert mcts.amaf[key] == [1, 1]
+    assert root.visits == 1 and child.visits == 1
+
+def test_best_child():
+    state = game.initialise_gamestate()
+    mcts = ai.MCTS(1.5, prior_weight=1.0)
+    root = ai.MCTSNode(state)
+    for reward in (1, -1, 1, 0, -1):
+        child = mcts.expand(root)
+        mcts.backpropagate(child, reward)
+    mcts.backpropagate(root.children[3], 1)
+    assert root.child_visits == [1, 1, 1, 2, 1]
+    assert root.child_means == [1.0, -1.0, 1.0, 0.5, -1.0]
+    expected = max(root.children, key=lambda child: child.uct_value(1.5, 1.0))
+    assert root.best_child(1.5, 1.0) is expected
+    child = mcts.expand(root)
+    assert root.best_child(1.5, 1.0) is child
+
+def reference_simulate(state, root_player_id):
+    iterations = 0
+    while not game.is_game_over(state["board_state"]):
+        current_player = game.get_current_player(state["board_state"])
+        if game.get_drawn_cards(state["board_state"], current_player) >= ai.MAX_DRAWABLE_RANDOM and game.get_drawn_squirrels(state["board_state"], current_player) >= ai.MAX_DRAWABLE_SQUIRRELS:
+            if iterations == ai.MAX_ITERATIONS:
+                return 0
+            iterations += 1
+        draw_id, squirrel_drawable = ai.get_draw_id_and_squirrel_drawable(state)
+        actions = game.next_states(state["current_player_state"], state["current_player_hand"], True, draw_id, squirrel_drawable)
+        state = ai.set_drawn_and_apply_state(state, *ai.random.choice(actions))
+    return -1 if game.get_current_player(state["board_state"]) == root_player_id else 1
+
+def test_rollout():
+    for seed in range(20):
+        ai.random.seed(seed)
+        state = game.initialise_gamestate()
+        ai.random.seed(seed)
+        expected = reference_simulate(state, 0)
+        ai.random.seed(seed)
+        assert ai.MCTS(1.5).simulate(state, 0) == expected
+
+def test_transpositions():
+    state = game.initialise_gamestate()
+    mcts = ai.MCTS(1.5, transpositions=True)
+    root = ai.MCTSNode(state)
+    child = mcts.expand(root)
+    grandchild = mcts.expand(child)
+    assert child.key == game.zobrist_hash(child.state)
+    assert grandchild.key == game.zobrist_hash(grandchild.state)
+    assert grandchild.state in mcts.successors[child.key][0]
+    assert len(mcts.successors[child.key][0]) == len(child.untried_actions) + 1
+    copy = root.add_child(child.state, key=child.key, successors=mcts.successors[child.key])
+    assert sorted(map(game.state_to_key, copy.untried_actions)) == sorted(map(game.state_to_key, mcts.successors[child.key][0]))
+    mcts.table = {}
+    mcts.backpropagate(grandchild, 1)
+    mcts.backpropagate(copy, -1)
+    assert mcts.table[child.key] == [2, 0] and mcts.table[root.key] == [2, 0]
+    assert child.value() == 1 and child.value(table=mcts.table) == copy.value(table=mcts.table) == 0
+    assert ai.transposition_table(root) == mcts.table
+
+def test_encode_move():
+    state = game.initialise_gamestate()
+    state["current_player_state"] = 0b00010010000000000000000000000000
+    state["current_player_hand"] = (2 << (1 * game.HAND_CARD_COUNT_SHIFT)) | (1 << (2 * game.HAND_CARD_COUNT_SHIFT))
+    node = ai.MCTSNode(state)
+    moves = [ai.encode_move(state, row, next_state) for next_state, row in zip(node.untried_actions, node.untried_rows)]
+    assert len(set(moves)) == len(moves)
+    for move, next_state in zip(moves, node.untried_actions):
+        assert ai.apply_move(state, move) == next_state
+    row = game.place_card(0b00010010000000000000000000000000, 2, 0)  # A Squirrel played to lane 0 and the lane 3 Squirrel are sacrificed for a Wolf.
+    row = game.remove_card(row, 3)
+    hand = (1 << (1 * game.HAND_CARD_COUNT_SHIFT)) + (1 << (state["p0_draws"][2] * game.HAND_CARD_COUNT_SHIFT))
+    next_state = ai.set_drawn_and_apply_state(state, row, hand, ai.HAS_BEEN_DRAWN, ai.CANNOT_DRAW)
+    move = ai.encode_move(state, row, next_state)
+    assert move == ai.MOVE_RANDOM_DRAW | (1 << (ai.MOVE_SACRIFICE_SHIFT + 3)) | (2 << ai.MOVE_PLACEMENT_SHIFT) | (1 << ai.MOVE_EXTRA_SHIFT)
+    assert ai.apply_move(state, move) == next_state
+
+def turn_ends(partial, draws, ends):
+    for action in ai.turn_actions(partial, draws):
+        if partial[5] == ai.PHASE_PLAY and action == ai.END_TURN:
+            ends.add((partial[1], partial[2], game.get_drawn_cards(partial[0], 0), game.get_drawn_squirrels(partial[0], 0)))
+        else:
+            turn_ends(ai.turn_step(partial, action, draws), draws, ends)
+
+def test_turn_decomposition():
+    state = game.initialise_gamestate()
+    state["current_player_state"] = 0b00010010000000000000000000000000
+    state["current_player_hand"] = (2 << (1 * game.HAND_CARD_COUNT_SHIFT)) | (1 << (2 * game.HAND_CARD_COUNT_SHIFT))
+    draws = (state["p0_draws"], state["p1_draws"])
+    ends = set()
+    turn_ends(ai.turn_start(state), draws, ends)
+    expected = set()
+    for row, hand, random_draw, squirrel_draw in game.next_states(state["current_player_state"], state["current_player_hand"], True, state["p0_draws"][2], 1):
+        expected.add((row, hand, 3 if random_draw == ai.HAS_BEEN_DRAWN else 2, 2 if squirrel_draw == ai.HAS_BEEN_DRAWN else 1))
+    assert ends == expected
+    mcts = ai.TurnMCTS(1.5)
+    root = mcts.search(state, 0.2)
+    assert root.visits > 0 and sorted(root.actions) == [ai.MOVE_RANDOM_DRAW, ai.MOVE_SQUIRREL_DRAW]
+    assert all(mcts.nodes[node.partial] is node for node in root.children)
+    moves = mcts.turn_moves(root, state)
+    for move, (visits, child) in moves.items():
+        assert ai.apply_move(state, move) == ai.partial_to_state(child.partial, draws)
+    # With empty boards, empty hands and no draws left, ending the turn returns to the same partial turn.
+    state["board_state"] = 10 | (10 << game.BOARD_PLAYER_0_DRAWN_RANDOM_SHIFT) | (10 << game.BOARD_PLAYER_1_DRAWN_RANDOM_SHIFT) \
+        | (10 << game.BOARD_PLAYER_0_DRAWN_SQUIRREL_SHIFT) | (10 << game.BOARD_PLAYER_1_DRAWN_SQUIRREL_SHIFT)
+    state.update(current_player_state=0, current_player_hand=0, other_player_state=0, other_player_hand=0)
+    children_visits, _ = ai.run_mcts(state, seed=1, iterations=50, turn_decomposition=True)
+    assert children_visits == {0: 50}
+
+def test_seeded_search():
+    state = game.initialise_gamestate(ai.random.Random(4))
+    assert state == game.initialise_gamestate(ai.random.Random(4))
+    for options in ({}, {"prior_weight": 1.0, "rave_equivalence": 300}, {"turn_decomposition": True}):
+        first = ai.run_mcts(state, seed=9, iterations=100, **options)
+        second = ai.run_mcts(state, seed=9, iterations=100, **options)
+        assert first == second
+    assert sum(first[0].values()) <= 100
+    assert sum(ai.run_mcts(state, seed=9, iterations=100)[0].values()) == 100
+
+def test_search_metrics():
+    state = game.initialise_gamestate(ai.random.Random(4))
+    for options in ({}, {"turn_decomposition": True}):
+        children_visits, submove_visits, metrics = ai.run_mcts(state, seed=9, iterations=100, metrics=True, **options)
+        assert metrics["iterations"] == metrics["rollouts"] == 100
+        assert metrics["nodes"] > 1 and 1 <= metrics["max_depth"]
+        assert metrics["average_depth"] <= metrics["max_depth"]
+        assert metrics["stalemates"] <= metrics["rollouts"]
+        assert 0 <= metrics["cache_hit_rate"] <= 1
+        assert (children_visits, submove_visits) == ai.run_mcts(state, seed=9, iterations=100, **options)
+    merged = ai.merge_metrics([metrics, metrics])
+    assert merged["searches"] == 2 and merged["iterations"] == 200
+    assert merged["max_depth"] == metrics["max_depth"]
+    assert merged["average_rollout_length"] == metrics["average_rollout_length"]
+    metrics = ai.SearchMetrics()
+    mcts = ai.MCTS(1.5, rng=ai.random.Random(9), metrics=metrics)
+    root = mcts.search(state, 0, iterations=100)
+    assert metrics.tree_bytes == mcts.tree_bytes and abs(mcts.tree_bytes - ai.tree_memory(root)) < 0.01 * mcts.tree_bytes
+
+def tree_depth(node):
+    return max((tree_depth(child) + 1 for child in node.children), default=0)
+
+def test_node_limit():
+    state = game.initialise_gamestate(ai.random.Random(4))
+    mcts = ai.MCTS(1.5, rng=ai.random.Random(9), node_limit=50)
+    root = mcts.search(state, 0, iterations=200)
+    assert ai.count_nodes(root) == mcts.node_count == 50 and not mcts.expanding
+    assert root.visits == 200
+    metrics = ai.SearchMetrics()
+    mcts = ai.MCTS(1.5, rng=ai.random.Random(9), metrics=metrics, node_limit=150, prune=True)
+    root = mcts.search(state, 0, iterations=400)
+    assert ai.count_nodes(root) == mcts.node_count < 150 and mcts.expanding and metrics.pruned
+    assert root.visits == 400 and len(root.children) > 1
+    mcts = ai.MCTS(1.5, rng=ai.random.Random(9), prune=True)
+    root = mcts.search(state, 0, iterations=300)
+    assert tree_depth(root) == 2
+    mcts.node_limit = 100
+    mcts.prune_tree(root)
+    assert tree_depth(root) == 1 and mcts.node_count == ai.count_nodes(root)
+    assert all(child.untried_actions for child in root.children)
+    mcts.node_limit = None
+    root = mcts.search(state, 0, iterations=300, root=root)
+    assert tree_depth(root) == 2
+    mcts = ai.MCTS(1.5, rng=ai.random.Random(9), memory_limit=500000)
+    root = mcts.search(state, 0, iterations=200)
+    assert not mcts.expanding and ai.tree_memory(root) < 2 * 500000
+    children_visits, _, metrics = ai.run_mcts(state, seed=9, iterations=100, metrics=True, node_limit=10, turn_decomposition=True)
+    assert metrics["nodes"] == 10 and sum(children_visits.values()) <= 100
+
+def test_parallel_search():
+    state = game.initialise_gamestate(ai.random.Random(4))
+    metrics = ai.SearchMetrics()
+    mcts = ai.ParallelMCTS(1.5, 4, rng=ai.random.Random(9), metrics=metrics)
+    root = mcts.search(state, 0, iterations=200)
+    assert root.visits == sum(child.visits for child in root.children) == 200
+    assert metrics.iterations == metrics.rollouts == 200
+    nodes = [root]
+    while nodes:
+        node = nodes.pop()
+        assert node.child_visits == [child.visits for child in node.children]
+        assert all(-child.visits <= child.total_reward <= child.visits for child in node.children)
+        nodes.extend(node.children)
+    children_visits, _ = ai.run_mcts(state, seed=9, iterations=100, threads=2, node_limit=20)
+    assert sum(children_visits.values()) == 100 and len(children_visits) == 19
+    assert ai.gil_disabled() == (hasattr(ai.sys, "_is_gil_enabled") and not ai.sys._is_gil_enabled())
+
 run_tests()
\ No newline at end of file
@@ -0,0 +1,43 @@
+import os
+import sys
+import tempfile
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+import game
+import ai
+import record
+import analyse
+
+
+def run_tests():
+    test_analyse_position()
+    test_read_positions()
+    print("All tests passed!")
+
+def test_analyse_position():
+    state = game.initialise_gamestate()
+    analysis = analyse.analyse_position({"corpus": 0}, state, {"iterations": 50, "seed": 3})
+    again = analyse.analyse_position({"corpus": 0}, state, {"iterations": 50, "seed": 3})
+    assert again["moves"] == analysis["moves"]
+    assert analysis["iterations"] == 50
+    visits = [move["visits"] for move in analysis["moves"]]
+    assert visits == sorted(visits, reverse=True)
+    assert analysis["best_move"] == analysis["moves"][0]["move"]
+    assert "played_rank" not in analysis
+    played = analyse.analyse_position({"played": analysis["best_move"]}, state, {"iterations": 50, "seed": 3})
+    assert played["played_rank"] == 1
+
+def test_read_positions():
+    state = game.initialise_gamestate()
+    node = ai.MCTSNode(state)
+    move = ai.encode_move(state, node.untried_rows[0], node.untried_actions[0])
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "games.rec")
+        with record.RecordWriter(path) as writer:
+            writer.write_game(2, 0, state)
+            writer.write_turn(2, 0, state, move)
+        positions = list(analyse.read_positions(path))
+    assert positions == [({"game": 2, "turn": 0, "played": move}, state)]
+
+run_tests()
\ No newline at end of file
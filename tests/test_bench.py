@@ -0,0 +1,43 @@
+import os
+import sys
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+import game
+import bench
+
+
+def run_tests():
+    test_benchmark_positions()
+    test_sharp_quills_rows()
+    test_compare_results()
+    test_parse_worker_counts()
+    print("All tests passed!")
+
+def test_benchmark_positions():
+    positions = bench.benchmark_positions(4, seed=1)
+    assert positions == bench.benchmark_positions(4, seed=1)
+    assert len(positions) == 4
+    for state in positions:
+        assert not game.is_game_over(state["board_state"])
+
+def test_sharp_quills_rows():
+    current_player_state, other_player_state = bench.sharp_quills_rows()
+    assert game.get_card_id(current_player_state, 2) == bench.PORCUPINE
+    assert game.get_card_health(current_player_state, 2) == game.MAX_CARD_HEALTH
+    result_current_player_state, result_other_player_state, _ = game.sharp_quills(current_player_state, other_player_state, 0b0001000100100010001010, 2, 1)
+    assert game.get_card_id(result_current_player_state, 2) == 0 or game.get_card_id(result_other_player_state, 2) == 0
+
+def test_compare_results():
+    baseline = {"results": {"rollouts": bench.result(100, "rollouts/s"), "move_latency": bench.result(50, "ms", higher_is_better=False), "old": bench.result(1, "calls/s")}}
+    current = {"results": {"rollouts": bench.result(85, "rollouts/s"), "move_latency": bench.result(52, "ms", higher_is_better=False), "new": bench.result(1, "calls/s")}}
+    rows, regressions = bench.compare_results(current, baseline, 0.10)
+    assert [row[0] for row in rows] == ["rollouts", "move_latency"]
+    assert regressions == ["rollouts"]
+    assert abs(rows[1][3] + 0.04) < 1e-9
+
+def test_parse_worker_counts():
+    assert bench.parse_worker_counts("1,2,4") == [1, 2, 4]
+    assert bench.parse_worker_counts("1,N")[-1] == os.cpu_count()
+
+run_tests()
\ No newline at end of file
@@ -14,9 +14,11 @@ def run_tests():
     test_get_card_count()
     test_get_current_player()
     test_get_health()
+    test_get_winner()
     test_get_drawn_cards()
     test_get_drawn_squirrels()
     test_get_occupancy_4bit()
+    test_get_hand_card_ids()
     test_set_card_sigil_info()
     test_set_card_health()
     test_set_card_count()
@@ -41,6 +43,11 @@ def run_tests():
     test_bifurcated_strike()
     test_sharp_quills()
     test_apply_turn()
+    test_compile_card_tables()
+    test_mirror_player_state()
+    test_canonical_next_states()
+    test_zobrist_update_state()
+    test_zobrist_check()
     print("All tests passed!")
 
 def test_get_card():
@@ -98,6 +105,11 @@ def test_get_health():
     result = game.get_health(board_state)
     assert result == 10
 
+def test_get_winner():
+    assert game.get_winner(0b0000000000000000101010) is None
+    assert game.get_winner(0b0000000000000000110100) == 0  # Player 1 to move at 20 health.
+    assert game.get_winner(0b0000000000000000000000) == 1  # Player 0 to move at 0 health.
+
 def test_get_drawn_cards():
     board_state = 0b00000000000000100101010
     player = 0
@@ -115,6 +127,12 @@ def test_get_occupancy_4bit():
     result = game.get_occupancy_4bit(current_player_state)
     assert result == 0b1000
 
+def test_get_hand_card_ids():
+    current_player_hand = (1 << (1 * game.HAND_CARD_COUNT_SHIFT)) | (8 << (12 * game.HAND_CARD_COUNT_SHIFT)) | (2 << (5 * game.HAND_CARD_COUNT_SHIFT))
+    result = game.get_hand_card_ids(current_player_hand)
+    assert result == [1, 5, 12]
+    assert game.get_hand_card_ids(0) == []
+
 def test_set_card_sigil_info():
     current_player_state = 0b00110010000000000000000000000000
     expected_player_state = 0b00110011000000000000000000000000
@@ -166,6 +184,9 @@ def test_count_current_player_cards():
     current_player_state = 0b00110010000000000000000000000000
     result = game.count_current_player_cards(current_player_state)
     assert result == 1
+    current_player_state = 0b00110010000100100000000000100100
+    result = game.count_current_player_cards(current_player_state)
+    assert result == 3
 
 def test_remove_card():
     current_player_state = 0b00110010000000000010010000000000
@@ -311,5 +332,80 @@ def test_apply_turn():
     assert result_other_player_state == other_player_state
     assert result_board_state == expected_board_state
 
+def test_compile_card_tables():
+    assert game.CARD_ATTACK[7] == 4
+    assert game.CARD_BLOOD[7] == 3
+    assert game.CARD_FLAGS[10] == game.FLAG_AIRBORNE | game.FLAG_WATERBORNE
+    assert game.CARD_FLAGS[9] == game.FLAG_SPRINTER
+    assert game.CARD_FLAGS[2] == 0
+    assert game.ATTACK_HANDLERS[11] == (game.bifurcated_strike,)
+    assert game.ATTACK_HANDLERS[2] == ()
+    assert game.PLACEMENT_TABLE[1][0b0001] == [(0b0000,0),(0b0000,1),(0b0000,2),(0b0000,3)]
+    assert game.PLACEMENT_TABLE[2][0b0001] == []
+    assert game.OCCUPIED_LANES[0b1010] == (1, 3)
+
+def test_mirror_player_state():
+    current_player_state = 0b00110010000000000010010010011000
+    expected_player_state = 0b10011001001001000000000000110010
+    result = game.mirror_player_state(current_player_state)
+    assert result == expected_player_state
+    assert game.mirror_player_state(result) == current_player_state
+    assert game.canonical_player_state(current_player_state) == (current_player_state, False)
+    assert game.canonical_player_state(expected_player_state) == (current_player_state, True)
+    state = game.initialise_gamestate()
+    state["current_player_state"] = expected_player_state
+    assert game.canonical_state_key(state) == game.canonical_state_key(game.mirror_state(state))
+
+def test_canonical_next_states():
+    current_player_state = 0b00010010000000000000000000000000
+    current_player_hand = (1 << (1 * game.HAND_CARD_COUNT_SHIFT)) | (1 << (9 * game.HAND_CARD_COUNT_SHIFT))
+    result = game.canonical_next_states(current_player_state, current_player_hand, True, 4, 1)
+    expected_result = game.next_states(current_player_state, current_player_hand, True, 4, 1)
+    assert sorted(result) == sorted(expected_result)
+    mirrored_state = game.mirror_player_state(current_player_state)
+    result = game.canonical_next_states(mirrored_state, current_player_hand, True, 4, 1)
+    expected_result = game.next_states(mirrored_state, current_player_hand, True, 4, 1)
+    assert sorted(result) == sorted(expected_result)
+
+
+def test_zobrist_update_state():
+    state = game.initialise_gamestate()
+    h = game.zobrist_hash(state)
+    new_state = dict(state)
+    new_state["current_player_state"], new_state["current_player_hand"] = game.play_card(state["current_player_state"], state["current_player_hand"], 1, 2)
+    new_state["board_state"] = game.set_drawn_squirrels(state["board_state"])
+    h = game.zobrist_update_state(h, state, new_state)
+    assert h == game.zobrist_hash(new_state)
+    state, new_state = new_state, game.switch_player(new_state)
+    h = game.zobrist_update_state(h, state, new_state)
+    assert h == game.zobrist_hash(new_state)
+    assert h ^ game.ZOBRIST_TURN == game.zobrist_hash(state)
+    state, new_state = new_state, dict(new_state)
+    new_state["other_player_state"] = game.move_card(game.set_card_health(state["other_player_state"], 2, 3), 2, 0)
+    new_state["board_state"] = game.set_health(state["board_state"], 7)
+    h = game.zobrist_update_state(h, state, new_state)
+    assert h == game.zobrist_hash(new_state)
+    removed = game.remove_card(new_state["other_player_state"], 0)
+    assert game.zobrist_update_row(h, 0, new_state["other_player_state"], removed) == game.zobrist_hash(dict(new_state, other_player_state=removed))
+
+def test_zobrist_check():
+    game.zobrist_seen.clear()
+    state = game.initialise_gamestate()
+    h = game.zobrist_hash(state)
+    assert game.zobrist_check(h, state) == h
+    try:
+        game.zobrist_check(h ^ 1, state)
+        assert False
+    except ValueError:
+        pass
+    other_state = game.switch_player(state)
+    game.zobrist_seen[game.zobrist_hash(other_state)] = game.state_to_key(state)
+    try:
+        game.zobrist_check(game.zobrist_hash(other_state), other_state)
+        assert False
+    except ValueError:
+        pass
+    game.zobrist_seen.clear()
+
 
 run_tests()
\ No newline at end of file
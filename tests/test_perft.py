@@ -0,0 +1,34 @@
+import os
+import sys
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+import game
+import ai
+import perft
+
+
+def run_tests():
+    test_successors()
+    test_perft()
+    test_cross_check()
+    print("All tests passed!")
+
+def test_successors():
+    state = game.initialise_gamestate()
+    node = ai.MCTSNode(state)
+    assert sorted(map(game.state_to_key, perft.successors(game, state))) == sorted(map(game.state_to_key, node.untried_actions))
+
+def test_perft():
+    state = game.initialise_gamestate()
+    counts, nodes, levels = perft.perft(state, 2, keep_keys=True)
+    assert counts[0] == len(set(map(game.state_to_key, perft.successors(game, state))))
+    assert counts == [len(level) for level in levels]
+    assert nodes >= sum(counts)
+
+def test_cross_check():
+    state = game.initialise_gamestate()
+    assert perft.cross_check(state, 2, (game, game), (None, game.canonical_next_states)) is None
+    assert perft.load_engine("game") is game
+
+run_tests()
\ No newline at end of file
@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+import game
+import ai
+import profiling
+
+
+def run_tests():
+    test_profiled_call()
+    print("All tests passed!")
+
+def test_profiled_call():
+    state = game.initialise_gamestate(ai.random.Random(4))
+    with tempfile.TemporaryDirectory() as directory:
+        path = profiling.turn_profile_path(directory, "turn")
+        worker_paths = profiling.worker_profile_paths(path, 2)
+        results = [profiling.profiled_call(worker_path, ai.run_mcts, state, seed=9, iterations=20) for worker_path in worker_paths]
+        assert results[0] == results[1] == ai.run_mcts(state, seed=9, iterations=20)
+        stats = profiling.merge_profiles(worker_paths, path)
+        assert os.listdir(directory) == ["turn.prof"]
+        calls = {function[2]: stat[1] for function, stat in stats.stats.items()}
+        assert calls["run_mcts"] == 2 and calls["rollout"] == 40
+        assert profiling.merge_profiles(worker_paths, path) is None
+
+run_tests()
\ No newline at end of file
@@ -0,0 +1,64 @@
+import os
+import sys
+import tempfile
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+import game
+import ai
+import record
+
+
+def run_tests():
+    test_record_size()
+    test_write_and_read()
+    test_check_header()
+    test_pack_limits()
+    print("All tests passed!")
+
+def test_record_size():
+    assert record.RECORD_SIZE == 56
+    assert record.struct.calcsize(record.GAME_FORMAT) == record.RECORD_SIZE
+    assert record.TURN_OFFSETS["move"] == ("Q", 36)
+
+def test_write_and_read():
+    state = game.initialise_gamestate()
+    node = ai.MCTSNode(state)
+    move = ai.encode_move(state, node.untried_rows[0], node.untried_actions[0])
+    next_state = ai.apply_move(state, move)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "games.rec")
+        with record.RecordWriter(path) as writer:
+            writer.write_game(7, 1234, state)
+            writer.write_turn(7, 0, state, move, 5, 20, 0.5)
+        with record.RecordWriter(path) as writer:
+            writer.write_records(record.pack_turn(7, 1, next_state, 3, 1, 2))
+        with record.RecordReader(path) as reader:
+            assert len(reader) == 3
+            assert reader.kind(0) == record.RECORD_GAME
+            games = reader.games()
+            assert games[7][0] == 1234
+            turns = list(reader.turns())
+            assert record.turn_to_state(turns[0], games[7][1]) == state
+            assert record.turn_to_state(turns[1], games[7][1]) == next_state
+            assert reader[1] == turns[0]
+            assert list(reader.column("move")) == [move, 3]
+            assert list(reader.column("rollouts")) == [20, 2]
+
+def test_check_header():
+    try:
+        record.check_header(b"NOTARECORDFILE!!")
+        assert False
+    except ValueError:
+        pass
+
+def test_pack_limits():
+    state = game.initialise_gamestate()
+    for game_id, seed, move in ((1 << 32, 0, 0), (0, -1, 0), (0, 0, 1 << 64)):
+        try:
+            record.pack_game(game_id, seed, state) + record.pack_turn(game_id, 0, state, move)
+            assert False
+        except ValueError:
+            pass
+
+run_tests()
\ No newline at end of file
@@ -0,0 +1,74 @@
+import os
+import sys
+import socket
+import threading
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+import game
+import ai
+import remote
+
+
+def run_tests():
+    test_job_round_trip()
+    test_remote_search()
+    test_parse_addresses()
+    print("All tests passed!")
+
+def test_job_round_trip():
+    state = game.initialise_gamestate(ai.random.Random(4))
+    options = {"node_limit": 500, "memory_limit": 1 << 33, "prune": True, "value_weights": [0.5, -0.25], "value_mix": 0.5}
+    assert remote.unpack_job(remote.pack_job(state, 1.5, 200, 7, 1.2, 3, options)) == (state, 1.5, 200, 7, 1.2, 3, options)
+    job = remote.unpack_job(remote.pack_job(state, 1.5))
+    assert job[2] is None and job[6] == {"node_limit": None, "memory_limit": None, "prune": False, "value_weights": None, "value_mix": 0.0}
+    children_visits, submove_visits = ai.run_mcts(state, seed=1, iterations=50)
+    assert remote.unpack_result(remote.pack_result(children_visits, submove_visits)) == (children_visits, submove_visits)
+    try:
+        remote.unpack_result(b"")
+        assert False
+    except ValueError:
+        pass
+
+def start_server():
+    server = remote.WorkerServer(("127.0.0.1", 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def test_remote_search():
+    state = game.initialise_gamestate(ai.random.Random(4))
+    servers = [start_server(), start_server()]
+    silent = socket.socket()
+    silent.bind(("127.0.0.1", 0))
+    silent.listen()
+    closed = socket.socket()
+    closed.bind(("127.0.0.1", 0))
+    dead_address = closed.getsockname()
+    closed.close()
+    workers = [server.server_address for server in servers] + [silent.getsockname(), dead_address]
+    failures = []
+    try:
+        children_visits, submove_visits = remote.remote_search(state, workers, seed=10, iterations=50, searches=2, timeout=1, report=failures.append,
+                                                               options={"node_limit": 20})
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+        silent.close()
+    expected_visits = {}
+    expected_submoves = {}
+    for seed in (10, 11, 12, 13):
+        ai.merge_visits(expected_visits, expected_submoves, *ai.run_mcts(state, seed=seed, iterations=50, node_limit=20))
+    assert (children_visits, submove_visits) == (expected_visits, expected_submoves)
+    assert sum(children_visits.values()) == 200 and len(failures) == 2
+    try:
+        remote.remote_search(state, [dead_address], iterations=10, timeout=1)
+    except ConnectionError:
+        pass
+    else:
+        assert False, "expected a ConnectionError"
+
+def test_parse_addresses():
+    assert remote.parse_addresses("10.0.0.2:6000, box") == [("10.0.0.2", 6000), ("box", remote.DEFAULT_PORT)]
+
+run_tests()
\ No newline at end of file
@@ -0,0 +1,47 @@
+import os
+import sys
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+import selfplay
+
+
+def run_tests():
+    test_play_game()
+    test_reproducible_game()
+    test_summarise()
+    test_parse_args()
+    test_record_seed_range()
+    print("All tests passed!")
+
+def test_play_game():
+    result = selfplay.play_game(3, (0.01, 0.01), max_turns=4)
+    assert result["seed"] == 3
+    assert result["turns"] <= 4
+    assert result["winner"] in (0, 1, selfplay.DRAW)
+
+def test_summarise():
+    results = [{"seed": 0, "winner": 0, "turns": 10, "duration": 1}, {"seed": 1, "winner": selfplay.DRAW, "turns": 20, "duration": 1}]
+    summary = selfplay.summarise(results, 4.0)
+    assert summary["player_0_wins"] == 1 and summary["player_1_wins"] == 0 and summary["draws"] == 1
+    assert summary["average_turns"] == 15
+    assert summary["games_per_second"] == 0.5
+
+def test_parse_args():
+    args = selfplay.parse_args(["-n", "2", "--time", "0.1", "--p1-time", "0.3"])
+    assert args.games == 2 and args.time == 0.1 and args.p0_time is None and args.p1_time == 0.3
+
+def test_reproducible_game():
+    first = selfplay.play_game(5, (0, 0), max_turns=10, iterations=(20, 20))
+    second = selfplay.play_game(5, (0, 0), max_turns=10, iterations=(20, 20))
+    assert (first["winner"], first["turns"]) == (second["winner"], second["turns"])
+
+def test_record_seed_range():
+    for seed in (-1, (1 << 32) - 1):
+        try:
+            selfplay.run_selfplay(2, (0, 0), seed=seed, record_path="unused.rec", report=None)
+            assert False
+        except ValueError:
+            pass
+
+run_tests()
\ No newline at end of file
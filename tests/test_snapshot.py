@@ -0,0 +1,68 @@
+import os
+import sys
+import tempfile
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+import game
+import ai
+import snapshot
+
+
+def run_tests():
+    test_save_and_read()
+    test_load_and_extend()
+    test_bad_file()
+    print("All tests passed!")
+
+def search(iterations=300):
+    state = game.initialise_gamestate(ai.random.Random(4))
+    return ai.MCTS(1.5, rng=ai.random.Random(9)).search(state, 0, iterations)
+
+def test_save_and_read():
+    root = search()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tree.snap")
+        snapshot.save_tree(root, path)
+        assert os.listdir(directory) == ["tree.snap"]
+        with snapshot.TreeSnapshot(path) as tree:
+            assert len(tree) == ai.count_nodes(root)
+            assert tree.root_moves() == {child.move: child.visits for child in root.children}
+            assert tree.state(0) == root.state
+            first = tree.children(0)[0]
+            assert tree.state(first) == root.children[0].state
+            assert [tree[index][0] for index in tree.children(first)] == [first] * len(root.children[0].children)
+
+def test_load_and_extend():
+    root = search()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tree.snap")
+        snapshot.save_tree(root, path)
+        loaded = snapshot.load_tree(path)
+    originals = [root]
+    copies = [loaded]
+    while originals:
+        original = originals.pop()
+        copy = copies.pop()
+        assert (copy.state, copy.key, copy.move, copy.visits, copy.total_reward) == (original.state, original.key, original.move, original.visits, original.total_reward)
+        assert sorted(map(game.state_to_key, copy.untried_actions)) == sorted(map(game.state_to_key, original.untried_actions))
+        assert copy.child_visits == original.child_visits and copy.child_means == original.child_means
+        originals.extend(original.children)
+        copies.extend(copy.children)
+    extended = ai.MCTS(1.5, rng=ai.random.Random(9)).search(None, 0, 100, loaded)
+    assert extended is loaded and loaded.visits == 400
+    assert ai.count_nodes(loaded) > ai.count_nodes(root)
+
+def test_bad_file():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tree.snap")
+        with open(path, "wb") as file:
+            file.write(b"not a snapshot file at all, not a snapshot file at all")
+        try:
+            snapshot.TreeSnapshot(path)
+        except ValueError:
+            pass
+        else:
+            assert False, "expected a ValueError"
+
+run_tests()
\ No newline at end of file
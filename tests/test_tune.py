@@ -0,0 +1,57 @@
+import os
+import sys
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+import game
+import ai
+import tune
+
+
+def run_tests():
+    test_parse_config()
+    test_elo_interval()
+    test_sprt()
+    test_choose_move()
+    test_run_match()
+    print("All tests passed!")
+
+def test_parse_config():
+    config = tune.parse_config("exploration_constant=2.0, MAX_ITERATIONS=60,workers=2,note=fast")
+    assert config == {"exploration_constant": 2.0, "MAX_ITERATIONS": 60, "workers": 2, "note": "fast"}
+    assert tune.parse_config(tune.format_config(config)) == config
+
+def test_elo_interval():
+    elo, low, high = tune.elo_interval([10, 20, 40, 20, 10])
+    assert abs(elo) < 1e-9 and low < 0 < high and abs(low + high) < 1e-9
+    elo, low, high = tune.elo_interval([0, 10, 20, 30, 40])
+    assert abs(elo - tune.score_to_elo(0.75)) < 1e-9 and 0 < low < elo < high
+    # Correlated pairs (all 0 or 2) are twice as variable as independent games with the same score.
+    assert tune.score_statistics([50, 0, 0, 0, 50]) == (0.5, 0.25)
+    assert tune.score_statistics([25, 0, 50, 0, 25]) == (0.5, 0.125)
+    assert abs(tune.score_to_elo(tune.elo_to_score(42.0)) - 42.0) < 1e-9
+
+def test_sprt():
+    lower, upper = tune.sprt_bounds(0.05, 0.05)
+    assert abs(lower + upper) < 1e-9 and upper > 0
+    assert tune.sprt_llr([10, 20, 60, 80, 80], 0, 30) > upper
+    assert tune.sprt_llr([80, 80, 60, 20, 10], 0, 30) < lower
+    assert tune.sprt_llr([0, 0, 0, 0, 5]) == 0.0
+    assert tune.sprt_llr([10, 0, 0, 0, 20], 0, 30) < tune.sprt_llr([0, 10, 0, 20, 0], 0, 30)
+
+def test_choose_move():
+    state = game.initialise_gamestate(ai.random.Random(4))
+    config = {"iterations": 40, "MAX_ITERATIONS": 5, "workers": 2}
+    move = tune.choose_move(state, config, 7)
+    assert ai.MAX_ITERATIONS == 40
+    assert move == tune.choose_move(state, config, 7)
+    children_visits, _ = ai.run_mcts(state, seed=7, iterations=40)
+    assert tune.choose_move(state, {"iterations": 40}, 7) == max(children_visits.items(), key=lambda item: item[1])[0]
+
+def test_run_match():
+    result = tune.run_match({"iterations": 10}, {"iterations": 10}, max_games=4, min_games=4, workers=1, max_turns=6, report=None)
+    assert result["games"] == 4 and result["wins"] + result["draws"] + result["losses"] == 4
+    assert sum(result["pentanomial"]) == 2
+    assert result["decision"] in (tune.H0_ACCEPTED, tune.H1_ACCEPTED, tune.INCONCLUSIVE)
+
+run_tests()
\ No newline at end of file
@@ -0,0 +1,70 @@
+import os
+import sys
+import json
+import tempfile
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, parent_dir)
+import game
+import ai
+import value
+
+
+def run_tests():
+    test_value_features()
+    test_fit()
+    test_random_game_samples()
+    test_weights_file()
+    test_value_search()
+    print("All tests passed!")
+
+def test_value_features():
+    state = game.initialise_gamestate(ai.random.Random(4))
+    features = value.state_features(state)
+    assert len(features) == len(ai.VALUE_FEATURES)
+    assert features[ai.VALUE_FEATURES.index("health_lead")] == 0
+    assert features[ai.VALUE_FEATURES.index("hand")] == features[ai.VALUE_FEATURES.index("other_hand")] == 0.3
+    swapped = game.switch_player(dict(state, board_state=state["board_state"] - 2))
+    assert value.state_features(swapped)[ai.VALUE_FEATURES.index("health_lead")] == -0.2
+
+def test_fit():
+    rng = ai.random.Random(1)
+    weights = [0.1 * i - 0.5 for i in range(len(ai.VALUE_FEATURES))]
+    samples = []
+    for _ in range(200):
+        features = [1.0] + [rng.uniform(-1, 1) for _ in range(len(weights) - 1)]
+        samples.append((features, sum(w * f for w, f in zip(weights, features))))
+    fitted = value.fit(samples, ridge=0)
+    assert all(abs(a - b) < 1e-9 for a, b in zip(fitted, weights))
+
+def test_random_game_samples():
+    samples = value.random_game_samples(3)
+    assert samples and all(target in (-1.0, 0.0, 1.0) for _, target in samples)
+    assert samples == value.random_game_samples(3)
+
+def test_weights_file():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "weights.json")
+        value.save_weights(path, [0.5] * len(ai.VALUE_FEATURES), 10, "test")
+        assert ai.load_value_weights(path) == [0.5] * len(ai.VALUE_FEATURES)
+        with open(path, "w") as file:
+            json.dump({"features": ["bias"], "weights": [0.5]}, file)
+        try:
+            ai.load_value_weights(path)
+        except ValueError:
+            pass
+        else:
+            assert False, "expected a ValueError"
+    bundled = os.path.join(parent_dir, "src", "value_weights.json")
+    assert len(ai.load_value_weights(bundled)) == len(ai.VALUE_FEATURES)
+
+def test_value_search():
+    state = game.initialise_gamestate(ai.random.Random(4))
+    weights = [0.0, 1.0] + [0.1] * (len(ai.VALUE_FEATURES) - 2)
+    children_visits, _, metrics = ai.run_mcts(state, seed=9, iterations=100, metrics=True, value_weights=weights, value_mix=1.0)
+    assert sum(children_visits.values()) == 100 and metrics["rollouts"] == 0
+    children_visits, _, metrics = ai.run_mcts(state, seed=9, iterations=100, metrics=True, value_weights=weights, value_mix=0.5)
+    assert metrics["rollouts"] == 100
+    assert ai.run_mcts(state, seed=9, iterations=50, value_weights=weights) == ai.run_mcts(state, seed=9, iterations=50)
+
+run_tests()
\ No newline at end of file